@@ -3,7 +3,6 @@ import pandas as pd
 import numpy as np
 import os
 from vectfit3 import vectfit
-from vectfit3 import opts
 from scipy.constants import pi
 import skrf as rf
 
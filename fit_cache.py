@@ -0,0 +1,265 @@
+# fit_cache.py module.
+
+"""
+Disk cache for the results of vector fitting.
+
+Fitted models are stored by a content hash of the frequencies, samples, weights, options and fitting parameters, so an
+exact repetition of a fit is returned without any computation. When no exact entry exists, a near miss can still be used:
+an entry fitted with the same options, parameters and number of elements, over almost the same frequency band and with
+a similar response (as for a slightly edited export of the same project). Its poles are taken as searching poles, so a
+single relocation iteration is usually enough. The cache is bounded in size on disk by least recently used eviction.
+
+    - FitCache.vectfit(): vectfit_iterate() through the cache
+    - FitCache.lookup() and FitCache.store(): building blocks for other fitting procedures
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import contextlib
+import dataclasses
+import numpy as np
+from vectfit3 import checkOptions, vectfit_iterate, evaluate
+
+try:
+    import fcntl
+except ImportError: # Windows: the index is locked between the threads of the process only
+    fcntl=None
+
+# Number of frequency points of the fingerprints used to compare responses in near misses
+FINGERPRINT_POINTS=32
+
+# Options which only select how the fitting is executed, not its result. They are left out of the keys, so fits run with
+#any backend or number of workers share their entries
+EXECUTION_OPTIONS=("backend","workers")
+
+# Locks of the cache indexes by directory, shared by the threads of the process (Streamlit sessions)
+INDEX_LOCKS={}
+INDEX_LOCKS_GUARD=threading.Lock()
+
+class FitCache:
+    """Cache of vector fitting results in the directory path. Each entry is stored in a .npz file named by its key and
+       described in the index.json file of the directory.
+
+       The read-modify-write of the index is locked between threads, and between processes where fcntl is available, and
+       all files are written to unique temporary files and moved into place, so concurrent sessions can share the cache.
+
+       Arguments.
+
+        - path: Directory of the cache. It is created if it does not exist
+        - max_bytes: Maximum size of the stored entries. Least recently used entries are removed beyond it
+        - band_overlap: Minimum overlap of the frequency bands (logarithmic scale) for a near miss
+        - max_change: Maximum relative difference of the fingerprints of the responses for a near miss
+    """
+    def __init__(self,path,max_bytes=2**28,band_overlap=0.9,max_change=0.1):
+        os.makedirs(path,exist_ok=True)
+        self.path=path
+        self.max_bytes=max_bytes
+        self.band_overlap=band_overlap
+        self.max_change=max_change
+        with INDEX_LOCKS_GUARD:
+            self.lock=INDEX_LOCKS.setdefault(os.path.abspath(path),threading.Lock())
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Context manager to lock the index of the cache for a read-modify-write"""
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.path,"index.lock"),"a") as file:
+                fcntl.flock(file,fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(file,fcntl.LOCK_UN)
+
+    def readIndex(self):
+        """Function to read the index of the cache.
+            *Returns a dictionary key -> description of the entry"""
+        try:
+            with open(os.path.join(self.path,"index.json"),"r") as file:
+                return json.load(file)
+        except (OSError,ValueError):
+            return {}
+
+    def writeIndex(self,index):
+        """Function to write the index of the cache. It is replaced atomically, so readers never see a partial index. Callers
+           modifying the index must hold locked()"""
+        with tempfile.NamedTemporaryFile("w",dir=self.path,suffix=".tmp",delete=False) as file:
+            json.dump(index,file)
+        os.replace(file.name,os.path.join(self.path,"index.json"))
+
+    def lookup(self,F,s,weights,opts,**params):
+        """Function to look for the result of fitting F(s) in the cache.
+
+           Arguments.
+
+            - F, s, weights, opts: Same as vectfit()
+            - params: Parameters of the fitting procedure (order, iterations, tolerances...). numpy arrays, as initial
+                poles, are part of the key but not of the comparison for near misses
+
+           Results. Linked as a tuple
+
+            - key: Content hash of the fitting. Needed by store()
+            - hit: Tuple (SER,poles,rmserr) of the exact entry, or None
+            - warm: Poles of the nearest entry for a warm start, or None. It is None for exact hits
+        """
+        opts=checkOptions(opts)
+        F=np.atleast_2d(F)
+        key=fitKey(F,s,weights,opts,params)
+        index=self.readIndex()
+        if key in index:
+            try:
+                hit=self.load(key)
+            except (OSError,ValueError,KeyError):
+                hit=None
+            if hit is not None:
+                with self.locked():
+                    index=self.readIndex()
+                    if key in index:
+                        index[key]["used"]=time.time()
+                        self.writeIndex(index)
+                return (key,hit,None)
+        # Near misses: same group and similar band and response
+        group=fitGroup(F,opts,params)
+        (band,fingerprint)=responseFingerprint(F,s)
+        best=None; warm=None
+        for k,entry in index.items():
+            if entry["group"]!=group or bandOverlap(band,entry["band"])<self.band_overlap:
+                continue
+            change=np.max(np.abs(fingerprint-np.array(entry["fingerprint"])))/np.max(np.abs(fingerprint))
+            if change<=self.max_change and (best is None or change<best):
+                best=change; warm=k
+        if warm is not None:
+            try:
+                warm=self.load(warm)[1]
+            except (OSError,ValueError,KeyError):
+                warm=None
+        return (key,None,warm)
+
+    def store(self,key,result,F,s,opts,**params):
+        """Function to store a fitting result with the key given by lookup(). result is the tuple returned by the fitting
+           function, starting by (SER,poles,rmserr). See lookup() for the rest of arguments. Least recently used entries are
+           removed when the cache exceeds max_bytes"""
+        (SER,poles,rmserr)=result[:3]
+        opts=checkOptions(opts)
+        F=np.atleast_2d(F)
+        file=os.path.join(self.path,key+".npz")
+        arrays={"SER_"+name:np.asarray(value) for name,value in SER.items()}
+        # The entry is complete before it appears under its name, so concurrent load() never reads a partial file
+        with tempfile.NamedTemporaryFile(dir=self.path,suffix=".tmp",delete=False) as tmp:
+            np.savez(tmp,poles=poles,rmserr=rmserr,**arrays)
+        os.replace(tmp.name,file)
+        (band,fingerprint)=responseFingerprint(F,s)
+        with self.locked():
+            index=self.readIndex()
+            index[key]=dict(group=fitGroup(F,opts,params),band=band,fingerprint=fingerprint.tolist(),
+                            bytes=os.path.getsize(file),used=time.time())
+            # Eviction of the least recently used entries. The new entry is always kept
+            total=sum(entry["bytes"] for entry in index.values())
+            for k in sorted(index,key=lambda k: index[k]["used"]):
+                if total<=self.max_bytes or k==key:
+                    continue
+                total-=index[k]["bytes"]
+                del index[k]
+                try:
+                    os.remove(os.path.join(self.path,k+".npz"))
+                except OSError:
+                    pass
+            self.writeIndex(index)
+
+    def load(self,key):
+        """Function to load the entry key of the cache.
+            *Returns a tuple (SER,poles,rmserr)"""
+        with np.load(os.path.join(self.path,key+".npz")) as data:
+            SER={name[4:]:(data[name].item() if data[name].ndim==0 else data[name]) for name in data.files if name.startswith("SER_")}
+            return (SER,data["poles"],float(data["rmserr"]))
+
+    def vectfit(self,F,s,poles,weights,opts=None,Niter=10,poletol=1e-6):
+        """Function to apply vectfit_iterate() through the cache. Exact hits are returned with Nitr=0 and the fitted function
+           evaluated from SER. Near misses with the same order are fitted by a single relocation iteration from the cached
+           poles. Arguments and results are the same as vectfit_iterate()"""
+        opts=checkOptions(opts)
+        order=int(poles) if np.ndim(poles)==0 else np.size(poles)
+        params=dict(order=order,Niter=Niter,poletol=poletol)
+        if np.ndim(poles)>0:
+            params["poles"]=np.asarray(poles)
+        (key,hit,warm)=self.lookup(F,s,weights,opts,**params)
+        if hit is not None:
+            (SER,poles,rmserr)=hit
+            return (SER,poles,rmserr,evaluate(SER,s),0)
+        if warm is not None and warm.size==order:
+            result=vectfit_iterate(F,s,warm.copy(),weights,opts,1)
+        else:
+            result=vectfit_iterate(F,s,poles,weights,opts,Niter,poletol)
+        self.store(key,result,F,s,opts,**params)
+        return result
+
+# FitCache subroutine.
+def optionsKey(opts):
+    """Function to serialize the options which change the result of a fitting (all but EXECUTION_OPTIONS)
+        *Returns the bytes of their sorted JSON"""
+    options={name:value for name,value in dataclasses.asdict(opts).items() if name not in EXECUTION_OPTIONS}
+    return json.dumps(options,sort_keys=True).encode()
+
+# FitCache subroutine.
+def fitKey(F,s,weights,opts,params):
+    """Function to compute the content hash of a fitting: frequencies, samples, weights, options and parameters
+        *Returns the hexadecimal SHA-256 digest"""
+    digest=hashlib.sha256()
+    for array in (s,F,weights):
+        array=np.ascontiguousarray(array)
+        digest.update(repr((array.shape,array.dtype.str)).encode())
+        digest.update(array.tobytes())
+    digest.update(optionsKey(opts))
+    for name in sorted(params):
+        value=params[name]
+        if isinstance(value,np.ndarray):
+            value=hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+        digest.update(repr((name,value)).encode())
+    return digest.hexdigest()
+
+# FitCache subroutine.
+def fitGroup(F,opts,params):
+    """Function to compute the hash of the fittings comparable as near misses: options, number of elements and parameters
+       which are not arrays
+        *Returns the hexadecimal SHA-256 digest"""
+    digest=hashlib.sha256()
+    digest.update(optionsKey(opts))
+    digest.update(repr(F.shape[0]).encode())
+    for name in sorted(params):
+        if not isinstance(params[name],np.ndarray):
+            digest.update(repr((name,params[name])).encode())
+    return digest.hexdigest()
+
+# FitCache subroutine.
+def responseFingerprint(F,s):
+    """Function to summarize the response of F(s) for near misses: RMS value of the elements magnitude interpolated at
+       FINGERPRINT_POINTS frequencies spaced logarithmically over the band of s.
+        *Returns a tuple (band,fingerprint) with the band [w0,w1] and the fingerprint [FINGERPRINT_POINTS]"""
+    w=np.abs(s.imag)
+    order=np.argsort(w)
+    w=w[order]
+    rms=np.sqrt(np.mean(np.abs(F[:,order])**2,axis=0))
+    positive=w>0
+    w=w[positive]; rms=rms[positive]
+    if w.size==0:
+        return ([0.0,0.0],np.zeros(FINGERPRINT_POINTS))
+    points=np.logspace(np.log10(w[0]),np.log10(w[-1]),FINGERPRINT_POINTS)
+    return ([float(w[0]),float(w[-1])],np.interp(np.log(points),np.log(w),rms))
+
+# FitCache subroutine.
+def bandOverlap(band1,band2):
+    """Function to compute the overlap of two frequency bands in logarithmic scale, relative to the widest one.
+        *Returns a value from 0 (disjoint) to 1 (same band)"""
+    if min(band1[0],band2[0])<=0:
+        return float(band1==band2)
+    (a1,b1)=np.log(band1); (a2,b2)=np.log(band2)
+    width=max(b1-a1,b2-a2)
+    if width==0:
+        return float(a1==a2)
+    return max(0.0,min(b1,b2)-max(a1,a2))/width
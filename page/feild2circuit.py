@@ -2,11 +2,15 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import os
-from vectfit3 import vectfit
-from vectfit3 import opts
+import io
+from vectfit3 import vectfit_order, vectfit_iterate
+from vectfit3 import VFOptions
+from vectfit3 import isReciprocal, packMatrix, flat2full, buildRES
 from scipy.constants import pi
 import skrf as rf
+from skrf.vectorFitting import VectorFitting
 import wyz_io
+from fit_cache import FitCache
 # 定义一个函数来清理并转换为复数
 def to_complex(val):
     try:
@@ -19,6 +23,61 @@ def to_complex(val):
         return np.nan
 
 
+# Starting poles of scikit-rf's vector_fit(): n_real real poles and n_cmplx complex conjugated pairs spaced linearly
+# over the band, with the damping -0.01*w of its init_pole_spacing='lin'
+def starting_poles(freq, n_real, n_cmplx):
+    w_real = 2 * pi * np.linspace(freq[0], freq[-1], n_real)
+    w_cmplx = 2 * pi * np.linspace(freq[0], freq[-1], n_cmplx)
+    poles = np.empty(n_real + 2 * n_cmplx, dtype=np.complex128)
+    poles[:n_real] = -w_real
+    poles[n_real::2] = (-0.01 + 1j) * w_cmplx
+    poles[n_real + 1::2] = (-0.01 - 1j) * w_cmplx
+    return poles
+
+
+# Loads a vectfit3 model of the S-matrix into a scikit-rf VectorFitting object through its read_npz(), which checks the
+# shapes against the number of ports. scikit-rf keeps one pole of each complex conjugated pair and the residues of
+# response i*nports+j
+def load_vector_fitting(vf, poles, residues, D, E):
+    keep = poles.imag >= 0
+    nports = residues.shape[0]
+    coefficients = io.BytesIO()
+    np.savez(coefficients, poles=poles[keep], residues=np.reshape(residues, (nports * nports, -1))[:, keep],
+             constants=np.ravel(D), proportionals=np.ravel(E))
+    coefficients.seek(0)
+    vf.read_npz(coefficients)
+
+
+# Fits the S-matrix of ntw with vectfit3 and loads the model into a scikit-rf VectorFitting object. Reciprocal
+# structures have symmetric S-matrices: only the lower triangle is fitted and flat2full() unzips the model.
+# Returns (vf, history) with the maximum relative movement of the poles in each relocation from the second one on
+def fit_network(ntw, n_poles_real=1, n_poles_cmplx=2, Niter=10):
+    freq = ntw.f
+    s = 2j * pi * freq
+    symm_mat = isReciprocal(ntw.s, 1e-6)
+    F = packMatrix(ntw.s, symm_mat)
+    opts = VFOptions(asymp=1,  # no constant term, as fit_constant=False
+                     symm_mat=symm_mat, spy2=False)
+    weights = np.ones(freq.size)
+    poles = starting_poles(freq, n_poles_real, n_poles_cmplx)
+    history = []
+    (SER, poles, rmserr, fit, Nitr) = vectfit_iterate(F, s, poles, weights, opts, Niter=Niter,
+                                                      callback=lambda itr, p, moved: history.append(moved))
+    SER = flat2full(SER)
+    vf = VectorFitting(ntw)
+    load_vector_fitting(vf, poles, buildRES(SER["C"], SER["B"]), SER["D"], SER["E"])
+    return vf, history
+
+
+# 解析.txt上传文件的字节内容，得到复数数组
+def parse_txt(content):
+    dataframe = pd.read_csv(io.BytesIO(content), delimiter=',', header=None)
+    # 假设文件中的列已经包含复数形式的字符串
+    # 将字符串转换为复数类型
+    df_complex = dataframe.applymap(to_complex)
+    return df_complex.to_numpy().astype(np.complex128)
+
+
 # 函数用于验证路径的合法性
 def is_valid_path(path):
     # 检查路径是否存在且为有效目录或文件
@@ -45,8 +104,7 @@ if spice_model_path:
         st.error(f"路径 '{spice_model_path}' 不合法！请确保路径存在且是文件夹或文件。")
     else:
         st.success(f"路径 '{spice_model_path}' 合法！")
-Z_f_n_n_list = []
-fre_list = []
+ztm_uploads = []
 if len(uploaded_file_set) != 0:
     for uploaded_file in uploaded_file_set:
         st.write(uploaded_file.name)
@@ -55,54 +113,60 @@ if len(uploaded_file_set) != 0:
         print("扩展名:", file_extension)  # 输出: 扩展名: .txt
         match file_extension:
             case ".txt":
-                dataframe = pd.read_csv(uploaded_file, delimiter=',', header=None)
-                st.write(dataframe)
-                # 假设文件中的列已经包含复数形式的字符串
-                # 将字符串转换为复数类型
-                df_complex = dataframe.applymap(to_complex)
-                arr = df_complex.to_numpy()
-                opts["asymp"] = 3  # Modified to include D and E in fitting
-                opts["phaseplot"] = True  # Modified to include the phase angle graph
+                # Parsed uploads are cached by content, so reruns of the page memory-map them instead of parsing text
+                arr = wyz_io.load_array_cached(uploaded_file.read(), parse_txt)
+                st.write(pd.DataFrame(arr))
+                # Options are created per session, so concurrent fits do not share a mutable configuration
+                opts = VFOptions(asymp=3,  # Modified to include D and E in fitting
+                                 phaseplot=True,  # Modified to include the phase angle graph
+                                 backend="thread",  # 页面中使用线程：Streamlit不在 __main__ 保护下运行，不能创建进程
+                                 workers=os.cpu_count() or 1)
                 N = arr.shape[1]
                 weights = np.ones(N, dtype=np.float64)
-                n = 3
-                # Order of aproximation
-                poles = -2 * pi * np.logspace(0, 4, n, dtype=np.complex128)  # Initial searching poles
                 arr = np.transpose(arr)
                 s = arr[:, 0]
                 f = arr[:, 1]
-                (SER, poles, rmserr, fit) = vectfit(f, s, poles, weights, opts)
+                # Order of aproximation: the smallest order whose fitting error is under 0.1% of the RMS value of f
+                rmstol = 1e-3 * np.sqrt(np.mean(np.abs(f) ** 2))
+                # Repeated uploads are answered from the fit cache; near-identical data only relocates the cached poles
+                cache = FitCache(".vf_cache")
+                (key, hit, warm) = cache.lookup(f, s, weights, opts, orders=(1, 30), reltol=1e-3)
+                result = hit
+                if result is None and warm is not None:
+                    result = vectfit_iterate(f, s, warm.copy(), weights, opts, Niter=1)
+                    if result[2] > rmstol:
+                        result = None
+                if result is None:
+                    result = vectfit_order(f, s, weights, range(1, 31), rmstol, opts)
+                if hit is None:
+                    cache.store(key, result, f, s, opts, orders=(1, 30), reltol=1e-3)
+                (SER, poles, rmserr) = result[:3]
                 aaaa = 666;
                 ####
             case ".ztm":
                 ztm_file = uploaded_file#"E:\公司工作（低空防御）\场路仿真\场路转换算法\Composite_ZCM_3\Composite_ZCM_Configuration.xml"
-                result_data,fre_data = wyz_io.read_matrix_from_txt(ztm_file)
-                Z_f_n_n_list.append(result_data)
-                fre_list.append(fre_data)
+                ztm_uploads.append(ztm_file)
                 ceshi = 1
 
             case _:
                 print("文件格式错误")
 
-    #####这里需要对数据进行排序
-    frequency_ordered_index = np.argsort(fre_list)  ####Z矩阵也需要按照这个进行处理
-    Z_f_n_n_list_ordered=[]
-    frequency_ordered = []
-    for fer_ordered in frequency_ordered_index:
-        Z_f_n_n_list_ordered.append(Z_f_n_n_list[fer_ordered])
-        frequency_ordered.append(fre_list[fer_ordered])
-    Z_fnn_matrix = np.stack(Z_f_n_n_list_ordered, axis=0)
-
-
-    ntw = rf.Network(frequency=np.array(frequency_ordered)*1e6, z=Z_fnn_matrix)
-    #ntw2 = rf.Network.from_z(Z_fnn_matrix,f=np.array(frequency_ordered) * 1e6)
-    print(ntw)
-    vf = rf.VectorFitting(ntw)
+    # 只有上传了ZTM文件时才读取并拟合
+    if ztm_uploads:
+        #####所有ZTM文件并行读取，按频率排序直接写入预分配的Z矩阵；同样的文件再次上传时直接内存映射缓存
+        # 页面中使用线程：Streamlit每次重新运行脚本，不在 __main__ 保护下创建进程
+        Z_fnn_matrix, frequency_ordered = wyz_io.load_ztm_cached(ztm_uploads, backend="thread")
 
 
-    vf.vector_fit(n_poles_real=1, n_poles_cmplx=2,fit_constant=False)
-    passive_flag = vf.is_passive()
-    vf.plot_convergence()
-    vf.passivity_enforce()  # won't do anything if model is already passive
-    vf.write_spice_subcircuit_s('wyz2.sp')
+        freq = np.array(frequency_ordered) * 1e6
+        ntw = rf.Network(frequency=freq, z=Z_fnn_matrix)
+        #ntw2 = rf.Network.from_z(Z_fnn_matrix,f=np.array(frequency_ordered) * 1e6)
+        print(ntw)
+        # One real pole and two complex conjugated pairs, as vector_fit(n_poles_real=1, n_poles_cmplx=2)
+        vf, history = fit_network(ntw, n_poles_real=1, n_poles_cmplx=2)
+        # 拟合收敛曲线（每次极点迁移的最大相对移动量，第一次迁移没有参考）
+        st.line_chart(pd.DataFrame({"max |Δp|/|p|": history[1:]}, index=np.arange(2, len(history) + 1)))
+        passive_flag = vf.is_passive()
+        vf.passivity_enforce()  # won't do anything if model is already passive
+        vf.write_spice_subcircuit_s('wyz2.sp')
 
@@ -0,0 +1,213 @@
+# synthetic_data.py module.
+
+"""
+Generator of synthetic large-scale problems for scaling benchmarks.
+
+Random stable and passive pole-residue models of matrix functions are built with any number of ports, order of
+approximation and frequency samples. They are emitted as the F(s) arrays fitted by vectfit3.py, as ZTM text files with
+their XML configuration (the format read by wyz_io.py) and as Touchstone files, so the fitting, the parsing and the
+netlist generation can be measured far beyond the sizes of the bundled data sets.
+
+    - randomModel(): Random stable and passive PoleResidueModel
+    - modelSamples(): F(s) samples of a model in the layouts of vectfit(), with optional noise
+    - writeZTM(): ZTM text files, one per frequency, and the XML configuration
+    - writeTouchstone(): Touchstone v1 file of the scattering parameters
+
+ * Passivity:
+
+    Every term of the model is positive real: the residue matrices are real symmetric positive semidefinite matrices scaled
+    by positive numbers, with a positive real part of 1/(jw-p) for real poles and of 1/(jw-p)+1/(jw-p*) for complex
+    conjugated pairs. D and E are positive semidefinite too, so Re{H(jw)} is positive semidefinite at all frequencies and
+    the model is a passive and reciprocal impedance or admittance matrix.
+
+Run as a script for scaling curves, e.g. python synthetic_data.py --ports 6 16 32 64 --freqs 200 --order 20
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import xml.etree.ElementTree as ET
+import numpy as np
+from scipy.constants import pi
+from vectfit3 import PoleResidueModel, VFOptions, vectfit_iterate, packMatrix
+
+def randomModel(ports,n,wmin,wmax,real=2,rank=None,Q=(5,50),seed=None):
+    """Function to build a random stable and passive model H(s) = sum_m( R[m]/(s-poles[m]) ) + D + s*E.
+
+       Arguments.
+
+        - ports: Number of ports. H(s) is [ports x ports]
+        - n: Order of aproximation (number of poles)
+        - wmin, wmax: Angular frequency band of the poles in [rad/s]
+        - real: Number of real poles. The remaining n-real poles are complex conjugated pairs, so n-real must be even
+        - rank: Rank of the residue matrices. Full rank by default
+        - Q: Range of quality factors of the complex poles (-imag/real)
+        - seed: Seed or numpy Generator for reproducible models
+
+       Results.
+
+        - model: PoleResidueModel of H(s)
+    """
+    if (n-real)%2!=0 or real<0:
+        raise ValueError("synthetic_data::ERROR::The number of complex poles n-real must be even and positive")
+    rng=np.random.default_rng(seed)
+    rank=ports if rank is None else rank
+    # Poles: real poles and resonances spread logarithmically over the band
+    npairs=(n-real)//2
+    beta=np.exp(rng.uniform(np.log(wmin),np.log(wmax),npairs))
+    alpha=beta/np.exp(rng.uniform(np.log(Q[0]),np.log(Q[1]),npairs))
+    poles=np.empty(n,dtype=np.complex128)
+    poles[0:real]=-np.exp(rng.uniform(np.log(wmin),np.log(wmax),real))
+    poles[real::2]=-alpha+1j*beta
+    poles[real+1::2]=-alpha-1j*beta
+    # Residues: random positive semidefinite matrices scaled by the pole magnitude, so all terms have similar peaks
+    V=rng.standard_normal((real+npairs,ports,rank))/np.sqrt(rank)
+    G=V@np.transpose(V,(0,2,1))
+    R=np.empty((n,ports,ports),dtype=np.complex128)
+    R[0:real]=G[0:real]*np.abs(poles[0:real])[:,None,None]
+    R[real::2]=G[real:]*alpha[:,None,None]
+    R[real+1::2]=R[real::2]
+    W=rng.standard_normal((ports,ports))/np.sqrt(ports)
+    D=0.1*W@W.T
+    E=np.zeros((ports,ports),dtype=np.float64)
+    return PoleResidueModel(poles,R,D,E)
+
+def modelSamples(model,s,noise=0.0,symm_mat=True,RMO_data=True,seed=None):
+    """Function to evaluate a model at the frequency points s and flatten it as the F(s) argument of vectfit().
+
+       Arguments.
+
+        - model: PoleResidueModel of H(s)
+        - s: Complex frequency points of evaluation [N]
+        - noise: Relative standard deviation of a complex gaussian noise added to each sample
+        - symm_mat, RMO_data: Layout of the elements into F(s), with the meaning of vectfit() options
+        - seed: Seed or numpy Generator for reproducible noise
+
+       Results. Linked as a tuple
+
+        - F: Samples of the elements [Nc x N]
+        - H: Samples of the matrix function [N x ports x ports]
+    """
+    H=np.transpose(model.evaluate(s),(2,0,1))
+    if noise>0:
+        rng=np.random.default_rng(seed)
+        H=H*(1+noise*(rng.standard_normal(H.shape)+1j*rng.standard_normal(H.shape))/np.sqrt(2))
+        if symm_mat:
+            H=(H+np.transpose(H,(0,2,1)))/2
+    return (packMatrix(H,symm_mat,RMO_data),H)
+
+def writeZTM(directory,freq,H,unit="MHz",basename="ZTM"):
+    """Function to write impedance matrices as ZTM text files, one for each frequency, and the XML configuration which
+       lists them. Each line of a text file holds: frequency, row, column, real part and imaginary part of an element
+       in RMO, as read by wyz_io.read_matrix_from_txt().
+
+       Arguments.
+
+        - directory: Output directory. It is created if it does not exist
+        - freq: Frequencies in [Hz] [Nf]
+        - H: Matrices [Nf x ports x ports]
+        - unit: Frequency unit of the files: "Hz", "kHz", "MHz" or "GHz"
+        - basename: Prefix of the file names
+
+       Results.
+
+        - xml_file: Path of the XML configuration
+    """
+    scale={"Hz":1.0,"kHz":1e3,"MHz":1e6,"GHz":1e9}[unit]
+    os.makedirs(directory,exist_ok=True)
+    ports=H.shape[1]
+    rows,cols=np.divmod(np.arange(ports*ports),ports)
+    root=ET.Element("Configuration")
+    points=ET.SubElement(root,"FrequencyPoints")
+    for k in range(freq.size):
+        name="%s_%04d.txt"%(basename,k+1)
+        table=np.column_stack((np.full(ports*ports,freq[k]/scale),rows+1,cols+1,H[k].real.ravel(),H[k].imag.ravel()))
+        np.savetxt(os.path.join(directory,name),table,fmt=("%.12g","%d","%d","%.17g","%.17g"),
+                   header="Synthetic impedance matrix: %d ports\nFrequency [%s]  Row  Column  Re(Z)  Im(Z)"%(ports,unit))
+        point=ET.SubElement(points,"FrequencyPoint")
+        ET.SubElement(point,"name").text="Frequency [%s]"%unit
+        ET.SubElement(point,"value").text="%.12g"%(freq[k]/scale)
+        ET.SubElement(point,"Filename").text=name
+    xml_file=os.path.join(directory,basename+"_Configuration.xml")
+    ET.ElementTree(root).write(xml_file,encoding="utf-8",xml_declaration=True)
+    return xml_file
+
+def writeTouchstone(file,freq,Z,z0=50.0):
+    """Function to write impedance matrices as a Touchstone v1 file of scattering parameters, S=(Z+z0*I)^-1 (Z-z0*I),
+       in real-imaginary format. The extension of file should be .sNp for N ports.
+
+       Arguments.
+
+        - file: Output file path
+        - freq: Frequencies in [Hz] [Nf]
+        - Z: Impedance matrices [Nf x ports x ports]
+        - z0: Reference impedance of all ports
+    """
+    Nf,ports,_=Z.shape
+    I=np.eye(ports)
+    S=np.linalg.solve(Z+z0*I,Z-z0*I)
+    if ports==2:
+        S=np.transpose(S,(0,2,1)) # two port data is written as S11 S21 S12 S22
+    with open(file,"w") as out:
+        out.write("! Synthetic %d-port model\n# HZ S RI R %g\n"%(ports,z0))
+        for k in range(Nf):
+            values=np.column_stack((S[k].real.ravel(),S[k].imag.ravel()))
+            if ports<=2:
+                lines=[values.ravel()]
+            else: # each row of the matrix starts a new line, with 4 pairs per line at most
+                lines=[values[r*ports+c0:r*ports+min(c0+4,ports)].ravel() for r in range(ports) for c0 in range(0,ports,4)]
+            for m,line in enumerate(lines):
+                out.write(("%.12g"%freq[k] if m==0 else " ")+" "+" ".join("%.12g"%v for v in line)+"\n")
+
+### ------------------------------------------------------------ Scaling curves -------------------------------------------------------------- ###
+
+def scaling(ports_list,Nf,n,noise,Niter,seed=0):
+    """Function to measure fitting, ZTM parsing and netlist generation times of synthetic problems of growing size.
+    Netlist generation is measured only when scikit-rf is installed"""
+    import wyz_io
+    try:
+        import skrf as rf
+    except ImportError:
+        rf=None
+    f=np.logspace(6,9,Nf)
+    s=2j*pi*f
+    print("%6s %6s %6s %4s %10s %10s %10s %12s"%("ports","Nc","Nf","n","fit [s]","parse [s]","netlist[s]","rmserr"))
+    for ports in ports_list:
+        model=randomModel(ports,n,2*pi*f[0],2*pi*f[-1],seed=seed)
+        (F,H)=modelSamples(model,s,noise,seed=seed)
+        opts=VFOptions(asymp=2,symm_mat=True,spy2=False)
+        t0=time.perf_counter()
+        rmserr=vectfit_iterate(F,s,n,np.ones(Nf),opts,Niter=Niter)[2]
+        tfit=time.perf_counter()-t0
+        with tempfile.TemporaryDirectory() as directory:
+            writeZTM(directory,f,H)
+            files=sorted(name for name in os.listdir(directory) if name.endswith(".txt"))
+            t0=time.perf_counter()
+            for name in files:
+                with open(os.path.join(directory,name),"rb") as file:
+                    wyz_io.read_matrix_from_txt(file)
+            tparse=time.perf_counter()-t0
+            tnet=np.nan
+            if rf is not None:
+                t0=time.perf_counter()
+                vf=rf.VectorFitting(rf.Network(frequency=f,z=H))
+                vf.vector_fit(n_poles_real=2,n_poles_cmplx=(n-2)//2,fit_constant=True)
+                vf.write_spice_subcircuit_s(os.path.join(directory,"model.sp"))
+                tnet=time.perf_counter()-t0
+        print("%6d %6d %6d %4d %10.3f %10.3f %10.3f %12.4e"%(ports,F.shape[0],Nf,n,tfit,tparse,tnet,rmserr))
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description="Scaling curves on synthetic stable and passive models")
+    parser.add_argument("--ports",type=int,nargs="+",default=[6,16,32,64],help="numbers of ports")
+    parser.add_argument("--freqs",type=int,default=200,help="number of frequency samples")
+    parser.add_argument("--order",type=int,default=20,help="order of the models and the fittings")
+    parser.add_argument("--noise",type=float,default=0.0,help="relative noise of the samples")
+    parser.add_argument("--niter",type=int,default=3,help="poles relocation iterations")
+    args=parser.parse_args(argv)
+    scaling(args.ports,args.freqs,args.order,args.noise,args.niter)
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main())
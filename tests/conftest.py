@@ -0,0 +1,6 @@
+# conftest.py: the modules of the repository are imported from its root directory
+
+import os
+import sys
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
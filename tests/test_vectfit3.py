@@ -0,0 +1,74 @@
+# test_vectfit3.py: equivalence of the execution backends and of the out of core fitting, and layout of flat2full()
+
+import numpy as np
+import pytest
+from scipy.constants import pi
+import vectfit3
+import synthetic_data
+from vectfit3 import VFOptions
+
+@pytest.fixture(scope="module")
+def samples():
+    """Symmetric 4-port model with 10 poles sampled at 400 frequency points: (F,s,weights,poles,model)"""
+    f=np.logspace(3,6,400)
+    s=2j*pi*f
+    model=synthetic_data.randomModel(4,10,2*pi*f[0],2*pi*f[-1],seed=7)
+    (F,H)=synthetic_data.modelSamples(model,s,noise=1e-3,symm_mat=True,seed=8)
+    # starting poles: complex conjugated pairs with a small damping, spread over the band
+    beta=2*pi*np.logspace(3,6,5)
+    poles=np.ravel(np.column_stack((-beta/100+1j*beta,-beta/100-1j*beta)))
+    return (F,s,np.ones(s.size),poles,model)
+
+@pytest.mark.parametrize("backend",["thread","process"])
+def test_backend_matches_serial(samples,backend):
+    (F,s,weights,poles,_)=samples
+    opts=VFOptions(symm_mat=True,spy2=False)
+    (SER0,poles0,rmserr0,fit0,_)=vectfit3.vectfit_iterate(F,s,poles,weights,opts,Niter=3)
+    (SER1,poles1,rmserr1,fit1,_)=vectfit3.vectfit_iterate(F,s,poles,weights,opts.replace(backend=backend,workers=2),Niter=3)
+    np.testing.assert_allclose(poles1,poles0,rtol=1e-10)
+    for name in ("C","D","E"):
+        np.testing.assert_allclose(SER1[name],SER0[name],rtol=1e-9,atol=1e-12*np.max(np.abs(SER0[name])))
+    np.testing.assert_allclose(fit1,fit0,rtol=1e-9)
+    assert rmserr1==pytest.approx(rmserr0,rel=1e-8)
+
+@pytest.mark.parametrize("size",[64,150,400])
+def test_stream_matches_in_memory(samples,size):
+    (F,s,weights,poles,_)=samples
+    opts=VFOptions(symm_mat=True,spy2=False)
+    (SER0,poles0,rmserr0,_,Nitr0)=vectfit3.vectfit_iterate(F,s,poles,weights,opts,Niter=3,poletol=0.0)
+    (SER1,poles1,rmserr1,Nitr1)=vectfit3.vectfit_stream(vectfit3.arrayChunks(F,s,weights,size),poles,opts,Niter=3)
+    assert Nitr1==Nitr0
+    np.testing.assert_allclose(poles1,poles0,rtol=5e-9)
+    for name in ("C","D","E"):
+        np.testing.assert_allclose(SER1[name],SER0[name],rtol=5e-9,atol=5e-9*np.max(np.abs(SER0[name])))
+    assert rmserr1==pytest.approx(rmserr0,rel=5e-9)
+
+def evaluateFull(SER,s):
+    """Response [N x Ny x Ny] of the full state space model C*(s*I-A)^-1*B+D+s*E"""
+    I=np.eye(SER["A"].shape[0])
+    return np.array([SER["C"]@np.linalg.solve(sk*I-SER["A"],SER["B"])+SER["D"]+sk*SER["E"] for sk in s])
+
+@pytest.mark.parametrize("symm_mat,RMO_data",[(False,True),(False,False),(True,True)])
+def test_flat2full_layout(symm_mat,RMO_data):
+    rng=np.random.default_rng(3)
+    (Ny,n)=(3,4)
+    poles=-np.arange(1,n+1)*(1+10j)
+    R=rng.standard_normal((n,Ny,Ny))+1j*rng.standard_normal((n,Ny,Ny))
+    D=rng.standard_normal((Ny,Ny))
+    E=rng.standard_normal((Ny,Ny))
+    if symm_mat:
+        (R,D,E)=(R+np.transpose(R,(0,2,1)),D+D.T,E+E.T)
+    # flattened element-wise model in the layout of vectfit(), from the same packing of the samples
+    SER={"A":np.diag(poles),"B":np.ones((n,1)),"C":vectfit3.packMatrix(R,symm_mat,RMO_data),
+         "D":vectfit3.packMatrix(D[None],symm_mat,RMO_data)[:,0],"E":vectfit3.packMatrix(E[None],symm_mat,RMO_data)[:,0],
+         "cmplx_ss":True,"symm_mat":symm_mat,"RMO_data":RMO_data}
+    if not(symm_mat):
+        # element k at row k//Ny and column k%Ny in RMO, at row k%Ny and column k//Ny in CMO
+        k=np.arange(Ny*Ny)
+        (rows,cols)=(k//Ny,k%Ny) if RMO_data else (k%Ny,k//Ny)
+        np.testing.assert_array_equal(SER["D"],D[rows,cols])
+    s=1j*np.array([0.5,3.0,20.0])
+    H=np.einsum("mij,km->kij",R,1/(s[:,None]-poles[None,:]))+D+s[:,None,None]*E
+    full=vectfit3.flat2full(SER)
+    assert full["A"].shape==(Ny*n,Ny*n) and full["B"].shape==(Ny*n,Ny) and full["C"].shape==(Ny,Ny*n)
+    np.testing.assert_allclose(evaluateFull(full,s),H,rtol=1e-12,atol=1e-12)
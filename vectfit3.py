@@ -31,6 +31,10 @@ or pole-residue form.
         fitting)", SINTEF Energy Research, N-7465 Trondheim, Norway, 2008. Aviable 
         online: https://www.sintef.no/en/software/vector-fitting/downloads/#menu
         accesed on: 2/2/2024
+
+    [5] Y. Nakatsukasa, O. Sete, and L. N. Trefethen, "The AAA algorithm for
+        rational approximation", SIAM Journal on Scientific Computing, 
+        vol. 40, no. 3, pp. A1494-A1522, 2018.
  
  * Changes:
     
@@ -45,8 +49,43 @@ or pole-residue form.
       depending on the status of "lower_mat" and "RMO_data" flags.
     - ss2pr() function is replaced by to buildRES(). The new function just compute residues matrixes becouse vectfit returns 
       the poles already.
+    - The partial fractions basis is built for all poles at once by broadcasting in buildBasis(). It is shared by the poles
+      and residues identification stages and the 1/(s-p) terms are reused to evaluate the fitted function.
+    - Configuration is passed to vectfit in each call as an immutable VFOptions object, which replaces opts_errorCheck(). 
+      opts dictionary is still accepted and validated.
+    - vectfit_stream() fits data sets read by frequency chunks (e.g. numpy.memmap files) by accumulating the R factors of the
+      LS-problems with incremental QR factorizations, so memory does not grow with the number of frequency points.
+    - For high orders the zeros of sigma(s) are computed from its secular equation by secularZeros(), which exploits the
+      diagonal plus rank-one structure of ZER. The dense eigenvalue routine is kept as fallback.
+    - vectfit_order() selects the smallest order of approximation that reaches a target error. Candidate orders are fitted
+      in parallel groups, warm-started from the poles of the lower orders.
+    - initialPoles() estimates the searching poles from the samples by a cheap AAA approximation [5]. vectfit() builds them
+      when the order of approximation is given instead of the initial poles.
+    - aaafit() is an alternative fitter based on the AAA algorithm [5] with the same arguments and results as vectfit().
+    - vectfit_bands() fits wideband data by overlapping frequency sub-bands of modest order in parallel, and merges their 
+      poles for a global residues identification.
+    - IncrementalFit keeps the R factors of the relaxed LS-problems of a fitting, so frequency samples appended later are 
+      folded into them by QR row updates and the poles are relocated without factorizing the previous samples again.
+    - VFStats profiles the wall time, calls and peak bytes of each stage of the algorithm with near zero overhead when it
+      is not active.
+    - isReciprocal() and packMatrix() detect symmetric matrix functions and flatten them into F(s), so reciprocal networks are
+      fitted by their lower triangular submatrix and unzipped by flat2full().
 """
 
+# Standard modules for parallel execution:
+import os
+import time
+import contextlib
+import contextvars
+import dataclasses
+import warnings
+import threading
+import importlib.util
+import tracemalloc
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 # Scientific computing modules:
 import numpy as np
 from scipy.linalg import qr, eigvals, lstsq
@@ -56,7 +95,10 @@ from scipy.constants import pi
 
 #opts{}: vectfit modifiers dictionary.
 # Dictionary which contains the default settings fot vectfit. 
-# Any key can be modified to change som options included in vectfit3
+# Any key can be modified to change som options included in vectfit3. 
+# *It is kept for compatibility: when no options are given, vectfit() and the other fitting functions take a validated 
+#  snapshot of it at the time of the call through VFOptions.from_dict(), so changes made to this dictionary still apply. 
+#  For concurrent fits each call should receive its own VFOptions object instead of a shared dictionary modified in place
 opts={
     "symm_mat"   : False, # Indicates when F(s) samples belong to a lower triangular matrix (symmetric problems)
     "RMO_data"   : True,  # Matrix elements are organized in RMO into F(s) (asymmetric problems)
@@ -73,25 +115,184 @@ opts={
     "errplot"    : True,  # Include deviation in magnitude plot
     "phaseplot"  : False, # Exclude plot of phase angle
     "legend"     : True,  # Do include legends in plots
+    "backend"    : "serial", # Execution backend for element-wise work: "serial", "thread" or "process"
+    "workers"    : 0,     # Number of parallel workers. 0 uses all available cores
     }
 
+#QR_BATCH_BYTES: Memory bound for the stacked systems of the batched QR factorizations in the relaxed poles identification.
+# Elements of F(s) are factorized together in chunks whose stacked real arrays do not exceed this size in bytes
+QR_BATCH_BYTES=2**27
+
+#EVAL_BATCH_BYTES: Memory bound for the temporary arrays of evaluate(). Frequency points are processed in chunks whose partial
+# fractions and results do not exceed this size in bytes
+EVAL_BATCH_BYTES=2**26
+# Minimum order of approximation for which the zeros of sigma(s) are computed by the structured solver secularZeros() instead of 
+# the dense eigenvalue routine. The dense routine is kept as fallback
+SECULAR_MIN_ORDER=64
+
 ### ----------------------------------------------------------------- Functions --------------------------------------------------------------- ###
 
+@dataclasses.dataclass(frozen=True)
+class VFOptions:
+    """Immutable and validated configuration of vectfit. Fields have the same names, meaning and default values of 
+       the keys in opts dictionary. Since objects can not be modified after their creation, the same VFOptions can be 
+       shared by fits running at the same time in different threads. 
+       
+       Usage:
+       
+         - VFOptions(asymp=3, spy2=False): New configuration. Not given options take their default values
+         - options.replace(skip_res=True): Copy of options with some values changed
+         - VFOptions.from_dict(opts): Configuration from a dictionary with opts keys
+       
+       *ValueError is raised if any option has an ilegal value
+    """
+    symm_mat  : bool = False    # Indicates when F(s) samples belong to a lower triangular matrix (symmetric problems)
+    RMO_data  : bool = True     # Matrix elements are organized in RMO into F(s) (asymmetric problems)
+    relax     : bool = True     # Use vector fitting with relaxed non triviality
+    stable    : bool = True     # Enforce stable poles
+    asymp     : int = 2         # Include only D in fitting (not E). See [4]
+    skip_pole : bool = False    # Do NOT skip pole identification
+    skip_res  : bool = False    # Do NOT skip residues identification (C,D,E). See [4]
+    cmplx_ss  : bool = True     # Create complex state space model
+    spy1      : bool = False    # No plotting for first stage of vector fitting
+    spy2      : bool = True     # Create magnitude plot for fitting of f(s)
+    logx      : bool = True     # Use logarithmic axis for x
+    logy      : bool = True     # Use logarithmic axis for y
+    errplot   : bool = True     # Include deviation in magnitude plot
+    phaseplot : bool = False    # Exclude plot of phase angle
+    legend    : bool = True     # Do include legends in plots
+    backend   : str = "serial"  # Execution backend for element-wise work: "serial", "thread" or "process"
+    workers   : int = 0         # Number of parallel workers. 0 uses all available cores
+
+    def __post_init__(self):
+        """Checks any configuration error. It replaces the former opts_errorCheck() function"""
+        if self.asymp not in (1,2,3) or isinstance(self.asymp,bool):
+            raise ValueError("vectfit3::ERROR::Ilegal value for [asymp] option. It must be 1, 2 or 3")
+        if self.backend not in ("serial","thread","process"):
+            raise ValueError("vectfit3::ERROR::Ilegal value for [backend] option. It must be \"serial\", \"thread\" or \"process\"")
+        if isinstance(self.workers,bool) or not(isinstance(self.workers,int)) or self.workers<0:
+            raise ValueError("vectfit3::ERROR::Ilegal value for [workers] option. It must be a non negative integer")
+        for field in dataclasses.fields(self):
+            if field.type is bool and not(isinstance(getattr(self,field.name),bool)):
+                raise ValueError("vectfit3::ERROR::Ilegal value for ["+field.name+"] option. It must be boolean: True or False")
+
+    @classmethod
+    def from_dict(cls,options):
+        """Function to build a VFOptions object from a dictionary with opts keys. Missing keys take default values.
+            *ValueError is raised for unknown keys or ilegal values"""
+        names={field.name for field in dataclasses.fields(cls)}
+        unknown=[key for key in options if key not in names]
+        if unknown:
+            raise ValueError("vectfit3::ERROR::Unknown options: ["+", ".join(unknown)+"]")
+        return cls(**options)
+
+    def replace(self,**changes):
+        """Function to get a copy of the options with the values given as keyword arguments changed.
+            *Returns a new VFOptions object"""
+        return dataclasses.replace(self,**changes)
+
+class VFStats:
+    """Per-stage profiling of vector fitting. Wall time, number of calls and peak of temporary array bytes are recorded for 
+       each stage of the algorithm while the object is active:
+       
+         - "basis": Partial fractions basis building, buildBasis()
+         - "qr": QR factorizations of the relaxed LS-problems of the poles identification
+         - "lstsq": Reduced LS-problem of sigma(s), reducedSolve()
+         - "zeros": Zeros of sigma(s) by secularZeros() or the dense eigenvalue routine, sigmaZeros()
+         - "initial": Initial poles estimation by AAA, initialPoles()
+         - "residues": LS-problems of the residues identification
+         - "fit": Evaluation of the fitted function and its error, also evaluate()
+       
+       Usage:
+       
+         - vectfit(F,s,poles,weights,opts,stats=VFStats()): Profiling of a single call, also vectfit_iterate()
+         - with stats: ...: Profiling of any function of the module, e.g. vectfit_stream() or vectfit_order()
+         - stats.stages: Dictionary stage -> {"time": seconds, "calls": count, "peak_bytes": bytes}
+         - str(stats): Table of the stages for logs
+       
+       The active object is kept in a context variable, so each thread profiles its own fits, and work done by the workers of
+       the "thread" and "process" backends is accounted to the stage which distributes it. Peak bytes are measured by 
+       tracemalloc when memory=True, which slows numpy allocations down, and are zero otherwise. When no object is active 
+       each stage costs a context variable lookup.
+    """
+    def __init__(self,memory=False):
+        self.memory=memory
+        self.stages={}
+        self._tokens=[]
+        self._tracing=[]
+        self._stack=[] # [initial traced bytes, running peak] of the open stages when memory=True
+
+    def __enter__(self):
+        self._tokens.append(ACTIVE_STATS.set(self))
+        started=self.memory and not(tracemalloc.is_tracing())
+        if started:
+            tracemalloc.start()
+        self._tracing.append(started)
+        return self
+
+    def __exit__(self,*exc):
+        ACTIVE_STATS.reset(self._tokens.pop())
+        if self._tracing.pop():
+            tracemalloc.stop()
+        return False
+
+    @contextlib.contextmanager
+    def stage(self,name):
+        """Context manager which records the wall time, call and peak of traced bytes of a stage. Stages may be nested,
+           and the peak of an inner stage is also accounted to the outer one"""
+        entry=self.stages.setdefault(name,dict(time=0.0,calls=0,peak_bytes=0))
+        memory=self.memory and tracemalloc.is_tracing()
+        if memory:
+            (current,peak)=tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1][1]=max(self._stack[-1][1],peak)
+            tracemalloc.reset_peak()
+            self._stack.append([current,0])
+        t0=time.perf_counter()
+        try:
+            yield
+        finally:
+            entry["time"]+=time.perf_counter()-t0
+            entry["calls"]+=1
+            if memory:
+                (current,inner)=self._stack.pop()
+                peak=max(tracemalloc.get_traced_memory()[1],inner)
+                entry["peak_bytes"]=max(entry["peak_bytes"],peak-current)
+                if self._stack:
+                    self._stack[-1][1]=max(self._stack[-1][1],peak)
+
+    def __str__(self):
+        lines=["%-10s %10s %8s %14s"%("stage","time [s]","calls","peak bytes")]
+        for name,entry in self.stages.items():
+            lines.append("%-10s %10.4f %8d %14d"%(name,entry["time"],entry["calls"],entry["peak_bytes"]))
+        return "\n".join(lines)
+
+# Profiling object active in the current context. See VFStats
+ACTIVE_STATS=contextvars.ContextVar("vectfit3_stats",default=None)
+NO_STAGE=contextlib.nullcontext()
+
 # vectfit() subroutine.
-def opts_errorCheck(opts):
-    """Fucntion to check any configuration error into opts dictionary.
-        *Returns True if an error is found otherwise false"""
-    if opts["asymp"]!=1 and opts["asymp"]!=2 and opts["asymp"]!=3:
-        print("vectfit3::ERROR::Ilegal value for [asymp] option. It must be 1, 2 or 0")
-        return True
-    opitems=list(opts.items())
-    asymp=("asymp",opts["asymp"])
-    opitems.remove(asymp) #asymp already checked
-    for option in opitems:
-        if not(isinstance(option[1],bool)):
-            print("vectfit3::ERROR::Ilegal value for ["+option[0]+"] option. It must be boolean: True or False")
-            return True
-    return False
+def checkOptions(options):
+    """Function to get the validated configuration of vectfit from a VFOptions object, a dictionary with opts keys or None 
+       for a snapshot of the module dictionary opts, as the old default argument of vectfit(). Error messages are printed as 
+       any other entry error of vectfit.
+        *Returns a VFOptions object, or None if an error is found"""
+    if options is None:
+        options=dict(opts)
+    if isinstance(options,VFOptions):
+        return options
+    try:
+        return VFOptions.from_dict(options)
+    except (ValueError,TypeError) as error:
+        print(error)
+        return None
+
+# vectfit() subroutine.
+def profileStage(name):
+    """Function to get the context manager which profiles the stage name with the active VFStats object.
+        *Returns a shared empty context manager when profiling is not active"""
+    stats=ACTIVE_STATS.get()
+    return NO_STAGE if stats is None else stats.stage(name)
 
 # vectfit() subroutine.
 def dim_errorCheck(F,s,poles,weights):
@@ -126,18 +327,20 @@ def dim_errorCheck(F,s,poles,weights):
     return False
 
 # vectfit() subroutine.
-def identifyPoles(LAMBD):
-    """Function to classify poles storaged into the LAMBD diagonal matrix.
+def identifyPoles(poles):
+    """Function to classify the poles of the aproximated model.
        Argument.
-        - LAMBD: Diagonal matrix containing the poles of the aproximated model
+        - poles: Array containing the poles of the aproximated model [n]. A diagonal matrix LAMBD [n x n] is also accepted
         *Returns cindex array which marks the poles with the following flags:
          - 0 for real poles
          - 1 and 2 for complex conjugated pairs
     """
-    n=LAMBD.shape[0]
+    if poles.ndim>1:
+        poles=np.diag(poles)
+    n=poles.size
     cindex=np.zeros(n, dtype=np.uint16)
     for m in range(n):
-        if np.imag(LAMBD[m,m])!=0:
+        if np.imag(poles[m])!=0:
             if m==0:
                 cindex[m]=1
             else:
@@ -148,6 +351,308 @@ def identifyPoles(LAMBD):
                     cindex[m]=2
     return cindex
 
+# vectfit() subroutine.
+def buildBasis(s,poles,cindex,out=None,pk=None):
+    """Function to build the partial fractions basis of the fitting problem for all poles at once. 
+       Columns are obtained by broadcasting s against poles, so no loop over poles and no diagonal matrix of poles are needed.
+       
+       Arguments.
+       
+        - s: Complex frequency points of evaluation [N]
+        - poles: Array of poles [n]
+        - cindex: Poles classification computed by identifyPoles()
+        - out: (optional) Complex array [N x n] where Dk is written, as the columns of a workspace array
+        - pk: (optional) Complex array [N x n] where Pk is written
+       
+       Results. Linked as a tuple
+       
+        - Dk: Basis of the LS-problem [N x n]. Real poles give 1/(s-p) and complex conjugated pairs give the columns
+              1/(s-p)+1/(s-p*) and j/(s-p)-j/(s-p*). It is out when given
+        - Pk: Partial fractions 1/(s-p) [N x n]. Reused to evaluate a model with the same poles. It is pk when given
+    """
+    with profileStage("basis"):
+        Pk=np.subtract(s[:,None],poles[None,:],out=pk)
+        np.divide(1,Pk,out=Pk)
+        if out is None:
+            Dk=Pk.copy()
+        else:
+            Dk=out
+            Dk[...]=Pk
+        first=np.nonzero(cindex==1)[0] # first member of each complex conjugated pair
+        if first.size>0:
+            Pc=1/(s[:,None]-np.conj(poles[first])[None,:])
+            Dk[:,first]=Pk[:,first]+Pc
+            Dk[:,first+1]=1j*Pk[:,first]-1j*Pc
+        return Dk,Pk
+
+# vectfit() subroutine.
+def relaxedR22(Dk,F,weights,n,offset):
+    """Function to compute the R22 blocks of the relaxed poles identification problem for several elements at once (Fast VF [3]).
+       The real systems [A1 | A2] of all elements are stacked in a 3D array and factorized together by a batched QR routine.
+       
+       Arguments.
+       
+        - Dk: Basis of the LS-problem with the columns for D and E [N x n+offs]
+        - F: Samples of the elements to process [K x N]
+        - weights: Common weights [N] or individual weights of the elements to process [K x N]
+        - n: Order of aproximation
+        - offset: Number of columns in the left block of the system (n+offs)
+       
+       Results.
+       
+        - R22: Stacked R22 blocks of the elements [K x n+1 x n+1]
+    """
+    # only R is needed, so Q is never formed
+    R=np.linalg.qr(relaxedSystem(Dk,F,weights,n,offset),mode="r")
+    return R[:,offset:offset+n+1,offset:offset+n+1]
+
+# vectfit() subroutine.
+def relaxedSystem(Dk,F,weights,n,offset):
+    """Function to build the stacked real systems [A1 | A2] of the relaxed poles identification for several elements [K x 2N x offset+n+1].
+       Rows [0:N] hold the real part and rows [N:2N] the imaginary part of the complex system. See relaxedR22() for arguments
+    """
+    K,N=F.shape
+    weig=np.atleast_2d(weights)
+    A=np.empty((K,2*N,offset+n+1),dtype=np.float64)
+    # left block: common to all elements when weighting is common too
+    Ac=weig[:,:,None]*Dk[None,:,0:offset]
+    A[:,0:N,0:offset]=Ac.real
+    A[:,N:2*N,0:offset]=Ac.imag
+    # right block
+    Ac=-(weig*F)[:,:,None]*Dk[None,:,0:n+1]
+    A[:,0:N,offset:]=Ac.real
+    A[:,N:2*N,offset:]=Ac.imag
+    return A
+
+# vectfit() subroutine.
+def relaxedChunk(k0,k1,Dk,F,weights,n,offset):
+    """Function to compute the R22 blocks of the elements k0:k1 of F(s) in the relaxed poles identification. 
+       It is applied over chunks of elements by elementMap(). See relaxedR22() for arguments
+    """
+    weig=weights if weights.ndim==1 else weights[k0:k1,:]
+    return relaxedR22(Dk,F[k0:k1,:],weig,n,offset)
+
+# vectfit() subroutine.
+def nonrelaxedChunk(k0,k1,Dk,F,weights,n,offset,Dnew):
+    """Function to compute the reduced poles identification problem of the elements k0:k1 of F(s) when the constant term
+       of sigma is fixed to Dnew (non relaxed version of the algorithm). It is applied over chunks of elements by elementMap().
+       
+       Results. Linked as a tuple
+       
+        - R22: Stacked R22 blocks of the elements [K x n x n]
+        - bb: Stacked right hand sides of the reduced problem Q2'*b [K x n]
+    """
+    N=F.shape[1]
+    weig=np.atleast_2d(weights if weights.ndim==1 else weights[k0:k1,:])
+    A=np.empty((k1-k0,2*N,offset+n),dtype=np.float64)
+    Ac=weig[:,:,None]*Dk[None,:,0:offset] #left block
+    A[:,0:N,0:offset]=Ac.real
+    A[:,N:2*N,0:offset]=Ac.imag
+    Ac=-(weig*F[k0:k1,:])[:,:,None]*Dk[None,:,0:n] #right block
+    A[:,0:N,offset:]=Ac.real
+    A[:,N:2*N,offset:]=Ac.imag
+    bc=Dnew*weig*F[k0:k1,:]
+    b=np.concatenate((bc.real,bc.imag),axis=1)
+    (Q,R)=np.linalg.qr(A) #batched QR transformation
+    return R[:,offset:offset+n,offset:offset+n],np.einsum("kij,ki->kj",Q[:,:,offset:offset+n],b)
+
+# vectfit() subroutine.
+def residueChunk(k0,k1,Dk,s,F,weights,n,asymp):
+    """Function to solve the residues identification LS-problems of the elements k0:k1 of F(s) for individual weighting. 
+       It is applied over chunks of elements by elementMap().
+       
+       Results.
+       
+        - x: Solutions of the LS-problems [K x n+asymp-1]. Residues in real form followed by D and E when they are fitted
+    """
+    N=s.size
+    # Unweighted system matrix shared by all the elements
+    A0=np.zeros((2*N,n+asymp-1),dtype=np.float64)
+    A0[0:N,0:n]=Dk.real
+    A0[N:2*N,0:n]=Dk.imag
+    if asymp>1:
+        A0[0:N,n]=1
+    if asymp==3:
+        A0[N:2*N,n+1]=np.imag(s)
+    x=np.zeros((k1-k0,A0.shape[1]),dtype=np.float64)
+    for k in range(k0,k1):
+        A=np.tile(weights[k,:],2)[:,None]*A0
+        BBc=weights[k,:]*F[k,:] #complex values for BB
+        BB=np.append(BBc.real,BBc.imag)
+        Escale=np.linalg.norm(A,axis=0)
+        A/=Escale
+        # LS solution routine imported from scipy module: 
+        #   - check_finite option is disabled to improve performance. NaN should not appear into the arrays
+        #   - gelsy lapack driver is chosen because is slightly faster than default ("gelsd")
+        # The routine returns a tuple (solution,residues,rank,svalues), however just the solution is taken: 
+        x[k-k0,:]=lstsq(A,BB, check_finite=False, lapack_driver="gelsy")[0]/Escale
+    return x
+
+# Process-wide BLAS threads limit shared by the overlapping calls of blasThreads(), with a reference count
+BLAS_LOCK=threading.Lock()
+BLAS_STATE={"count":0,"limiter":None,"warned":False}
+
+# vectfit() subroutine.
+def blasLimiter(limit):
+    """Function to limit the number of threads used by BLAS/LAPACK libraries in this process with the threadpoolctl module
+       (see requirements.txt). Without it the limit cannot be changed after the libraries are loaded, so the libraries 
+       keep their own number of threads, see blasWarning().
+        *Returns the threadpool_limits object, or None when threadpoolctl is not installed"""
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return None
+    return threadpool_limits(limits=limit, user_api="blas")
+
+# vectfit() subroutine.
+def blasWarning(stacklevel):
+    """Function to warn once that BLAS threads of the workers cannot be limited without threadpoolctl. stacklevel points
+       the warning to the caller of elementMap()"""
+    with BLAS_LOCK:
+        if BLAS_STATE["warned"]:
+            return
+        BLAS_STATE["warned"]=True
+    warnings.warn("vectfit3::WARNING::threadpoolctl is not installed, BLAS threads of the workers are not limited and may "
+                  "oversubscribe the cores",RuntimeWarning,stacklevel=stacklevel)
+
+@contextlib.contextmanager
+def blasThreads(limit):
+    """Context manager to limit the BLAS/LAPACK threads of this process while parallel workers run. The limit is 
+       process-wide, so overlapping calls from several threads (concurrent fits) share it: the first call sets it and the 
+       last one restores the original limits"""
+    with BLAS_LOCK:
+        if BLAS_STATE["count"]==0:
+            BLAS_STATE["limiter"]=blasLimiter(limit)
+        BLAS_STATE["count"]+=1
+        missing=BLAS_STATE["limiter"] is None
+    if missing:
+        blasWarning(5)
+    try:
+        yield
+    finally:
+        with BLAS_LOCK:
+            BLAS_STATE["count"]-=1
+            if BLAS_STATE["count"]==0 and BLAS_STATE["limiter"] is not None:
+                BLAS_STATE["limiter"].restore_original_limits()
+                BLAS_STATE["limiter"]=None
+
+# elementMap() subroutine.
+def blasWorker(limit):
+    """Initializer of the process workers: BLAS threads are limited for the whole life of the worker"""
+    BLAS_STATE["limiter"]=blasLimiter(limit)
+
+# elementMap() subroutine.
+def sharedCall(task):
+    """Function executed by process workers. It attaches the shared memory blocks created by elementMap() and 
+       applies the task function over a chunk of elements"""
+    func,specs,k0,k1,args=task
+    blocks=[shared_memory.SharedMemory(name=name) for name,_,_ in specs]
+    try:
+        arrays=[np.ndarray(shape,dtype=np.dtype(dtype),buffer=block.buf) for block,(_,shape,dtype) in zip(blocks,specs)]
+        result=func(k0,k1,*arrays,*args) # BLAS threads were limited when the worker was started, see blasWorker()
+        del arrays #views of the shared buffers must be released before closing them
+    finally:
+        for block in blocks:
+            block.close()
+    return result
+
+# Pools of the "thread" and "process" backends by (backend,workers). They are kept alive between calls, so the workers of
+#the process backend import numpy and scipy once instead of for every poles relocation and residues identification
+POOLS={}
+POOLS_LOCK=threading.Lock()
+
+# elementMap() subroutine.
+def backendPool(backend,workers):
+    """Function to get the pool of workers of the backend, which is created on first use. Process workers limit their BLAS 
+       threads to 1 in their initializer, blasWorker()
+        *Returns a ThreadPoolExecutor or a ProcessPoolExecutor"""
+    with POOLS_LOCK:
+        pool=POOLS.get((backend,workers))
+        if pool is None:
+            if backend=="thread":
+                pool=ThreadPoolExecutor(workers)
+            else:
+                if importlib.util.find_spec("threadpoolctl") is None:
+                    blasWarning(4)
+                pool=ProcessPoolExecutor(workers,mp_context=multiprocessing.get_context("spawn"),initializer=blasWorker,
+                                         initargs=(1,))
+            POOLS[(backend,workers)]=pool
+        return pool
+
+# elementMap() subroutine.
+def dropPool(backend,workers):
+    """Function to remove a broken pool, so the next call of backendPool() creates a new one"""
+    with POOLS_LOCK:
+        pool=POOLS.pop((backend,workers),None)
+    if pool is not None:
+        pool.shutdown(wait=False,cancel_futures=True)
+
+# vectfit() subroutine.
+def elementWorkers(opts):
+    """Function to get the number of parallel workers set by the backend options.
+        *Returns 1 for the serial backend"""
+    if opts.backend=="serial":
+        return 1
+    return opts.workers or os.cpu_count() or 1
+
+# vectfit() subroutine.
+def elementChunks(Nc,rowBytes,workers):
+    """Function to split Nc elements in chunks of contiguous elements (k0,k1). Chunks are bounded by QR_BATCH_BYTES for 
+       rowBytes bytes of temporary arrays per element, and at least one chunk per worker is created"""
+    chunk=max(1,QR_BATCH_BYTES//rowBytes)
+    if workers>1:
+        chunk=max(1,min(chunk,-(-Nc//workers)))
+    return [(k0,min(k0+chunk,Nc)) for k0 in range(0,Nc,chunk)]
+
+# vectfit() subroutine.
+def elementMap(func,chunks,arrays,args,opts):
+    """Function to apply func over chunks of elements with the execution backend selected in opts.
+       
+       Arguments.
+       
+         - func: Function called as func(k0,k1,*arrays,*args) for each chunk. Must be defined at module level
+         - chunks: List of tuples (k0,k1) with the elements of each chunk
+         - arrays: Tuple of numpy arrays needed by func. The process backend shares them through shared memory blocks
+         - args: Tuple of additional arguments of func
+         - opts: VFOptions with the configuration of vectfit. "backend" and "workers" options are used:
+             "serial":  chunks are processed sequentially in this thread
+             "thread":  chunks are processed by a pool of threads with BLAS threads limited to 1 by threadpoolctl
+             "process": chunks are processed by a pool of processes with BLAS threads limited to 1. As any application of 
+                        multiprocessing, the calling script must be protected by if __name__=="__main__"
+           Pools are created on first use and reused by the following calls, see backendPool()
+       
+       Results.
+       
+         - List with the results of func for each chunk, in the same order of chunks
+    """
+    workers=min(elementWorkers(opts),len(chunks))
+    if workers<=1:
+        return [func(k0,k1,*arrays,*args) for k0,k1 in chunks]
+    if opts.backend=="thread":
+        # numpy and scipy release the GIL inside BLAS/LAPACK routines, so threads run in parallel
+        pool=backendPool("thread",workers)
+        with blasThreads(1):
+            return list(pool.map(lambda chunk: func(chunk[0],chunk[1],*arrays,*args),chunks))
+    # Process backend: input arrays are copied once into shared memory instead of being pickled for every chunk
+    blocks=[]
+    try:
+        specs=[]
+        for array in arrays:
+            block=shared_memory.SharedMemory(create=True,size=max(array.nbytes,1))
+            blocks.append(block)
+            np.ndarray(array.shape,dtype=array.dtype,buffer=block.buf)[...]=array
+            specs.append((block.name,array.shape,array.dtype.str))
+        tasks=[(func,specs,k0,k1,args) for k0,k1 in chunks]
+        pool=backendPool("process",workers)
+        return list(pool.map(sharedCall,tasks))
+    except BrokenProcessPool:
+        dropPool("process",workers)
+        raise
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
 # vectfit() subroutine.
 def sortPoles(poles):
     """Function to sort the poles obtained in the poles identification process.
@@ -186,7 +691,7 @@ def vectfitPlot(F,fit,s,opts,initialState=False):
          - F: F(s) frequency samples of the original function
          - fit: fit(s) fited function that aproximates F(s)
          - s: Complex frequency points of evaluation for F and fit
-         - opts: Dictionary with the modifiers to change the default configuration of Vector Fitting
+         - opts: VFOptions with the configuration of Vector Fitting
        
        Results.
         
@@ -204,12 +709,12 @@ def vectfitPlot(F,fit,s,opts,initialState=False):
     
     freq=np.real(s/(2*pi*1j))
     # LogLog plots: Graphs with logarithmic x and y axis
-    if opts["errplot"]:
+    if opts.errplot:
         fig1,ax1=plt.subplots(2,1)
         l1=ax1[0].plot(freq,np.abs(F.T),color='c',linewidth=1.2)
         l2=ax1[0].plot(freq,np.abs(fit.T),color='k',linewidth=1.3,linestyle="dashed")
         ax1[0].set(xlabel="Frequency (Hz)", ylabel="Magnitude",title="Vector Fitting results")
-        if opts["legend"]:
+        if opts.legend:
             l2[0].set(label="Fitted function")
             l1[0].set(label="F(s) samples")
             ax1[0].legend()
@@ -232,12 +737,12 @@ def vectfitPlot(F,fit,s,opts,initialState=False):
         l1=ax1.plot(freq,np.abs(F.T),color='c',linewidth=1.2,label="F(s) samples")
         l2=ax1.plot(freq,np.abs(fit.T),color='k',linewidth=1.3,linestyle="dashed")
         ax1.set(xlabel="Frequency (Hz)", ylabel="Magnitude",title=tlabel)
-        if opts["legend"]:
+        if opts.legend:
             l2[0].set(label=flabel)
             l1[0].set(label="F(s) samples")
             ax1.legend()
         ax1.grid(True)
-    if opts["phaseplot"]:
+    if opts.phaseplot:
         #fisrt function angles are computed in degrees, and then are unwrapped 
         F_angle=np.unwrap(np.angle(F,deg=True),period=360)
         fit_angle=np.unwrap(np.angle(fit,deg=True),period=360)
@@ -245,14 +750,14 @@ def vectfitPlot(F,fit,s,opts,initialState=False):
         l3=ax2.plot(freq,F_angle.T,color='c',linewidth=1.2)
         l4=ax2.plot(freq,fit_angle.T,color='k',linewidth=1.3,linestyle="dashed")
         ax2.set(xlabel="Frequency (Hz)", ylabel="Phase angle (deg)",title="Vector Fitting results")
-        if opts["legend"]:
+        if opts.legend:
             l3[0].set(label="F(s) samples")
             l4[0].set(label="Fitted function")
             ax2.legend()
         ax2.grid(True)
-    if opts["logx"] and opts["logy"]:
+    if opts.logx and opts.logy:
         #full logarithmic graphs. Logarithmic x and y axis
-        if opts["errplot"]:
+        if opts.errplot:
             # Magnitude plot:
             ax1[0].set_xscale("log")
             ax1[0].set_yscale("log")
@@ -262,21 +767,21 @@ def vectfitPlot(F,fit,s,opts,initialState=False):
             # Magnitude plot:
             ax1.set_xscale("log")
             ax1.set_yscale("log") 
-        if opts["phaseplot"]:
+        if opts.phaseplot:
             # Phase plot:
             ax2.set_xscale("log")
-    elif opts["logx"]:
+    elif opts.logx:
         #semilogarithmic graphs. Logarithmic x and linear y axis
-        if opts["errplot"]:
+        if opts.errplot:
             ax1[0].set_xscale("log")
             ax1[1].set_xscale("log")
         else:
             ax1.set_xscale("log")
-        if opts["phaseplot"]:
+        if opts.phaseplot:
             ax2.set_xscale("log")
-    elif opts["logy"]:
+    elif opts.logy:
         #semilogarithmic graphs. Linear x and logarithmic y axis
-        if opts["errplot"]:
+        if opts.errplot:
             ax1[0].set_yscale("log")
         else:
             ax1.set_yscale("log")
@@ -349,6 +854,8 @@ def flat2full(SER):
             - E shape [Nc x 1] => [Ny x Ny]
 
         Important!: lower trinagular compression of symmetric matrix data need to be applied prior vector fitting application
+        
+        *Flattened element k is placed at row k//Ny and column k%Ny for RMO data, and at row k%Ny and column k//Ny for CMO data
     """
     A=SER["A"]
     B=SER["B"]
@@ -358,66 +865,28 @@ def flat2full(SER):
     # Unzip process parameters:
     n=B.shape[0]    # Order of approximation
     Nc=C.shape[0]   # Number of different elements in the flattened problem
+    # Shape of the full unzipped matrix function and position of each flattened element into it
+    (Ny,rows,cols)=elementIndex(Nc,SER["symm_mat"],SER["RMO_data"])
     if SER["symm_mat"]:
-        # Case for a symmetric problem, data must be decompressed and organized in symmetric format
-        sum=0           # Sum counter
-        Ny=0            # Shape of the full unzipped matrix function
-        while sum<Nc:
-            Ny+=1
-            sum+=Ny
-        # Full versions of the space-state system
-        Af=np.zeros((Ny*n,Ny*n), dtype=A.dtype)
-        Bf=np.zeros((Ny*n,Ny), dtype=np.float64)
-        Cf=np.zeros((Ny,Ny*n), dtype=C.dtype)
-        Df=np.zeros((Ny,Ny), dtype=np.float64)
-        Ef=np.zeros((Ny,Ny), dtype=np.float64)
-        #filling data in full matrixes
-        coli=0; k=0 #column and element indicators
-        for ind in range(0,Ny*n,n):
-            endf=ind+n
-            Af[ind:endf,ind:endf]=A
-            Bf[ind:endf,coli]=np.ravel(B)
-            for rowi in range(coli,Ny):
-                Cf[rowi,(coli)*n:(coli+1)*n]=C[k,:]
-                Cf[coli,(rowi)*n:(rowi+1)*n]=C[k,:]
-                k+=1
-            coli+=1
-        # Generating an upper trinagular matrix from arrays D and E
-        Df[np.triu_indices(Ny)]=D       
-        Ef[np.triu_indices(Ny)]=E
-        # Converting Df and Ef matrixes to full and symmetric matrixes of shape [Ny x Ny] 
-        Df+=Df.T-np.diag(np.diag(Df))   
-        Ef+=Ef.T-np.diag(np.diag(Ef))
+        # Case for a symmetric problem, each element fills its position in both triangular submatrixes
+        rows,cols=np.append(rows,cols),np.append(cols,rows)
+        C=np.vstack((C,C))
+        D=np.append(D,D)
+        E=np.append(E,E)
         SER["symm_mat"]=False
-    else:
-        # Case for an asymmetric problem. Flattened data must be in CMO or in RMO
-        Ny=int(np.sqrt(Nc))
-        # Full versions of the space-state system
-        Af=np.zeros((Ny*n,Ny*n), dtype=A.dtype)
-        Bf=np.zeros((Ny*n,Ny), dtype=np.float64)
-        Cf=np.zeros((Ny,Ny*n), dtype=C.dtype)
-        Df=np.zeros((Ny,Ny), dtype=np.float64)
-        Ef=np.zeros((Ny,Ny), dtype=np.float64)
-        # Saving new full matrixes in SER:
-        #filling data in full matrixes
-        coli=0; k=0 #column and element indicators
-        for ind in range(0,Ny*n,n):
-            endf=ind+n
-            Af[ind:endf,ind:endf]=A
-            Bf[ind:endf,coli]=np.ravel(B)
-            if SER["RMO_data"]: #data is organized in Row Major Order (default)
-                Df[:,coli]=D[coli*Ny:(coli+1)*Ny]
-                Ef[:,coli]=E[coli*Ny:(coli+1)*Ny]
-                for rowi in range(0,Ny):
-                    Cf[rowi,(coli)*n:(coli+1)*n]=C[k,:]
-                    k+=1
-            else: #data is organized in Column Major Order (transpose filling to iterate colums faster)
-                Df[coli,:]=D[coli*Ny:(coli+1)*Ny]
-                Ef[coli,:]=E[coli*Ny:(coli+1)*Ny]
-                for rowi in range(0,Ny):
-                    Cf[coli,(rowi)*n:(rowi+1)*n]=C[k,:]
-                    k+=1
-            coli+=1
+    # Full versions of the space-state system
+    Af=np.zeros((Ny*n,Ny*n), dtype=A.dtype)
+    Bf=np.zeros((Ny*n,Ny), dtype=np.float64)
+    Cf=np.zeros((Ny,Ny*n), dtype=C.dtype)
+    Df=np.zeros((Ny,Ny), dtype=np.float64)
+    Ef=np.zeros((Ny,Ny), dtype=np.float64)
+    # Filling data in full matrixes by scattering all blocks and elements at once through 4D and 3D views
+    diag=np.arange(Ny)
+    np.reshape(Af,(Ny,n,Ny,n))[diag,:,diag,:]=A       # A repeated along the block diagonal
+    np.reshape(Bf,(Ny,n,Ny))[diag,:,diag]=np.ravel(B) # B repeated along the block diagonal
+    np.reshape(Cf,(Ny,Ny,n))[rows,cols,:]=C           # residues of element (row,col) in the block of column col
+    Df[rows,cols]=D
+    Ef[rows,cols]=E
     SER["A"]=Af
     SER["B"]=Bf
     SER["C"]=Cf
@@ -442,34 +911,998 @@ def buildRES(SERC, SERB):
     """
     Ny=SERC.shape[0]        #dimentions of the matrix function [Ny x Ny]
     n=int(SERC.shape[1]/Ny) #order of aproximation
-    C=SERC                  #residues of Fit(s)
+    C=np.reshape(SERC,(Ny,Ny,n)) #residues of Fit(s) as a 3D view: C[row,col,:] are the residues of element (row,col)
     B=SERB                  #input values (for real SER it distinguish real from complex poles)
+    Res=C.astype(np.complex128) #Residues matrixes
     # Data needs to be in complex format. Transformatio is carried out if needed:
     if C.dtype==np.float64: 
-        # Real to complex transformation
-        Cc=np.zeros(C.shape, dtype=np.complex128)   #complex version of C
-        ones=np.ones(n, dtype=np.float64)           #array of ones to compare to values in B
-        #realIndex=np.arange(n)[ones==B[0:n,0]]      #real residues' positions
-        cmplxIndex=np.arange(n)[ones*2==B[0:n,0]]   #complex residues' positions
-        resk=np.zeros(n, dtype=np.complex128)       #transformed residues of each element
-        for row in range(Ny):
-            for col in range(Ny):
-                resk[:]=C[row,col*n:(col+1)*n] #real residues are taken by default
-                #then conjugated pairs need to be computed from consecutive real and imaginary parts in real C
-                cmplxres=np.take_along_axis(resk, cmplxIndex, axis=None)+1j*np.take_along_axis(resk, cmplxIndex+1, axis=None)
-                np.put(resk, cmplxIndex, cmplxres)
-                np.put(resk, cmplxIndex+1, np.conj(cmplxres))
-                Cc[row,col*n:(col+1)*n]=resk
-        C=Cc  
-    Res=np.zeros((Ny,Ny,n), dtype=np.complex128) #Residues matrixes
-    for row in range(Ny):
-        for col in range(Ny):
-            Res[row,col,:]=C[row,col*n:(col+1)*n]
+        # Real to complex transformation for all elements at once:
+        cmplxIndex=np.nonzero(B[0:n,0]==2)[0] #complex residues' positions
+        #conjugated pairs are computed from consecutive real and imaginary parts in real C
+        Res[:,:,cmplxIndex]=C[:,:,cmplxIndex]+1j*C[:,:,cmplxIndex+1]
+        Res[:,:,cmplxIndex+1]=np.conj(Res[:,:,cmplxIndex])
     return Res
 
+# vectfit() subroutine.
+def workArray(work,key,shape,dtype):
+    """Function to get a temporary array from the workspace dictionary work. A new array is allocated and storaged
+       when key is missing or its shape or type changed, otherwise the same array is reused.
+        *Returns a new zeros array if work is None"""
+    if work is None:
+        return np.zeros(shape,dtype=dtype)
+    array=work.get(key)
+    if array is None or array.shape!=shape or array.dtype!=dtype:
+        array=np.zeros(shape,dtype=dtype)
+        work[key]=array
+    return array
+
+# vectfit() subroutine.
+def checkInitialPoles(s,poles):
+    """Function to move initial poles away from the origin when s contains the zero frequency. 
+       poles array is modified in place"""
+    if s[0]==0:
+        if poles[0]==0 and poles[1]!=0:
+            poles[0]=-1
+        elif poles[0]!=0 and poles[1]==0:
+            poles[1]=-1
+        elif poles[0]==0 and poles[1]==0:
+            poles[0]=-1+10j
+            poles[1]=-1-10j
+
+# vectfit() subroutine.
+def reducedSolve(AA,bb):
+    """Function to solve the reduced LS-problem AA*x=bb of the poles identification. Columns of AA are normalized in place
+       *Returns the solution x
+    """
+    with profileStage("lstsq"):
+        Escale=1/np.linalg.norm(AA,axis=0)
+        AA*=Escale
+        # LS solution routine imported from scipy module: 
+        #   - check_finite option is disabled to improve performance. NaN should not appear into the arrays
+        #   - gelsy lapack driver is chosen because is slightly faster than default ("gelsd")
+        # The routine returns a tuple (solution,residues,rank,svalues), however just the solution is taken: 
+        x=lstsq(AA,bb, check_finite=False, lapack_driver="gelsy")[0] # solution <- result[0]
+        return x*Escale
+
+# vectfit() subroutine.
+def fixedSigmaD(x):
+    """Function to choose the fixed D of sigma(s) for the non relaxed poles identification.
+       x is the relaxed solution, or None when the relaxed version is disabled.
+       *Returns None when the relaxed solution is valid. Otherwise the problem needs to be solved again with the returned D
+    """
+    TOLlow=1e-18; TOLhigh=1e18; # vectfit3 tolerances
+    if x is None or x[-1]==0:
+        return 1
+    if np.abs(x[-1])<TOLlow:
+        return np.sign(x[-1])*TOLlow
+    if np.abs(x[-1])>TOLhigh:
+        return np.sign(x[-1])*TOLhigh
+    return None
+
+# vectfit() subroutine.
+def sigmaZeros(x,poles,cindex,stable):
+    """Function to compute the zeros of sigma(s) from the solution x of the poles identification [C | D].
+       Unstable zeros are flipped into the left half plane when stable is True
+       *Returns the new poles sorted by sortPoles()
+    """
+    with profileStage("zeros"):
+        first=np.nonzero(cindex==1)[0] # first member of each complex conjugated pair
+        D=x[-1]
+        zeros=None
+        if poles.size>=SECULAR_MIN_ORDER:
+            # Complex residues of sigma from the real and imaginary parts in the LS-solution
+            C=x[0:-1].astype(np.complex128)
+            C[first]=x[first]+1j*x[first+1]
+            C[first+1]=np.conj(C[first])
+            zeros=secularZeros(C,D,poles)
+        if zeros is not None:
+            poles=zeros
+        else:
+            poles=denseZeros(x,poles,first)
+        # Unstabla values identification
+        unstable=poles.real>0 #generates a logical array
+        if stable:
+            if np.any(unstable):
+                #the product of roetter and unstable extracts the unstable poles
+                extracted=poles*unstable
+                poles=poles-2*extracted.real
+        return sortPoles(poles)
+
+# sigmaZeros() subroutine.
+def denseZeros(x,poles,first):
+    """Function to compute the zeros of sigma(s) as the eigenvalues of the real matrix ZER = LAMBD - B*C/D by a dense routine"""
+    D=x[-1]
+    B=np.ones(poles.size, np.float64) # Vector of ones
+    # Complex poles clasification: diagonal blocks of the form: 
+    # [ real, -imag ]
+    # [ imag,  real ]
+    # and B vector modification for complex poles. Real and imaginary parts of C are the LS-solution itself
+    B[first]=2
+    B[first+1]=0
+    ZER=np.diag(poles.real)-np.outer(B,x[0:-1].real)/D
+    ZER[first,first+1]+=poles[first].imag
+    ZER[first+1,first]-=poles[first].imag
+    # Computation of ZER eigenvalues
+    return eigvals(ZER) #routine imported from scipy module
+
+# sigmaZeros() subroutine.
+def secularZeros(C,D,poles,maxiter=40,tol=1e-13):
+    """Function to compute the zeros of sigma(s) = D + sum(C/(s-poles)) as the roots of its secular equation. They are the
+       eigenvalues of ZER, which is diagonal plus a rank-one update, but the structure is exploited by simultaneous 
+       Aberth-Ehrlich iterations that cost O(n^2) each instead of the O(n^3) of a dense eigenvalue routine.
+       Iterations start from the first order estimates poles-C/D, which are close to the zeros once the poles have converged.
+       
+       Arguments.
+       
+        - C: Complex residues of sigma(s) [n]. Complex conjugated pairs as in poles
+        - D: Constant term of sigma(s), different from zero
+        - poles: Searching poles [n]
+        - maxiter: Maximum number of iterations
+        - tol: Relative tolerance for the corrections of the zeros
+       
+       Results.
+       
+        - zeros: Zeros of sigma(s) [n] with exact real values and conjugated pairs, or None when the iterations do not converge
+    """
+    n=poles.size
+    z=poles-C/D
+    # Starting points are perturbed in a direction that is not symmetric with respect to the real axis: iterations started from
+    #a symmetric set stay symmetric and can not separate into distinct real zeros. Real starting points are moved further, 
+    #since iterations started on the real axis can not reach complex zeros, and points on a pole (C=0) are moved away from it
+    real=z.imag==0
+    z+=np.where(real,0.1,np.sqrt(tol))*(np.abs(z)+1)*np.exp(0.7j)
+    off=~np.eye(n,dtype=bool)
+    active=np.ones(n,dtype=bool) # zeros still being corrected
+    last=np.full(n,np.inf)
+    with np.errstate(divide="ignore",invalid="ignore",over="ignore"):
+        for _ in range(maxiter):
+            za=z[active]
+            Pz=1/(za[:,None]-poles[None,:])
+            f=D+Pz@C
+            # Newton correction of the numerator polynomial of sigma(s): f/(f'+f*sum(1/(z-poles)))
+            newton=f/(f*np.sum(Pz,axis=1)-(Pz*Pz)@C)
+            # Aberth correction: repulsion among the approximations of the zeros
+            Zz=1/(za[:,None]-z[None,:])
+            Zz[~off[active]]=0
+            w=newton/(1-newton*np.sum(Zz,axis=1))
+            if not np.all(np.isfinite(w)):
+                return None
+            z[active]=za-w
+            # a zero is converged when its correction is under tol, or when it stops decreasing near the rounding level
+            w=np.abs(w)/np.abs(z[active])
+            done=(w<=tol)|((w<=np.sqrt(tol))&(w>=last[active]))
+            last[active]=w
+            active[np.nonzero(active)[0][done]]=False
+            if not np.any(active):
+                return conjugateZeros(z)
+    return None
+
+# secularZeros() subroutine.
+def conjugateZeros(z,tol=1e-10):
+    """Function to enforce the symmetry of the zeros of a real problem: zeros with a relative imaginary part under tol are 
+       made real and the rest are matched in exact complex conjugated pairs.
+       *Returns the symmetric zeros, or None when the zeros can not be matched"""
+    real=np.abs(z.imag)<=tol*np.abs(z)
+    upper=z[~real & (z.imag>0)]
+    lower=np.conj(z[~real & (z.imag<0)])
+    if upper.size!=lower.size:
+        return None
+    # each zero in the upper half plane is matched with the nearest conjugated zero from the lower half plane
+    match=np.argmin(np.abs(upper[:,None]-lower[None,:]),axis=1) if upper.size else np.zeros(0,dtype=int)
+    if np.unique(match).size!=match.size or np.any(np.abs(upper-lower[match])>np.sqrt(tol)*np.abs(upper)):
+        return None
+    upper=(upper+lower[match])/2
+    return np.concatenate((z[real].real.astype(np.complex128),upper,np.conj(upper)))
+
+# vectfit() subroutine.
+def poleIdentification(F,s,poles,weights,opts,work=None):
+    """Function to compute a new set of poles for F(s) from the searching poles. First stage of vector fitting.
+       
+       Arguments.
+       
+        - F: F(s) samples [Nc x N]
+        - s: Complex frequency points of evaluation [N]
+        - poles: Searching poles [n]
+        - weights: Common [N] or individual [Nc x N] weights
+        - opts: VFOptions with the configuration of vectfit
+        - work: (optional) Workspace dictionary. Temporary arrays are storaged on it to be reused by the next call
+       
+       Results.
+       
+        - poles: New poles of F(s) computed as the zeros of sigma(s) [n]. Sorted by sortPoles()
+    """
+    Nc,N=F.shape
+    n=poles.size
+    commonWeighting=len(weights.shape)==1
+    offs=opts.asymp-1 # 0 for [D=0; E=0], 1 for [D!=0; E=0] and 2 for [D!=0; E!=0]
+    # Initial complex poles identification: cindex marks 0 for reals, 1 and 2 for complex conjugated pairs 
+    cindex=identifyPoles(poles)
+    # Building System Matrix. Depending on the D and E option selected Dk.shape is (N,n+1) for E=0 or (N,n+2) for E!=0
+    Dk=workArray(work,"Dk",(N,n+max(offs,1)),np.complex128)
+    Pk=buildBasis(s,poles,cindex,out=Dk[:,0:n],pk=workArray(work,"Pk",(N,n),np.complex128))[1]
+    Dk[:,n]=1
+    if offs==2:
+        Dk[:,n+1]=s
+    # Scaling for last row of LS-Problem
+    scale=np.linalg.norm(weights*F)/N
+    # Applying relaxed version of the algorithm
+    if opts.relax:
+        AA=workArray(work,"AA",(Nc*(n+1),n+1),np.float64)
+        bb=workArray(work,"bb",(Nc*(n+1),),np.float64)
+        bb[:]=0
+        offset=n+offs
+        # Batched QR transformation for all elements but the last one. Elements are processed in chunks bounded by QR_BATCH_BYTES
+        #and chunks are distributed among the workers of the execution backend
+        with profileStage("qr"):
+            chunks=elementChunks(Nc-1,16*N*(offset+n+1),elementWorkers(opts))
+            results=elementMap(relaxedChunk,chunks,(Dk,F,weights),(n,offset),opts)
+            for (k0,k1),R22 in zip(chunks,results):
+                AA[k0*(n+1):k1*(n+1),:]=np.reshape(R22,((k1-k0)*(n+1),n+1))
+            # The last element includes the integral criterion for sigma, and the last row of Q is needed
+            k=Nc-1
+            weig=weights if commonWeighting else weights[k,:]
+            Ac=workArray(work,"Ac",(N,offset+n+1),np.complex128)
+            Ac[:,0:offset]=weig[:,None]*Dk[:,0:offset]        #left block
+            Ac[:,offset:]=-(weig*F[k,:])[:,None]*Dk[:,0:n+1] #right block
+            # Partitioned problem in real and imaginary part, a real array is obtained with an extra row:
+            A=workArray(work,"A",(2*N+1,offset+n+1),np.float64)
+            A[0:N,:]=Ac.real
+            A[N:2*N,:]=Ac.imag
+            A[2*N,0:offset]=0
+            A[2*N,offset:]=np.real(scale*np.sum(Dk[:,0:n+1],axis=0))
+            # Obtaining QR transformation of A
+            (Q,R)=qr(A,mode="economic") #routine imported from scipy module
+            AA[k*(n+1):(k+1)*(n+1),:]=R[offset:offset+n+1,offset:offset+n+1]
+            bb[k*(n+1):(k+1)*(n+1)]=Q[-1,offset:]*N*scale
+        x=reducedSolve(AA,bb)
+    # ...end of opts.relax=True segment
+    # Case for non relaxion version of the algorithm.
+    # Also may be needed when D of sigma results extremely small and large. I needs to be solved again.  
+    Dnew=fixedSigmaD(x if opts.relax else None)
+    if Dnew is not None:
+        AA=workArray(work,"AAnr",(Nc*n,n),np.float64)
+        bb=workArray(work,"bbnr",(Nc*n,),np.float64)
+        offset=n+offs
+        # Partitioned problems in real and imaginary part are factorized in chunks of elements (Q is needed for bb)
+        with profileStage("qr"):
+            chunks=elementChunks(Nc,32*N*(offset+n),elementWorkers(opts))
+            results=elementMap(nonrelaxedChunk,chunks,(Dk,F,weights),(n,offset,Dnew),opts)
+            for (k0,k1),(R22,bk) in zip(chunks,results):
+                AA[k0*n:k1*n,:]=np.reshape(R22,((k1-k0)*n,n))
+                bb[k0*n:k1*n]=np.ravel(bk)
+        x=reducedSolve(AA,bb)
+        x=np.append(x,Dnew)
+    # ...end of opts.relax=False or out of tolerance segment
+    first=np.nonzero(cindex==1)[0] # first member of each complex conjugated pair
+    D=x[-1]
+    # Graphs of initial stage of vector fitting process
+    if opts.spy1:
+        print("\nvectfit3::spy1_Enabled::Building and showing graph for initial fitting state...")
+        # First fitting state evaluation: 
+        # As mentioned in [1] pole identification begins with the aproximation of sigma(s). sigma(s) is an unknown function whose  
+        #approximation has the same poles of F(s). Furtheremore it is formulated that (sigma*f)_fit(s) = sigma_fit*f(s), whence can be
+        #demostrated that zeros of sigma are a better set of poles to fit f(s), therefore sigma(s) is called the initial fitting state.
+        # Changing back to make C complex:    
+        C=x[0:-1].astype(np.complex128)
+        #building the conjugated complex pairs from real and imaginary parts
+        C[first]=x[first]+1j*x[first+1]
+        C[first+1]=np.conj(C[first])
+        sigma=D+Pk@C #partial fractions of the searching poles are reused
+        #setting temporal options to plot initial vector fitting state
+        opts_temp=opts.replace(errplot=False,phaseplot=False)
+        #vectfitPlot(F,sigma,s,opts_temp,True)#wyz
+    return sigmaZeros(x,poles,cindex,opts.stable)
+
+# vectfit() subroutine.
+def residueIdentification(F,s,poles,weights,opts):
+    """Function to compute the residues of F(s) for a given set of poles. Second stage of vector fitting.
+       
+       Arguments.
+       
+        - F: F(s) samples [Nc x N]
+        - s: Complex frequency points of evaluation [N]
+        - poles: Poles of F(s) [n]
+        - weights: Common [N] or individual [Nc x N] weights
+        - opts: VFOptions with the configuration of vectfit
+       
+       Results. Linked as a tuple
+       
+        - C: Complex residues [Nc x n]
+        - D: Constant terms [Nc]
+        - E: Proportional terms [Nc]
+        - fit: Evaluation of the fitted function [Nc x N]
+        - rmserr: Root mean squared error of the fitting
+    """
+    Nc,N=F.shape
+    n=poles.size
+    offs=opts.asymp-1
+    SERD=np.zeros(Nc,dtype=np.float64)
+    SERE=np.zeros(Nc,dtype=np.float64)
+    # Initial complex poles identification: cindex marks 0 for reals, 1 and 2 for complex conjugated pairs 
+    cindex=identifyPoles(poles)
+    # Building System Matrix
+    Dk,Pk=buildBasis(s,poles,cindex)
+    with profileStage("residues"):
+        C=np.zeros((Nc,n),dtype=np.complex128)
+        if len(weights.shape)==1: #case for common wighting
+            Dk*=weights[:,None] #same weight for all frequency samples
+            # The SER for the new fitting is calculated by using the calculated zeros as new poles
+            A=np.zeros((2*N,n+offs),dtype=np.float64)
+            A[0:N,0:n]=Dk.real
+            A[N:2*N,0:n]=Dk.imag
+            if opts.asymp>1:
+                A[0:N,n]=weights
+            if opts.asymp==3:
+                A[N:2*N,n+1]=np.imag(weights*s)
+            BBc=weights*F #complex values for BB
+            BB=np.vstack((BBc.real.T,BBc.imag.T))
+            Escale=np.linalg.norm(A,axis=0)
+            A/=Escale
+            # LS solution routine imported from scipy module: 
+            #   - check_finite option is disabled to improve performance. NaN should not appear into the arrays
+            #   - gelsy lapack driver is chosen because is slightly faster than default ("gelsd")
+            # The routine returns a tuple (solution,residues,rank,svalues), however just the solution is taken:   
+            x=lstsq(A,BB, check_finite=False, lapack_driver="gelsy")[0] # solution <- result[0]
+            x=np.transpose(x/Escale[:,None])
+        else: #no common wighting used    
+            # The SER for the new fitting is calculated by using the calculated zeros as new poles. Elements are solved
+            #in chunks distributed among the workers of the execution backend
+            chunks=elementChunks(Nc,32*N*(n+offs),elementWorkers(opts))
+            x=np.vstack(elementMap(residueChunk,chunks,(Dk,s,F,weights),(n,opts.asymp),opts))
+        #...end of wighting options for residue computation
+        C[:,0:n]=x[:,0:n]
+        if opts.asymp==2:
+            SERD=x[:,n]
+        elif opts.asymp==3:
+            SERD=x[:,n]
+            SERE=x[:,n+1]
+        # Changing back to make C complex:
+        first=np.nonzero(cindex==1)[0]
+        C[:,first]=C[:,first].real+1j*C[:,first+1].real
+        C[:,first+1]=np.conj(C[:,first])
+    # New fitting evaluation. Partial fractions of the new poles are reused for all elements at once:
+    with profileStage("fit"):
+        fit=C@Pk.T
+        if opts.asymp==2:
+            fit+=SERD[:,None]
+        elif opts.asymp==3:
+            fit+=SERD[:,None]+SERE[:,None]*s
+        # Root mean squared error computation:
+        diff=fit-F #diferrences between samples and the fitted function
+        rmserr=np.sqrt(np.sum(np.abs(diff**2)))/np.sqrt(Nc*N)
+    return (C,SERD,SERE,fit,rmserr)
+
+# vectfit_stream() subroutine.
+def tsqrChunk(k0,k1,R,Dk,F,weights,n,offset):
+    """Function to fold the rows of a frequency chunk into the R factors of the relaxed systems of the elements k0:k1 (TSQR).
+       The new rows are stacked below the accumulated R factors and the stack is factorized again by a batched QR routine.
+       It is applied over chunks of elements by elementMap(). See relaxedR22() for the other arguments
+       
+       Results.
+       
+        - R: Updated R factors of the elements [K x offset+n+1 x offset+n+1]
+    """
+    weig=weights if weights.ndim==1 else weights[k0:k1,:]
+    A=relaxedSystem(Dk,F[k0:k1,:],weig,n,offset)
+    return np.linalg.qr(np.concatenate((R[k0:k1],A),axis=1),mode="r")
+
+# vectfit_stream() subroutine.
+def streamPoleIdentification(chunks,poles,opts):
+    """Function to compute a new set of poles of F(s) from samples read by frequency chunks. Out of core version of 
+       poleIdentification(): the R factors of the relaxed systems are accumulated chunk by chunk (TSQR), so memory depends 
+       on the chunk size and not on the number of frequency samples. The same reduced problems are obtained, so poles agree 
+       with poleIdentification() up to rounding errors.
+       
+       Arguments.
+       
+        - chunks: Function returning a fresh iterable of tuples (s,F,weights) with consecutive chunks of the samples. 
+            See arrayChunks()
+        - poles: Searching poles [n]
+        - opts: VFOptions with the configuration of vectfit
+       
+       Results.
+       
+        - poles: New poles of F(s) computed as the zeros of sigma(s) [n]. Sorted by sortPoles()
+    """
+    return factorPoles(poleFactors(chunks,poles,opts),opts)
+
+# streamPoleIdentification() subroutine.
+def poleFactors(chunks,poles,opts,factors=None):
+    """Function to accumulate the R factors of the relaxed systems of F(s) for the searching poles (TSQR). 
+       
+       Arguments.
+       
+        - chunks: Same as streamPoleIdentification()
+        - poles: Searching poles [n]. Ignored when factors are given
+        - opts: VFOptions with the configuration of vectfit
+        - factors: (optional) Dictionary returned by a previous call. The new rows are folded into its R factors
+       
+       Results.
+       
+        - factors: Dictionary with the searching poles "poles", the R factors "R" [Nc x P x P], the number of samples "N",
+            the squared norm of weights*F "normF" and the column sums of the basis "sumD" [n+1] for the integral criterion
+    """
+    if factors is None:
+        factors=dict(poles=poles,R=None,N=0,normF=0.0,sumD=np.zeros(poles.size+1,dtype=np.complex128))
+    poles=factors["poles"]
+    n=poles.size
+    offs=opts.asymp-1 # 0 for [D=0; E=0], 1 for [D!=0; E=0] and 2 for [D!=0; E!=0]
+    offset=n+offs
+    P=offset+n+1 # columns of the relaxed systems
+    cindex=identifyPoles(poles)
+    R=factors["R"]
+    for (s,F,weights) in chunks():
+        F=np.atleast_2d(F)
+        Nc,Nk=F.shape
+        if R is None:
+            R=np.zeros((Nc,P,P),dtype=np.float64) # rows of zeros do not modify the LS-problems
+        Dk=np.ones((Nk,n+max(offs,1)),dtype=np.complex128)
+        buildBasis(s,poles,cindex,out=Dk[:,0:n])
+        if offs==2:
+            Dk[:,n+1]=s
+        factors["N"]+=Nk
+        factors["normF"]+=np.linalg.norm(weights*F)**2
+        factors["sumD"]+=np.sum(Dk[:,0:n+1],axis=0)
+        # Elements are updated in chunks bounded by QR_BATCH_BYTES and distributed among the workers of the execution backend
+        with profileStage("qr"):
+            elements=elementChunks(Nc,8*(2*Nk+P)*P,elementWorkers(opts))
+            results=elementMap(tsqrChunk,elements,(R,Dk,F,weights),(n,offset),opts)
+            for (k0,k1),Rk in zip(elements,results):
+                R[k0:k1]=Rk
+    factors["R"]=R
+    return factors
+
+# streamPoleIdentification() subroutine.
+def factorPoles(factors,opts):
+    """Function to compute a new set of poles of F(s) from the R factors accumulated by poleFactors().
+        *Returns the new poles [n], sorted by sortPoles()"""
+    poles=factors["poles"]
+    R=factors["R"]
+    N=factors["N"]
+    sumD=factors["sumD"]
+    n=poles.size
+    offset=n+opts.asymp-1
+    P=offset+n+1
+    cindex=identifyPoles(poles)
+    Nc=R.shape[0]
+    scale=np.sqrt(factors["normF"])/N
+    x=None
+    if opts.relax:
+        AA=np.empty((Nc*(n+1),n+1),dtype=np.float64)
+        bb=np.zeros(Nc*(n+1),dtype=np.float64)
+        AA[0:(Nc-1)*(n+1),:]=np.reshape(R[0:Nc-1,offset:,offset:],((Nc-1)*(n+1),n+1))
+        # The integral criterion row is folded into the R factor of the last element. Its right hand side is carried as an 
+        #extra column, so the last column of the new R factor is Q.T*b
+        M=np.zeros((P+1,P+1),dtype=np.float64)
+        M[0:P,0:P]=R[-1]
+        M[P,offset:P]=np.real(scale*sumD)
+        M[P,P]=N*scale
+        Rl=np.linalg.qr(M,mode="r")
+        AA[(Nc-1)*(n+1):,:]=Rl[offset:P,offset:P]
+        bb[(Nc-1)*(n+1):]=Rl[offset:P,P]
+        x=reducedSolve(AA,bb)
+    # Non relaxed problems: its system is [A1 | A2] without the last column, and the right hand side is -Dnew times that 
+    #column, so both R22 and Q.T*b are taken from the accumulated R factors without reading the samples again
+    Dnew=fixedSigmaD(x if opts.relax else None)
+    if Dnew is not None:
+        AA=np.reshape(R[:,offset:offset+n,offset:offset+n],(Nc*n,n))
+        bb=-Dnew*np.ravel(R[:,offset:offset+n,P-1])
+        x=reducedSolve(AA,bb)
+        x=np.append(x,Dnew)
+    return sigmaZeros(x,poles,cindex,opts.stable)
+
+# vectfit_stream() subroutine.
+def streamResidueIdentification(chunks,poles,opts):
+    """Function to compute the residues of F(s) from samples read by frequency chunks. Out of core version of 
+       residueIdentification(): for common weighting the R factor of A and Q^T*BB are accumulated chunk by chunk, so the 
+       cost of each chunk grows linearly with the number of elements, and for individual weighting the R factors of 
+       [A_k | b_k]. The fitting error is computed by a second pass over the chunks, so the fitted function is not returned.
+       
+       Arguments. Same as streamPoleIdentification() with the poles of F(s)
+       
+       Results. Linked as a tuple
+       
+        - C: Complex residues [Nc x n]
+        - D: Constant terms [Nc]
+        - E: Proportional terms [Nc]
+        - rmserr: Root mean squared error of the fitting
+    """
+    n=poles.size
+    offs=opts.asymp-1
+    m=n+offs # unknowns of each element
+    cindex=identifyPoles(poles)
+    R=None   # individual weighting: stacked R factors of [A_k | b_k]
+    RA=None  # common weighting: R factor of A and Q^T*BB with the elements as right hand sides
+    QB=None
+    Escale=0.0 # squared norms of the columns of A
+    with profileStage("residues"):
+        for (s,F,weights) in chunks():
+            F=np.atleast_2d(F)
+            Nc,Nk=F.shape
+            common=weights.ndim==1
+            weig=np.atleast_2d(weights)
+            # Unweighted system matrix shared by all the elements
+            A0=np.zeros((2*Nk,m),dtype=np.float64)
+            Dk=buildBasis(s,poles,cindex)[0]
+            A0[0:Nk,0:n]=Dk.real
+            A0[Nk:2*Nk,0:n]=Dk.imag
+            if opts.asymp>1:
+                A0[0:Nk,n]=1
+            if opts.asymp==3:
+                A0[Nk:2*Nk,n+1]=np.imag(s)
+            BBc=weig*F #complex values for BB
+            if common: # one LS-problem with the elements as right hand sides
+                A=np.tile(weights,2)[:,None]*A0
+                BB=np.vstack((BBc.real.T,BBc.imag.T))
+                if RA is None:
+                    RA=np.zeros((m,m),dtype=np.float64)
+                    QB=np.zeros((m,Nc),dtype=np.float64)
+                Escale=Escale+np.sum(A**2,axis=0)
+                # Only the m columns of A are triangularized, and the right hand sides are carried by the same Q
+                (Q,RA)=np.linalg.qr(np.vstack((RA,A)))
+                QB=Q.T@np.vstack((QB,BB))
+            else: # one LS-problem for each element: stacked R factors of [A_k | b_k]
+                A=np.empty((Nc,2*Nk,m+1),dtype=np.float64)
+                A[:,:,0:m]=np.tile(weig,2)[:,:,None]*A0
+                A[:,0:Nk,m]=BBc.real
+                A[:,Nk:2*Nk,m]=BBc.imag
+                if R is None:
+                    R=np.zeros((Nc,m+1,m+1),dtype=np.float64)
+                Escale=Escale+np.sum(A[:,:,0:m]**2,axis=1)
+                R=np.linalg.qr(np.concatenate((R,A),axis=1),mode="r")
+    with profileStage("residues"):
+        Escale=np.sqrt(Escale)
+        # LS solutions from the R factors. Columns are normalized as in residueIdentification()
+        if RA is not None:
+            Nc=QB.shape[1]
+            x=lstsq(RA/Escale,QB, check_finite=False, lapack_driver="gelsy")[0]
+            x=np.transpose(x/Escale[:,None])
+        else:
+            Nc=R.shape[0]
+            x=np.zeros((Nc,m),dtype=np.float64)
+            for k in range(Nc):
+                x[k,:]=lstsq(R[k,0:m,0:m]/Escale[k],R[k,0:m,m], check_finite=False, lapack_driver="gelsy")[0]/Escale[k]
+    C=np.zeros((Nc,n),dtype=np.complex128)
+    C[:,0:n]=x[:,0:n]
+    SERD=x[:,n] if opts.asymp>1 else np.zeros(Nc,dtype=np.float64)
+    SERE=x[:,n+1] if opts.asymp==3 else np.zeros(Nc,dtype=np.float64)
+    # Changing back to make C complex:
+    first=np.nonzero(cindex==1)[0]
+    C[:,first]=C[:,first].real+1j*C[:,first+1].real
+    C[:,first+1]=np.conj(C[:,first])
+    # Root mean squared error computation by a second pass over the chunks:
+    with profileStage("fit"):
+        err=0.0; N=0
+        for (s,F,weights) in chunks():
+            F=np.atleast_2d(F)
+            fit=C@(1/(s[:,None]-poles[None,:])).T+SERD[:,None]+SERE[:,None]*s
+            err+=np.sum(np.abs(fit-F)**2)
+            N+=s.size
+        rmserr=np.sqrt(err)/np.sqrt(Nc*N)
+    return (C,SERD,SERE,rmserr)
+
+def poleResidues(SER):
+    """Function to get the poles and complex residues of the flattened model in SER, which may be in complex or real form.
+       For a real SER, complex conjugated pairs are recovered from the [2 x 2] blocks of A and the contiguous real and 
+       imaginary parts in C, as marked by the values 2 and 0 in B.
+        *Returns a tuple (poles,R) with poles [n] and residues R [Nc x n] of the model"""
+    A=SER["A"]
+    C=SER["C"]
+    if SER["cmplx_ss"]:
+        return np.diag(A).astype(np.complex128),C.astype(np.complex128)
+    first=np.nonzero(np.ravel(SER["B"])==2)[0] # first member of each complex conjugated pair
+    poles=np.diag(A).astype(np.complex128)
+    poles[first]+=1j*A[first,first+1]
+    poles[first+1]=np.conj(poles[first])
+    R=C.astype(np.complex128)
+    R[:,first]=C[:,first]+1j*C[:,first+1]
+    R[:,first+1]=np.conj(R[:,first])
+    return poles,R
+
+def evaluate(SER,s,out=None):
+    """Function to evaluate the fitted function of the state-space model in SER at the frequency points s.
+       All elements are evaluated together with one matrix product per chunk of frequency points, and chunks are bounded 
+       by EVAL_BATCH_BYTES, so the memory in use does not grow with the number of points besides the results.
+       
+       Arguments.
+       
+        - SER: Dictionary with the flattened state-space model built by vectfit() (buildSER()), in complex or real form
+        - s: Complex frequency points of evaluation [Ns]
+        - out: (optional) Array of shape [Nc x Ns] to store the results, for instance a numpy.memmap for huge sweeps
+        
+       Results.
+       
+        - fit: Evaluation of F(s) = C * (sI-A)^-1 * B + D + sE for all elements [Nc x Ns]
+    """
+    (poles,R)=poleResidues(SER)
+    D=np.ravel(SER["D"])
+    E=np.ravel(SER["E"])
+    Nc,n=R.shape
+    s=np.ravel(s)
+    if out is None:
+        out=np.zeros((Nc,s.size),dtype=np.complex128)
+    with profileStage("fit"):
+        chunk=max(1,EVAL_BATCH_BYTES//(16*(n+Nc)))
+        for k0 in range(0,s.size,chunk):
+            sk=s[k0:k0+chunk]
+            out[:,k0:k0+chunk]=R@(1/(sk[:,None]-poles[None,:])).T+D[:,None]+E[:,None]*sk
+    return out
+
+def elementIndex(Nc,symm_mat,RMO_data):
+    """Function to get the positions into the full matrix function of the Nc flattened elements fitted by vectfit.
+       Elements of symmetric problems are the lower triangular submatrix in CMO, otherwise all elements are in RMO or CMO.
+        *Returns a tuple (Ny,rows,cols) with the matrix dimention Ny and the row and column of each element [Nc]"""
+    if symm_mat:
+        Ny=int(np.ceil((np.sqrt(8*Nc+1)-1)/2)) # Nc=Ny*(Ny+1)/2
+        cols,rows=np.triu_indices(Ny)          # lower triangular submatrix in CMO
+    else:
+        Ny=int(np.sqrt(Nc))
+        rows,cols=np.divmod(np.arange(Nc),Ny)  # RMO
+        if not(RMO_data):
+            rows,cols=cols,rows                # CMO
+    return Ny,rows,cols
+
+def isReciprocal(H,rtol=1e-6):
+    """Function to detect whether the samples of a matrix function are symmetric (reciprocal networks), so that only its 
+       lower triangular submatrix needs to be fitted with the "symm_mat" option.
+       
+       Arguments.
+       
+        - H: Samples of the matrix function [N x Ny x Ny]
+        - rtol: Tolerance for max|H-H.T| relative to max|H|
+        
+        *Returns True if H is symmetric within the tolerance"""
+    H=np.asarray(H)
+    scale=np.max(np.abs(H))
+    return bool(np.max(np.abs(H-np.swapaxes(H,-1,-2)))<=rtol*scale) if scale>0 else True
+
+def packMatrix(H,symm_mat=False,RMO_data=True):
+    """Function to flatten the samples of a matrix function into the F(s) argument of vectfit(). Symmetric problems keep 
+       the lower triangular submatrix in CMO, otherwise all elements are taken in RMO or CMO, with the same layout expected 
+       by flat2full() and elementIndex().
+       
+       Arguments.
+       
+        - H: Samples of the matrix function [N x Ny x Ny]
+        - symm_mat, RMO_data: Layout of the elements, with the meaning of vectfit() options
+        
+        *Returns F(s) samples [Nc x N]"""
+    Ny=H.shape[-1]
+    Nc=Ny*(Ny+1)//2 if symm_mat else Ny*Ny
+    (Ny,rows,cols)=elementIndex(Nc,symm_mat,RMO_data)
+    return np.ascontiguousarray(np.transpose(H[:,rows,cols]))
+
+class PoleResidueModel:
+    """Compact pole-residue model of a matrix function with common poles:
+        F(s) = sum_m( R[m]/(s-poles[m]) ) + D + s*E
+    
+       Poles are storaged once with a residue matrix for each pole, so memory grows with Ny*Ny*n. The block diagonal 
+       state-space forms are built only when they are requested by to_full(), to_sparse() or to_real().
+       
+       Attributes.
+       
+        - poles: Poles of the model [n]
+        - R: Complex residue matrices [n x Ny x Ny]
+        - D: Constant terms [Ny x Ny]
+        - E: Proportional terms [Ny x Ny]
+    """
+    def __init__(self,poles,R,D,E):
+        self.poles=np.asarray(poles,dtype=np.complex128)
+        self.R=np.asarray(R,dtype=np.complex128)
+        self.D=np.asarray(D,dtype=np.float64)
+        self.E=np.asarray(E,dtype=np.float64)
+
+    @classmethod
+    def from_SER(cls,SER):
+        """Function to build the model from the flattened SER computed by vectfit(), in complex or real form.
+           "symm_mat" and "RMO_data" flags in SER give the position of each element into the matrix function.
+            *Returns a PoleResidueModel object"""
+        (poles,Res)=poleResidues(SER)
+        Nc,n=Res.shape
+        (Ny,rows,cols)=elementIndex(Nc,SER["symm_mat"],SER["RMO_data"])
+        R=np.zeros((n,Ny,Ny),dtype=np.complex128)
+        D=np.zeros((Ny,Ny),dtype=np.float64)
+        E=np.zeros((Ny,Ny),dtype=np.float64)
+        # symmetric elements are written twice, once for each triangular submatrix
+        for (r,c) in ((rows,cols),(cols,rows)) if SER["symm_mat"] else ((rows,cols),):
+            R[:,r,c]=Res.T
+            D[r,c]=np.ravel(SER["D"])
+            E[r,c]=np.ravel(SER["E"])
+        return cls(poles,R,D,E)
+
+    @property
+    def n(self):
+        """Order of aproximation"""
+        return self.poles.size
+
+    @property
+    def Ny(self):
+        """Dimention of the matrix function"""
+        return self.D.shape[0]
+
+    def residues(self):
+        """Function to get the residue matrices with the layout of buildRES().
+            *Returns a 3D array of shape [Ny x Ny x n]"""
+        return np.transpose(self.R,(1,2,0))
+
+    def evaluate(self,s):
+        """Function to evaluate the model at the frequency points s. Chunks of points are bounded by EVAL_BATCH_BYTES.
+            *Returns a 3D array of shape [Ny x Ny x Ns]"""
+        s=np.ravel(s)
+        Ny=self.Ny
+        Rflat=np.reshape(self.R,(self.n,Ny*Ny))
+        out=np.zeros((Ny*Ny,s.size),dtype=np.complex128)
+        chunk=max(1,EVAL_BATCH_BYTES//(16*(self.n+Ny*Ny)))
+        for k0 in range(0,s.size,chunk):
+            sk=s[k0:k0+chunk]
+            out[:,k0:k0+chunk]=((1/(sk[:,None]-self.poles[None,:]))@Rflat).T
+        out+=np.ravel(self.D)[:,None]+np.ravel(self.E)[:,None]*s
+        return np.reshape(out,(Ny,Ny,s.size))
+
+    def blocks(self,cmplx_ss=True):
+        """Function to get the state-space matrices of a single block of the model: A [n x n], B [n] and the output matrix 
+           C [Ny x Ny x n] for all elements. For the real form complex conjugated pairs are represented as in buildSER().
+            *Returns a tuple (A,B,C)"""
+        if cmplx_ss:
+            return np.diag(self.poles),np.ones(self.n,dtype=np.float64),self.residues()
+        cindex=identifyPoles(self.poles)
+        first=np.nonzero(cindex==1)[0]
+        A=np.diag(self.poles.real)
+        A[first,first+1]=self.poles[first].imag
+        A[first+1,first]=-self.poles[first].imag
+        B=np.ones(self.n,dtype=np.float64)
+        B[first]=2
+        B[first+1]=0
+        C=self.residues().real.copy()
+        C[:,:,first+1]=self.residues()[:,:,first].imag
+        return A,B,C
+
+    def to_full(self,cmplx_ss=True):
+        """Function to build the full state-space model, with the same layout of flat2full() output:
+           A [Ny*n x Ny*n], B [Ny*n x Ny], C [Ny x Ny*n], D [Ny x Ny] and E [Ny x Ny].
+            *Returns a SER dictionary"""
+        (A,B,C)=self.blocks(cmplx_ss)
+        Ny=self.Ny
+        I=np.eye(Ny)
+        return dict(A=np.kron(I,A),B=np.kron(I,B[:,None]),C=np.reshape(C,(Ny,Ny*self.n)),D=self.D.copy(),E=self.E.copy(),
+                    cmplx_ss=cmplx_ss,symm_mat=False,RMO_data=True)
+
+    def to_real(self):
+        """Function to build the full state-space model in real form, with [2 x 2] blocks in A for complex conjugated pairs.
+            *Returns a SER dictionary"""
+        return self.to_full(cmplx_ss=False)
+
+    def to_sparse(self,cmplx_ss=True):
+        """Function to build the full state-space model with A and B as scipy.sparse matrices in CSR format. 
+           Only the Ny*n (complex form) or up to 3*Ny*n (real form) nonzero values of A are storaged.
+            *Returns a SER dictionary"""
+        from scipy import sparse
+        (A,B,C)=self.blocks(cmplx_ss)
+        Ny=self.Ny
+        I=sparse.identity(Ny,format="csr")
+        return dict(A=sparse.kron(I,sparse.csr_matrix(A),format="csr"),B=sparse.kron(I,sparse.csr_matrix(B[:,None]),format="csr"),
+                    C=np.reshape(C,(Ny,Ny*self.n)),D=self.D.copy(),E=self.E.copy(),cmplx_ss=cmplx_ss,symm_mat=False,RMO_data=True)
+
+# vectfit_order() subroutine.
+def startingPoles(s,n,log=True):
+    """Function to build n searching poles distributed over the frequency band of s as in [1]: complex conjugated pairs 
+       -beta/100 +- j*beta for beta spaced linearly or logarithmically. A real pole -beta_min is added for odd n
+        *Returns the searching poles [n]"""
+    w=np.abs(s.imag)
+    w0=np.min(w[w>0]) if np.any(w>0) else 1.0
+    w1=max(np.max(w),w0)
+    Bet=np.logspace(np.log10(w0),np.log10(w1),n//2) if log else np.linspace(w0,w1,n//2)
+    pairs=np.ravel(np.column_stack((-Bet/100+1j*Bet,-Bet/100-1j*Bet)))
+    if n%2:
+        pairs=np.append(-w0+0j,pairs)
+    return pairs
+
+# vectfit_order() subroutine.
+def addPoles(poles,s,err,m):
+    """Function to extend a set of poles with m new searching poles for a warm start of a higher order. New complex pairs are
+       placed at the frequencies of the largest local maxima of the fitting error err [N], where the previous model is poorer.
+       A real pole is added for odd m
+        *Returns the extended set of searching poles [n+m]"""
+    w=np.abs(s.imag)
+    # local maxima of the error, sorted from the largest
+    peaks=np.nonzero(np.r_[True,err[1:]>=err[:-1]] & np.r_[err[:-1]>=err[1:],True] & (w>0))[0]
+    peaks=peaks[np.argsort(err[peaks])[::-1]]
+    Bet=w[peaks[0:m//2]]
+    if Bet.size<m//2: # not enough peaks: the remaining pairs are spread over the band
+        Bet=np.append(Bet,np.abs(startingPoles(s,2*(m//2-Bet.size)).imag[0::2]))
+    new=np.ravel(np.column_stack((-Bet/100+1j*Bet,-Bet/100-1j*Bet)))
+    if m%2:
+        new=np.append(-(w[peaks[0]] if peaks.size else 1.0)+0j,new)
+    return np.concatenate((poles,new))
+
+# initialPoles() subroutine.
+def aaaPoles(z,G,mmax,tol=1e-13):
+    """Function to compute a rational approximation of the elements of G(z) in barycentric form by the AAA algorithm [5]. 
+       All the elements share support points and weights, so they share the poles as well (set-valued AAA). Support points
+       are added greedily where the error is larger, up to mmax support points (order mmax-1) or until the relative error
+       is under tol.
+       
+       Arguments.
+       
+        - z: Sample points [N]
+        - G: Samples of the elements [Nc x N] or [N]
+        - mmax: Maximum number of support points
+        - tol: Relative tolerance for the error of the approximation
+       
+       Results. Linked as a tuple
+       
+        - poles: Poles of the rational approximation [m-1]
+        - residues: Residues of the elements at the poles [Nc x m-1]
+        - err: Maximum absolute error |G-r| among the elements at the points z [N]
+    """
+    G=np.atleast_2d(G)
+    N=z.size
+    mmax=min(mmax,N-1)
+    R=np.repeat(np.mean(G,axis=1,keepdims=True),N,axis=1)
+    support=np.zeros(N,dtype=bool)
+    index=np.zeros(mmax,dtype=int) # support points in order of selection
+    Gram=np.zeros((mmax,mmax),dtype=np.complex128)
+    # Cached columns of the Loewner matrices (G-G[:,j])/(z-z[j]) of all the elements, over all the sample points, and of the
+    #Cauchy matrix 1/(z-z[j]). Rows of the support points are set to zero, so each step only adds the column of the new 
+    #support point and removes its row
+    Loewner=np.zeros((mmax,G.shape[0],N),dtype=np.complex128)
+    Cauchy=np.zeros((N,mmax),dtype=np.complex128)
+    for m in range(1,mmax+1):
+        j=np.argmax(np.max(np.abs(G-R),axis=0)*~support)
+        # The Gram matrix L^H*L of the Loewner matrices of all the elements (stacked, so the weights are common) is updated with
+        #the new column, and the rows of the new support point are removed
+        if m>1:
+            Lj=Loewner[0:m-1,:,j]
+            Gram[0:m-1,0:m-1]-=Lj.conj()@Lj.T
+            Loewner[0:m-1,:,j]=0
+            Cauchy[j,0:m-1]=0
+        support[j]=True
+        index[m-1]=j
+        zj=z[index[0:m]]; Gj=G[:,index[0:m]]
+        with np.errstate(divide="ignore",invalid="ignore"):
+            Cauchy[:,m-1]=1/(z-z[j])
+            Loewner[m-1]=(G-G[:,j,None])*Cauchy[None,:,m-1]
+        Cauchy[support,m-1]=0
+        Loewner[m-1][:,support]=0
+        Lnew=Loewner[m-1].ravel()
+        Gram[0:m-1,m-1]=np.conj(np.reshape(Loewner[0:m-1],(m-1,Lnew.size))@np.conj(Lnew))
+        Gram[m-1,0:m-1]=np.conj(Gram[0:m-1,m-1])
+        Gram[m-1,m-1]=np.vdot(Lnew,Lnew)
+        # barycentric weights: eigenvector of the smallest eigenvalue of the Gram matrix
+        wj=np.linalg.eigh(Gram[0:m,0:m])[1][:,0]
+        Cs=Cauchy[~support,0:m]
+        R[:,~support]=((wj*Gj)@Cs.T)/(Cs@wj)
+        R[:,support]=Gj
+        if np.max(np.abs(G-R))<=tol*np.max(np.abs(G)):
+            break
+    # The Gram matrix squares the condition number, so the final weights are computed from the singular value decomposition 
+    #of the Loewner matrix (of its triangular factor, as it is tall): right singular vector of its smallest singular value
+    L=np.linalg.qr(np.reshape(Loewner[0:m][:,:,~support],(m,-1)).T,mode="r")
+    wj=np.conj(np.linalg.svd(L)[2][-1,:])
+    Cs=Cauchy[~support,0:m]
+    R[:,~support]=((wj*Gj)@Cs.T)/(Cs@wj)
+    # poles are the finite eigenvalues of the arrowhead pencil (E,B)
+    E=np.zeros((m+1,m+1),dtype=np.complex128)
+    E[0,1:]=wj
+    E[1:,0]=1
+    E[1:,1:]=np.diag(zj)
+    B=np.eye(m+1)
+    B[0,0]=0
+    poles=eigvals(E,B) #routine imported from scipy module
+    poles=poles[np.isfinite(poles)]
+    # residues N(p)/D'(p) of the barycentric form
+    Cp=1/(poles[:,None]-zj[None,:])
+    residues=((wj*Gj)@Cp.T)/(-(Cp*Cp)@wj)
+    return (poles,residues,np.max(np.abs(G-R),axis=0))
+
+# initialPoles() subroutine.
+def realPoles(poles,residues,n,stable=True):
+    """Function to select up to n poles of a real model from the poles of an approximation of samples at s and conj(s).
+       Real poles and poles in the upper half plane, taken as complex conjugated pairs, are selected from the ones with the
+       highest resonance peak max|res/Re(p)|. Poles placed on support points of the approximation have null weights and are 
+       discarded. Unstable poles are flipped into the left half plane when stable is True
+        *Returns the selected poles with exact real values and conjugated pairs"""
+    valid=np.all(np.isfinite(residues),axis=0)
+    poles=poles[valid]
+    residues=residues[:,valid]
+    if stable:
+        poles=-np.abs(poles.real)+1j*poles.imag
+        poles.real=np.minimum(poles.real,-1e-6*np.abs(poles))
+    peak=np.max(np.abs(residues),axis=0)/np.maximum(np.abs(poles.real),1e-6*np.abs(poles))
+    real=np.abs(poles.imag)<=1e-3*np.abs(poles)
+    found=[]
+    for k in np.argsort(peak)[::-1]:
+        if real[k] and len(found)<n:
+            found.append(poles[k].real+0j)
+        elif poles[k].imag>0 and not(real[k]) and len(found)<n-1:
+            found+=[poles[k],np.conj(poles[k])]
+    return np.array(found,dtype=np.complex128)
+
+# vectfit() subroutine.
+def initialPoles(F,s,n,weights=None):
+    """Function to estimate n searching poles from the samples of F(s) instead of spreading them over the frequency band.
+       A cheap AAA approximation [5] of the weighted sum of the normalized elements of F(s) is computed, with the samples at
+       conj(s) included so that the approximation is nearly real. Its poles are selected by realPoles(), and when fewer poles 
+       are found the remaining ones are placed by addPoles() at the frequencies where the AAA approximation is poorer. Poles
+       of the resonances present in the samples are found from the beginning, so vectfit needs fewer relocation iterations
+       to converge.
+       
+       Arguments.
+       
+        - F: F(s) samples [Nc x N] or [N]
+        - s: Complex frequency points of evaluation [N]
+        - n: Order of aproximation
+        - weights: (optional) Common [N] or individual [Nc x N] weights
+       
+       Results.
+       
+        - poles: Searching poles [n]. Sorted by sortPoles()
+    """
+    with profileStage("initial"):
+        F=np.atleast_2d(F)
+        N=s.size
+        if weights is None:
+            weights=np.ones(N,dtype=np.float64)
+        norms=np.linalg.norm(F,axis=1)
+        norms[norms==0]=1
+        g=np.sum(np.atleast_2d(weights)*F/norms[:,None],axis=0)
+        (poles,residues,err)=mirroredAAA(s,g,n+1)
+        found=realPoles(poles,residues,n)
+        if found.size<n:
+            found=addPoles(found,s,err[0:N],n-found.size)
+        return sortPoles(found)
+
+# initialPoles() subroutine.
+def mirroredAAA(s,G,mmax,tol=1e-13):
+    """Function to apply aaaPoles() over the samples G(s) [Nc x N] and their conjugates conj(G) at conj(s), which are the 
+       samples of a real system at negative frequencies, so that the approximation is nearly real. Frequency is normalized
+       to improve the conditioning of the Cauchy matrices. See aaaPoles() for the results"""
+    G=np.atleast_2d(G)
+    mirror=s.imag!=0
+    scale=np.max(np.abs(s)) or 1.0
+    with np.errstate(divide="ignore",invalid="ignore"):
+        (poles,residues,err)=aaaPoles(np.append(s,np.conj(s[mirror]))/scale,np.hstack((G,np.conj(G[:,mirror]))),mmax,tol)
+    return (poles*scale,residues*scale,err)
+
+# vectfit_order() subroutine.
+def orderChunk(k0,k1,F,s,weights,starts,opts,Niter,poletol):
+    """Function to fit the candidate orders k0:k1 of vectfit_order() by vectfit_iterate() from their searching poles in starts.
+       It is applied over chunks of candidates by elementMap().
+        *Returns the list of results of vectfit_iterate() for the candidates"""
+    return [vectfit_iterate(F,s,starts[k].copy(),weights,opts,Niter,poletol) for k in range(k0,k1)]
+
+# vectfit_bands() subroutine.
+def bandLimits(s,bands,overlap):
+    """Function to split the frequency samples in sub-bands with the same number of contiguous samples. Each band is extended
+       by a fraction overlap of its samples at both sides.
+        *Returns a tuple (bounds,cores): sample ranges (k0,k1) of the extended bands and frequency limits (w0,w1) of the bands 
+         without overlap, which cover [0,inf) together"""
+    N=s.size
+    edges=np.linspace(0,N,bands+1).astype(int)
+    bounds=[]; cores=[]
+    for b in range(bands):
+        ext=int(np.ceil(overlap*(edges[b+1]-edges[b])))
+        bounds.append((max(edges[b]-ext,0),min(edges[b+1]+ext,N)))
+        w0=0.0 if b==0 else np.abs(s[edges[b]].imag)
+        w1=np.inf if b==bands-1 else np.abs(s[edges[b+1]].imag)
+        cores.append((w0,w1))
+    return (bounds,cores)
+
+# vectfit_bands() subroutine.
+def bandChunk(k0,k1,F,s,weights,bounds,n,opts,Niter):
+    """Function to fit the sub-bands k0:k1 of vectfit_bands() with vectfit_iterate() from the poles estimated by initialPoles().
+       It is applied over chunks of bands by elementMap().
+        *Returns the list of poles of the bands"""
+    result=[]
+    for b in range(k0,k1):
+        i0,i1=bounds[b]
+        weig=weights[i0:i1] if weights.ndim==1 else weights[:,i0:i1]
+        result.append(vectfit_iterate(F[:,i0:i1],s[i0:i1],n,weig,opts,Niter)[1])
+    return result
+
 # * ----------------------------------------------------------  main vectfit3 function ---------------------------------------------------------- *
 
-def vectfit(F,s,poles,weights,opts=opts):
+def vectfit(F,s,poles,weights,opts=None,stats=None):
     """ 
     vectfit(): Function to compute a rational aproximation in the frequency domain with the 
     Fast Relaxed Vector Fitting algorithm. Should be used recursively to achieve the best fit.
@@ -480,14 +1913,16 @@ def vectfit(F,s,poles,weights,opts=opts):
             Nc: number of elements for vector case, otherwise 1.
             N:  number of frequency samples
         - s: array of frequency points of dimentions [1 x N] in [rad/s]
-        - poles: array of initial search poles [1 x n] for n as the aproximation order
+        - poles: array of initial search poles [1 x n] for n as the aproximation order. If the order n is given as an 
+            integer instead, the initial poles are estimated from the samples by initialPoles()
         - weights: priority of each frequency sample in the process [1 or Nc x N].
             No wighting desired: weight=ones[1 x N]
             Common weighting: weight=array[1 x N]
             Individial elementwise weighting: weight=array[Nc x N]
-        - opts: dictionary with the modifiers to change the default configuration of the algorithm
-            To be used the opts dictionary should be imported and modified from main module taking
-            into account the following value options:
+        - opts: (optional) VFOptions object with the configuration of the algorithm. The module dictionary vectfit3.opts 
+            is used if it is not given, as a validated snapshot. A dictionary with opts keys is also accepted and validated as VFOptions.from_dict(opts). 
+            Options are passed per call, so fits running at the same time in different threads do not interfere.
+            The following value options are available:
             
                 "lowert_mat" <- (bool): Indicates when F(s) samples belong to a lower triangular matrix (symmetric problem)
                 "RMO_data"   <- (bool): Indicates when matrix function elements are arranged in RMO into F(s)
@@ -504,6 +1939,9 @@ def vectfit(F,s,poles,weights,opts=opts):
                 "errplot"    <- (bool): Include logarithmic error graph in the results
                 "phaseplot"  <- (bool): Exclude plot of phase angle
                 "legend"     <- (bool): Include legends in plots
+                "backend"    <- ("serial", "thread" or "process"): Execution backend for the element-wise QR and LS-problems
+                "workers"    <- (int): Number of parallel workers for "thread" and "process" backends. 0 uses all cores
+        - stats: (optional) VFStats object. Wall time, calls and peak bytes of each stage of the call are added to it
     
     Output variables. linked as a tuple
     
@@ -513,21 +1951,19 @@ def vectfit(F,s,poles,weights,opts=opts):
         - rmserr: root mean squared error achieved 
         - fit: evaluation of the fitted function that aproximates F(s)
     """
+    if stats is not None:
+        with stats:
+            return vectfit(F,s,poles,weights,opts)
     # Entry errors cheking
-    if opts_errorCheck(opts) or dim_errorCheck(F,s,poles,weights):
+    opts=checkOptions(opts)
+    if opts is None or dim_errorCheck(F,s,np.atleast_1d(poles),weights):
         print("vecfit() not lunched due to and entry error!")
         return False
+    if np.ndim(poles)==0: # order of aproximation given instead of the initial poles
+        poles=initialPoles(F,s,int(poles),weights)
     # If no error is found the algorithm computation proceeds
-    TOLlow=1e-18; TOLhigh=1e18; # vectfit3 tolerances
     # Initial poles configuration
-    if s[0]==0:
-        if poles[0]==0 and poles[1]!=0:
-            poles[0]=-1
-        elif poles[0]!=0 and poles[1]==0:
-            poles[1]=-1
-        elif poles[0]==0 and poles[1]==0:
-            poles[0]=-1+10j
-            poles[1]=-1-10j
+    checkInitialPoles(s,poles)
     N=s.size                                 # Number of samples in the frequency domain
     n=poles.size                             # Order of aproximation
     if len(F.shape)>1:
@@ -538,8 +1974,6 @@ def vectfit(F,s,poles,weights,opts=opts):
         F=np.reshape(F,(1,N))
         
     # Problem arrays declaration
-    LAMBD=np.diag(poles)                      # Diagonal matriz with searching poles  
-    B=np.ones((n,1), np.float64)              # Column vector of ones
     SERA=poles                                # A Matrix in the space state model
     SERB=np.ones((n,1), np.float64)           # B Matrix in the space state model
     SERC=np.zeros((Nc,n),dtype=np.complex128) # C Matrix in the space state model
@@ -547,338 +1981,22 @@ def vectfit(F,s,poles,weights,opts=opts):
     SERE=np.zeros(Nc,dtype=np.float64)        # E Matrix in the space state model
     fit=np.zeros((Nc,N),dtype=np.complex128)  # Array to store fitted values
     rmserr=-1                                 # Root mean squared error
-    # Weighting type identification
-    if len(weights.shape)==1:
-        commonWeighting=True
-        # Reshaping arrays to ensure a good vectorized computation
-        #weights=np.reshape(weights,(1,N))
-    else:
-        commonWeighting=False
-    # Space state selected structure
-    if opts["asymp"]==1: 
-        offs=0 # for [D=0; E=0]
-    elif opts["asymp"]==2:
-        offs=1 # [D!=0; E=0]
-    else:
-        offs=2 # [D!=0; E!=0]
         
     # *-- POLES IDENTIFICATION PROCESS
         
-    if not(opts["skip_pole"]):
-        Escale=np.zeros(Nc+1)
-        # Initial complex poles identification: cindex marks 0 for reals, 1 and 2 for complex conjugated pairs 
-        cindex=identifyPoles(LAMBD)       
-        # Building System Matrix
-        Dk=np.zeros((N,n),dtype=np.complex128)
-        for m in range(n):
-            if cindex[m]==0:
-                # real pole defined
-                #if(s.type=="str" or LAMBD[m,m].type=="str"):
-                #    wyz111 = -1
-                #else:
-                Dk[:,m]=1/(s-LAMBD[m,m])
-            elif cindex[m]==1:
-                #complex pole first part defined
-                Dk[:,m]=1/(s-LAMBD[m,m])+1/(s-np.conj(LAMBD[m,m]))
-                Dk[:,m+1]=1j/(s-LAMBD[m,m])-1j/(s-np.conj(LAMBD[m,m]))
-        # Depending on the D and E option selected
-        if offs==0 or offs==1: 
-            # for E=0
-            Dk=np.hstack((Dk,np.ones((N,1)))) #note that Dk.shape changed to (N,n+1)
-        else:
-            # for E!=0
-            Dk=np.hstack((Dk,np.ones((N,1))))
-            Dk=np.hstack((Dk,np.reshape(s,(N,1)))) #note that Dk.shape changed to (N,n+2)
-        # Scaling for last row of LS-Problem
-        scale=0
-        for m in range(Nc):
-            if commonWeighting:
-                scale+=np.linalg.norm(weights*F[m,:])**2
-            else:
-                scale+=np.linalg.norm(weights[m,:]*F[m,:])**2
-        scale=np.sqrt(scale)/N
-        # Applying relaxed version of the algorithm
-        if opts["relax"]:
-            AA=np.zeros((Nc*(n+1),n+1),dtype=np.float64)
-            bb=np.zeros(Nc*(n+1),dtype=np.float64)
-            Escale=np.zeros(n+1,dtype=np.float64)
-            offset=n+offs
-            for k in range(Nc):
-                Ac=np.zeros((N,offset+n+1),dtype=np.complex128)
-                if commonWeighting:
-                    weig=weights
-                else:
-                    weig=weights[k,:]
-                for m in range(offset): #left block
-                    Ac[:,m]=weig*Dk[:,m]
-                for m in range(n+1): #right block
-                    Ac[:,offset+m]=-weig*Dk[:,m]*F[k,:]
-                # Partitioned problem in real and imaginary part, a real array is obtained:
-                A=np.vstack((Ac.real,Ac.imag))
-                # Integral criterion for sigma
-                if k==Nc-1:
-                    A=np.vstack((A,np.zeros((1,A.shape[1])))) # adding extra row    
-                    for m in range(n+1):
-                        A[2*N,offset+m]=np.real(scale*np.sum(Dk[:,m]))
-                # Obtaining QR transformation of A
-                (Q,R)=qr(A,mode="economic") #routine imported from scipy module
-                R22=R[offset:offset+n+1,offset:offset+n+1]
-                AA[k*(n+1):(k+1)*(n+1),:]=R22
-                if k==Nc-1:
-                    bb[k*(n+1):(k+1)*(n+1)]=Q[-1,offset:]*N*scale
-            for m in range(AA.shape[1]):
-                Escale[m]=1/np.linalg.norm(AA[:,m])
-                AA[:,m]=Escale[m]*AA[:,m]
-            # LS solution routine imported from scipy module: 
-            #   - check_finite option is disabled to improve performance. NaN should not appear into the arrays
-            #   - gelsy lapack driver is chosen because is slightly faster than default ("gelsd")
-            # The routine returns a tuple (solution,residues,rank,svalues), however just the solution is taken: 
-            x=lstsq(AA,bb, check_finite=False, lapack_driver="gelsy")[0] # solution <- result[0]
-            x=x*Escale
-        # ...end of opts["relax"]=True segment
-        # Case for non relaxion version of the algorithm.
-        # Also may be needed when D of sigma results extremely small and large. I needs to be solved again.  
-        if not(opts["relax"]) or np.abs(x[-1])<TOLlow or np.abs(x[-1])>TOLhigh:
-            AA=np.zeros((Nc*n,n),dtype=np.float64)
-            bb=np.zeros(Nc*n,dtype=np.float64)
-            if opts["relax"]:
-                Dnew=1
-            else:
-                if x[-1]==0:
-                    Dnew=1
-                elif np.abs(x[-1])<TOLlow:
-                    Dnew=np.sign(x[-1])*TOLlow
-                elif np.abs(x[-1])>TOLhigh:
-                    Dnew=np.sign(x[-1])*TOLhigh
-            offset=n+offs
-            for k in range(Nc):
-                Ac=np.zeros((N,offset+n),dtype=np.complex128)
-                Escale=np.zeros(n,dtype=np.float64)
-                if commonWeighting:
-                    weig=weights
-                else:
-                    weig=weights[k,:]
-                for m in range(offset): #left block
-                    Ac[:,m]=weig*Dk[:,m]
-                for m in range(n): #right block
-                    Ac[:,offset+m]=-weig*Dk[:,m]*F[k,:]
-                bc=Dnew*weig*F[k,:]
-                # Partitioned problem in real and imaginary part, real arrays are obtained:
-                A=np.vstack((Ac.real,Ac.imag))
-                b=np.append(bc.real,bc.imag)
-                # Obtaining QR transformation of A
-                (Q,R)=qr(A,mode="economic")
-                R22=R[offset:offset+n,offset:offset+n]
-                AA[k*n:(k+1)*n,:]=R22
-                # The following arrays must be reshaped in order to perform the matrix product
-                bb[k*n:(k+1)*n]=np.ravel(np.transpose(Q[:,offset:offset+n])@np.reshape(b,(b.size,1)))
-            for m in range(AA.shape[1]):
-                Escale[m]=1/np.linalg.norm(AA[:,m])
-                AA[:,m]=Escale[m]*AA[:,m]
-            # LS solution routine imported from scipy module: 
-            #   - check_finite option is disabled to improve performance. NaN should not appear into the arrays
-            #   - gelsy lapack driver is chosen because is slightly faster than default ("gelsd")
-            # The routine returns a tuple (solution,residues,rank,svalues), however just the solution is taken: 
-            x=lstsq(AA,bb, check_finite=False, lapack_driver="gelsy")[0] # solution <- result[0]
-            x=x*Escale
-            x=np.append(x,Dnew)
-        # ...end of opts["relax"]=False or out of tolerance segment
-        # Changing back to make C complex:    
-        C=np.zeros(x.size-1,dtype=np.complex128)    
-        C[0:C.size]=x[0:-1]
-        D=x[-1]
-        for m in range(n):
-            if cindex[m]==1:
-                r1=C[m] #real part of the complex number
-                r2=C[m+1] #imaginary part of the complex number
-                #building the conjugated complex pair
-                C[m]=r1+1j*r2
-                C[m+1]=r1-1j*r2
-        # Graphs of initial stage of vector fitting process
-        if opts["spy1"]:
-            print("\nvectfit3::spy1_Enabled::Building and showing graph for initial fitting state...")
-            # First fitting state evaluation: 
-            # As mentioned in [1] pole identification begins with the aproximation of sigma(s). sigma(s) is an unknown function whose  
-            #approximation has the same poles of F(s). Furtheremore it is formulated that (sigma*f)_fit(s) = sigma_fit*f(s), whence can be
-            #demostrated that zeros of sigma are a better set of poles to fit f(s), therefore sigma(s) is called the initial fitting state.
-            Dk=np.zeros((N,n),dtype=np.complex128)
-            for m in range(n):
-                Dk[:,m]=1/(s-LAMBD[m,m])
-            sigma=D+Dk@C
-            #setting temporal options to plot initial vector fitting state
-            opts_temp=opts
-            opts_temp["errplot"]=False
-            opts_temp["phaseplot"]=False
-            #vectfitPlot(F,sigma,s,opts_temp,True)#wyz
-        # Calculating the zeros for sigma
-        m=0 #auxiliar counter
-        for k in range(n):
-            if m<n:
-                if np.abs(LAMBD[m,m])>np.abs(np.real(LAMBD[m,m])):
-                    # Complex poles clasification: diagonal blocks of the form: 
-                    # [ real, -imag ]
-                    # [ imag,  real ]
-                    LAMBD[m+1,m]=-np.imag(LAMBD[m,m])
-                    LAMBD[m,m+1]=np.imag(LAMBD[m,m])
-                    LAMBD[m,m]=np.real(LAMBD[m,m])
-                    LAMBD[m+1,m+1]=LAMBD[m,m]
-                    # B vector modification for  complex poles
-                    B[m,0]=2
-                    B[m+1,0]=0
-                    ccval=C[m]
-                    # Complex values clasification:
-                    C[m]=np.real(ccval)
-                    C[m+1]=np.imag(ccval)
-                    m+=1
-            m+=1
-        #to perform the vectorized B*C and obtain a matrix C need to be reshaped
-        C=np.reshape(C,(1,C.size))
-        #also just the real parts of LAMBD and C are taken in order to obtain a real[float64] matrix for ZER
-        ZER=LAMBD.real-B@C.real/D
-        # Computation of ZER eigenvalues
-        poles=eigvals(ZER) #routine imported from scipy module
-        # Unstabla values identification
-        unstable=poles.real>0 #generates a logical array
-        if opts["stable"]:
-            if np.any(unstable):
-                #the product of roetter and unstable extracts the unstable poles
-                extracted=poles*unstable
-                poles=poles-2*extracted.real
-        poles=sortPoles(poles)
+    if not(opts.skip_pole):
+        poles=poleIdentification(F,s,poles,weights,opts)
         SERA=poles
     #...end of poles identification process
         
     # --* RESIDUES IDENTIFICATION PROCESS
     
-    if not(opts["skip_res"]):
+    if not(opts.skip_res):
         # Now SER for f is calculated by using modified zeros of sigma as new poles:
-        LAMBD=np.diag(poles)
-        # Initial complex poles identification: cindex marks 0 for reals, 1 and 2 for complex conjugated pairs 
-        cindex=identifyPoles(LAMBD)
-        # Building System Matrix
-        Dk=np.zeros((N,n),dtype=np.complex128)
-        for m in range(n):
-            if cindex[m]==0:
-                # real pole defined
-                Dk[:,m]=1/(s-LAMBD[m,m])
-            elif cindex[m]==1:
-                #complex pole first part defined
-                Dk[:,m]=1/(s-LAMBD[m,m])+1/(s-np.conj(LAMBD[m,m]))
-                Dk[:,m+1]=1j/(s-LAMBD[m,m])-1j/(s-np.conj(LAMBD[m,m]))
-        if commonWeighting: #case for common wighting
-            C=np.zeros((Nc,n),dtype=np.complex128)
-            for m in range(n): #same weight for all frequency samples
-                Dk[:,m]=weights*Dk[:,m]
-            # The SER for the new fitting is calculated by using the calculated zeros as new poles
-            if opts["asymp"]==1:
-                A=np.zeros((2*N,n),dtype=np.float64)
-                A[0:N,:]=Dk.real
-                A[N:2*N,:]=Dk.imag
-            elif opts["asymp"]==2:
-                A=np.zeros((2*N,n+1),dtype=np.float64)
-                A[0:N,0:n]=Dk.real
-                A[N:2*N,0:n]=Dk.imag
-                A[0:N,n]=weights
-            else:
-                A=np.zeros((2*N,n+2),dtype=np.float64)
-                A[0:N,0:n]=Dk.real
-                A[N:2*N,0:n]=Dk.imag
-                A[0:N,n]=weights
-                A[N:2*N,n+1]=np.imag(weights*s)
-            BB=np.zeros((2*N,Nc),dtype=np.float64)
-            BBc=np.zeros((N,Nc),dtype=np.complex128)
-            for m in range(Nc):
-                BBc[:,m]=weights*F[m,:] #complex values for BB
-            BB[0:N,:]=BBc.real
-            BB[N:2*N,:]=BBc.imag
-            Escale=np.zeros(A.shape[1],dtype=np.float64)
-            for m in range(A.shape[1]):
-                Escale[m]=np.linalg.norm(A[:,m])
-                A[:,m]=A[:,m]/Escale[m]
-            # LS solution routine imported from scipy module: 
-            #   - check_finite option is disabled to improve performance. NaN should not appear into the arrays
-            #   - gelsy lapack driver is chosen because is slightly faster than default ("gelsd")
-            # The routine returns a tuple (solution,residues,rank,svalues), however just the solution is taken:   
-            x=lstsq(A,BB, check_finite=False, lapack_driver="gelsy")[0] # solution <- result[0]
-            for m in range(Nc):
-                x[:,m]=x[:,m]/Escale
-            x=np.transpose(x)
-            C[:,0:n]=x[:,0:n]
-            if opts["asymp"]==2:
-                SERD=x[:,n]
-            elif opts["asymp"]==3:
-                SERD=x[:,n]
-                SERE=x[:,n+1]
-        else: #no common wighting used    
-            C=np.zeros((Nc,n),dtype=np.complex128)
-            for k in range(Nc):
-                # The SER for the new fitting is calculated by using the calculated zeros as new poles
-                if opts["asymp"]==1:
-                    A=np.zeros((2*N,n),dtype=np.float64)
-                    A[0:N,:]=Dk.real
-                    A[N:2*N,:]=Dk.imag
-                elif opts["asymp"]==2:
-                    A=np.zeros((2*N,n+1),dtype=np.float64)
-                    A[0:N,0:n]=Dk.real
-                    A[N:2*N,0:n]=Dk.imag
-                    A[0:N,n]=1
-                else: #for asymp==3
-                    A=np.zeros((2*N,n+2),dtype=np.float64)
-                    A[0:N,0:n]=Dk.real
-                    A[N:2*N,0:n]=Dk.imag
-                    A[0:N,n]=1
-                    A[N:2*N,n+1]=np.imag(s)
-                for m in range(A.shape[1]):
-                    A[0:N,m]=weights[k,:]*A[0:N,m]
-                    A[N:2*N,m]=weights[k,:]*A[N:2*N,m]
-                BB=np.zeros(2*N,dtype=np.float64)
-                BBc=np.zeros(N,dtype=np.complex128) #complex values for BB
-                BBc=weights[k,:]*F[k,:]
-                BB[0:N]=BBc.real
-                BB[N:2*N]=BBc.imag
-                Escale=np.zeros(A.shape[1],dtype=np.float64)
-                for m in range(A.shape[1]):
-                    Escale[m]=np.linalg.norm(A[:,m])
-                    A[:,m]=A[:,m]/Escale[m]
-                # LS solution routine imported from scipy module: 
-                #   - check_finite option is disabled to improve performance. NaN should not appear into the arrays
-                #   - gelsy lapack driver is chosen because is slightly faster than default ("gelsd")
-                # The routine returns a tuple (solution,residues,rank,svalues), however just the solution is taken: 
-                x=lstsq(A,BB, check_finite=False, lapack_driver="gelsy")[0] # solution <- result[0]
-                x/=Escale
-                C[k,:]=x[0:n]
-                if opts["asymp"]==2:
-                    SERD[k]=x[n]
-                elif opts["asymp"]==3:
-                    SERD[k]=x[n]
-                    SERE[k]=x[n+1]
-        #...end of wighting options for residue computation
-        # Changing back to make C complex:
-        for m in range(n):
-            if cindex[m]==1:
-                for k in range(Nc):
-                    r1=C[k,m] #real part of the complex number
-                    r2=C[k,m+1] #imaginary part of the complex number
-                    #bulding the conjugated complex pair:
-                    C[k,m]=r1+1j*r2 
-                    C[k,m+1]=r1-1j*r2
-        # New fitting evaluation:
-        SERA=np.diag(LAMBD)   
-        SERC=C
-        for m in range(n):
-            Dk[:,m]=1/(s-SERA[m])
-        for k in range(Nc):
-            fit[k,:]=Dk@SERC[k,:]
-            if opts["asymp"]==2:
-                fit[k,:]=fit[k,:]+SERD[k]
-            elif opts["asymp"]==3:
-                fit[k,:]=fit[k,:]+SERD[k]+s*SERE[k]
-        # Root mean squared error computation:
-        diff=fit-F #diferrences between samples and the fitted function
-        rmserr=np.sqrt(np.sum(np.sum(np.abs(diff**2))))/np.sqrt(Nc*N)
-        
+        (SERC,SERD,SERE,fit,rmserr)=residueIdentification(F,s,poles,weights,opts)
+        SERA=poles
         # - Graphs generation for vector fitting results:
-        if opts["spy2"]:
+        if opts.spy2:
             print("\nvectfit3::spy2_Enabled::Building and showing graphs for the results...")
             #wyz vectfitPlot(F,fit,s,opts)
     #...end of residue identification process
@@ -889,7 +2007,410 @@ def vectfit(F,s,poles,weights,opts=opts):
     C=SERC
     D=SERD
     E=SERE
-    SER=buildSER(A,B,C,D,E,opts["cmplx_ss"],opts["symm_mat"], opts["RMO_data"])
+    SER=buildSER(A,B,C,D,E,opts.cmplx_ss,opts.symm_mat, opts.RMO_data)
     
     # Vector fitting process finished.
-    return (SER,poles,rmserr,fit)
\ No newline at end of file
+    return (SER,poles,rmserr,fit)
+
+def vectfit_iterate(F,s,poles,weights,opts=None,Niter=10,poletol=1e-6,rmstol=0.0,stats=None,callback=None):
+    """ 
+    vectfit_iterate(): Function to apply vector fitting iteratively with convergence based early stopping. 
+    Poles are relocated up to Niter times by the poles identification process of vectfit(), and residues and the fitted 
+    function are computed once at the end with the final poles. Temporary arrays are reused among the iterations.
+    
+    Arguments. Same as vectfit() and the following stop conditions:
+    
+        - Niter: Maximum number of poles relocation iterations
+        - poletol: Relative tolerance for poles movement. Iterations stop when max(|new-old|/|old|) < poletol
+        - rmstol: Tolerance for the root mean squared error. Iterations stop when rmserr < rmstol. Residues need to be 
+            identified in every iteration to evaluate it, so the default rmstol=0 disables this condition
+        - callback: (optional) Function called as callback(itr,poles,moved) after each poles relocation, with the number 
+            of iterations applied, the new poles and max(|new-old|/|old|) (inf for the first one). It records the 
+            convergence history without identifying residues in every iteration
+        
+        opts.skip_res is ignored because residues are always computed at the end. Graphs enabled by opts are 
+        built only for the final results
+    
+    Output variables. linked as a tuple
+    
+        - SER, poles, rmserr, fit: Same as vectfit()
+        - Nitr: Number of poles relocation iterations applied
+    """
+    if stats is not None:
+        with stats:
+            return vectfit_iterate(F,s,poles,weights,opts,Niter,poletol,rmstol,callback=callback)
+    # Entry errors cheking
+    opts=checkOptions(opts)
+    if opts is None or dim_errorCheck(F,s,np.atleast_1d(poles),weights):
+        print("vecfit_iterate() not lunched due to and entry error!")
+        return False
+    if np.ndim(poles)==0: # order of aproximation given instead of the initial poles
+        poles=initialPoles(F,s,int(poles),weights)
+    checkInitialPoles(s,poles)
+    N=s.size
+    if len(F.shape)==1:
+        F=np.reshape(F,(1,N))
+    opts_iter=opts.replace(spy2=False)
+    work={} # workspace reused among iterations
+    res=None # residues identified for the last poles computed
+    Nitr=0
+    if not(opts.skip_pole):
+        for itr in range(Niter):
+            newpoles=poleIdentification(F,s,poles,weights,opts_iter,work)
+            Nitr+=1
+            # Poles movement. Poles are compared after the first relocation because sortPoles() gives them a known order
+            moved=np.max(np.abs(newpoles-poles)/np.abs(poles)) if itr>0 else np.inf
+            poles=newpoles
+            res=None
+            if callback is not None:
+                callback(Nitr,poles,moved)
+            if moved<poletol:
+                break
+            if rmstol>0:
+                res=residueIdentification(F,s,poles,weights,opts_iter)
+                if res[4]<rmstol:
+                    break
+    if res is None:
+        res=residueIdentification(F,s,poles,weights,opts)
+    (SERC,SERD,SERE,fit,rmserr)=res
+    # - Graphs generation for vector fitting results:
+    if opts.spy2:
+        print("\nvectfit3::spy2_Enabled::Building and showing graphs for the results...")
+        #wyz vectfitPlot(F,fit,s,opts)
+    SER=buildSER(np.diag(poles),np.ones((poles.size,1),np.float64),SERC,SERD,SERE,opts.cmplx_ss,opts.symm_mat,opts.RMO_data)
+    return (SER,poles,rmserr,fit,Nitr)
+
+def vectfit_order(F,s,weights,orders,rmstol,opts=None,Niter=10,poletol=1e-6,poles=None):
+    """ 
+    vectfit_order(): Function to select the order of approximation automatically. Candidate orders are fitted by 
+    vectfit_iterate() in ascending order and the smallest one whose rmserr is under rmstol is selected. Candidates are 
+    fitted in groups of as many orders as workers of the execution backend set in opts, and the candidates of each group 
+    are warm-started from the poles of the largest order of the previous group, extended with new poles at the 
+    frequencies where its fitting error is larger. Remaining groups are not fitted once a candidate reaches rmstol.
+    
+    Arguments.
+    
+        - F, s, weights: Same as vectfit()
+        - orders: Candidate orders of approximation. They are fitted in ascending order
+        - rmstol: Target for the root mean squared error of the fitting
+        - opts: (optional) VFOptions or dictionary with the configuration of vectfit. Each candidate is fitted serially, the
+            backend options distribute the candidates among the workers instead
+        - Niter, poletol: Stop conditions of vectfit_iterate() for each candidate
+        - poles: (optional) Searching poles for the smallest candidate order. The other candidates of the first group start 
+            from the poles estimated by initialPoles()
+    
+    Output variables. linked as a tuple
+    
+        - SER, poles, rmserr, fit: Same as vectfit() for the selected order. The order is poles.size. If no candidate 
+            reaches rmstol the one with the smallest rmserr is returned
+        - errors: Dictionary with the rmserr of each fitted candidate order
+    """
+    opts=checkOptions(opts)
+    if opts is None:
+        print("vecfit_order() not lunched due to and entry error!")
+        return False
+    orders=sorted(set(int(n) for n in orders))
+    N=s.size
+    if len(F.shape)==1:
+        F=np.reshape(F,(1,N))
+    opts_cand=opts.replace(backend="serial",spy2=False)
+    workers=elementWorkers(opts)
+    errors={}
+    best=None; base=None
+    for g in range(0,len(orders),workers):
+        group=orders[g:g+workers]
+        # Searching poles of the candidates: warm start from the largest order of the previous group when it is available
+        if base is None:
+            starts=[initialPoles(F,s,n,weights) for n in group]
+            if poles is not None:
+                starts[0]=np.ravel(poles)
+        else:
+            err=np.sum(np.abs(base[3]-F)**2,axis=0)
+            starts=[addPoles(base[1],s,err,n-base[1].size) for n in group]
+        results=elementMap(orderChunk,[(k,k+1) for k in range(len(group))],(F,s,weights),(starts,opts_cand,Niter,poletol),opts)
+        results=[res[0] for res in results]
+        for n,res in zip(group,results):
+            errors[n]=res[2]
+            if best is None or res[2]<best[2]:
+                best=res
+        selected=[res for res in results if res[2]<rmstol]
+        if selected:
+            best=selected[0]
+            break
+        base=results[-1]
+    else:
+        print("vectfit3::WARNING::rmstol was not reached by the candidate orders. The best fitting is returned")
+    (SER,poles,rmserr,fit,_)=best
+    # - Graphs generation for vector fitting results:
+    if opts.spy2:
+        print("\nvectfit3::spy2_Enabled::Building and showing graphs for the results...")
+        #wyz vectfitPlot(F,fit,s,opts)
+    return (SER,poles,rmserr,fit,errors)
+
+def aaafit(F,s,poles,weights,opts=None,tol=1e-13):
+    """ 
+    aaafit(): Function to compute a rational aproximation in the frequency domain with the AAA algorithm [5]. It has the 
+    same arguments and results as vectfit(), so both fitters can be exchanged. Support points are chosen greedily and no 
+    initial poles are needed, so a single call replaces the repeated calls of vectfit. All the elements share the 
+    barycentric weights of the approximation (set-valued AAA), so matrix functions get a common set of poles. The poles 
+    are made real or complex conjugated pairs by realPoles(), and the residues are identified by the residues 
+    identification stage of vectfit, so D, E and the state-space model follow the configuration in opts.
+    
+    Arguments. Same as vectfit() except:
+    
+        - poles: Maximum order of aproximation n. An array of initial poles is also accepted, just its size is used
+        - tol: Relative tolerance for the AAA approximation of the weighted and normalized elements of F(s). Support 
+            points are added until max|F-r| < tol*max|F| or the maximum order is reached
+        
+        opts.skip_pole and opts.skip_res are ignored. The order of the model may be lower than n when tol is reached before
+    
+    Output variables. linked as a tuple
+    
+        - SER, poles, rmserr, fit: Same as vectfit()
+    """
+    opts=checkOptions(opts)
+    if opts is None or dim_errorCheck(F,s,np.atleast_1d(poles),weights):
+        print("aaafit() not lunched due to and entry error!")
+        return False
+    n=int(poles) if np.ndim(poles)==0 else np.size(poles)
+    N=s.size
+    if len(F.shape)==1:
+        F=np.reshape(F,(1,N))
+    norms=np.linalg.norm(F,axis=1)
+    norms[norms==0]=1
+    (poles,residues,_)=mirroredAAA(s,weights*F/norms[:,None],n+1,tol)
+    poles=sortPoles(realPoles(poles,residues,n,opts.stable))
+    (SERC,SERD,SERE,fit,rmserr)=residueIdentification(F,s,poles,weights,opts)
+    # - Graphs generation for vector fitting results:
+    if opts.spy2:
+        print("\nvectfit3::spy2_Enabled::Building and showing graphs for the results...")
+        #wyz vectfitPlot(F,fit,s,opts)
+    SER=buildSER(np.diag(poles),np.ones((poles.size,1),np.float64),SERC,SERD,SERE,opts.cmplx_ss,opts.symm_mat,opts.RMO_data)
+    return (SER,poles,rmserr,fit)
+
+def vectfit_bands(F,s,weights,bands,n,opts=None,Niter=5,overlap=0.1,Nglobal=0):
+    """ 
+    vectfit_bands(): Function to fit very wideband data by frequency sub-bands. The samples are split in overlapping 
+    sub-bands with the same number of samples, and each band is fitted by vectfit_iterate() with a modest order n. Bands are
+    distributed among the workers of the execution backend set in opts, so with the "process" backend each band is fitted 
+    in its own process. The poles of each band whose frequency |Im(p)| (|p| for real poles) lies in the band without the 
+    overlap are kept, since the rest just approximate the samples out of the band. The merged set of poles is used in a 
+    final global residues identification for all the samples, which gives a single model of order up to bands*n. Optionally,
+    the merged poles can be relocated with all the samples by a few global iterations before it.
+    
+    Arguments.
+    
+        - F, s, weights: Same as vectfit()
+        - bands: Number of frequency sub-bands
+        - n: Order of aproximation of each band
+        - opts: (optional) VFOptions or dictionary with the configuration of vectfit. Each band is fitted serially, the 
+            backend options distribute the bands among the workers instead
+        - Niter: Number of poles relocation iterations of each band
+        - overlap: Fraction of the samples of each band added at both sides of it
+        - Nglobal: Number of global poles relocation iterations applied to the merged poles
+    
+    Output variables. linked as a tuple
+    
+        - SER, poles, rmserr, fit: Same as vectfit() for the merged model
+    """
+    opts=checkOptions(opts)
+    if opts is None or dim_errorCheck(F,s,np.zeros(n),weights):
+        print("vecfit_bands() not lunched due to and entry error!")
+        return False
+    N=s.size
+    if len(F.shape)==1:
+        F=np.reshape(F,(1,N))
+    (bounds,cores)=bandLimits(s,bands,overlap)
+    opts_band=opts.replace(backend="serial",spy2=False)
+    results=elementMap(bandChunk,[(b,b+1) for b in range(bands)],(F,s,weights),(bounds,n,opts_band,Niter),opts)
+    # Merging the poles of the bands
+    poles=[]
+    for (w0,w1),res in zip(cores,results):
+        bandpoles=res[0]
+        w=np.where(bandpoles.imag!=0,np.abs(bandpoles.imag),np.abs(bandpoles))
+        poles.append(bandpoles[(w>=w0)&(w<w1)])
+    poles=sortPoles(np.concatenate(poles))
+    work={} # workspace reused among the global iterations
+    for _ in range(Nglobal):
+        poles=poleIdentification(F,s,poles,weights,opts,work)
+    # Global residues identification with the merged poles
+    (SERC,SERD,SERE,fit,rmserr)=residueIdentification(F,s,poles,weights,opts)
+    # - Graphs generation for vector fitting results:
+    if opts.spy2:
+        print("\nvectfit3::spy2_Enabled::Building and showing graphs for the results...")
+        #wyz vectfitPlot(F,fit,s,opts)
+    SER=buildSER(np.diag(poles),np.ones((poles.size,1),np.float64),SERC,SERD,SERE,opts.cmplx_ss,opts.symm_mat,opts.RMO_data)
+    return (SER,poles,rmserr,fit)
+
+def arrayChunks(F,s,weights,size):
+    """ 
+    arrayChunks(): Function to build the chunks source of vectfit_stream() from sample arrays. F may be a numpy.memmap of an 
+    on-disk file, in which case only the frequency chunk being processed is read into memory.
+    
+    Arguments.
+    
+        - F: F(s) samples [Nc x N] or [N]
+        - s: Complex frequency points of evaluation [N]
+        - weights: Common [N] or individual [Nc x N] weights
+        - size: Number of frequency points of each chunk
+        
+    Output. Function returning a fresh generator of tuples (s,F,weights) with the chunks, as needed by vectfit_stream()
+    """
+    def chunks():
+        for k0 in range(0,s.size,size):
+            k1=min(k0+size,s.size)
+            weig=weights[k0:k1] if weights.ndim==1 else np.asarray(weights[:,k0:k1])
+            yield (s[k0:k1],np.atleast_2d(np.asarray(F[...,k0:k1])),weig)
+    return chunks
+
+def vectfit_stream(chunks,poles,opts=None,Niter=1,poletol=0.0):
+    """ 
+    vectfit_stream(): Out of core version of vectfit_iterate() for data sets that do not fit in memory. Samples are read by 
+    frequency chunks and the LS-problems are reduced by incremental QR factorizations (TSQR), so memory depends on the chunk 
+    size and the order of approximation but not on the number of frequency points. Each poles relocation and the residues 
+    identification read the chunks once, and the fitting error needs a last pass.
+    
+    Arguments.
+    
+        - chunks: Function returning a fresh iterable of tuples (s,F,weights) with consecutive chunks of the samples, 
+            F [Nc x Nk], s [Nk] and weights [Nk] or [Nc x Nk]. It is called once per pass, see arrayChunks()
+        - poles: Initial searching poles [n]
+        - opts: (optional) VFOptions or dictionary with the configuration of vectfit. Graphs are not available
+        - Niter: Maximum number of poles relocation iterations
+        - poletol: Relative tolerance for poles movement. Iterations stop when max(|new-old|/|old|) < poletol
+    
+    Output variables. linked as a tuple
+    
+        - SER: Same as vectfit()
+        - poles: New poles of F(s) [n]
+        - rmserr: Root mean squared error of the fitting. -1 when opts.skip_res is True
+        - Nitr: Number of poles relocation iterations applied
+        
+        The fitted function is not returned, evaluate() can compute it by chunks from SER.
+    """
+    opts=checkOptions(opts)
+    if opts is None:
+        print("vecfit_stream() not lunched due to and entry error!")
+        return False
+    poles=np.ravel(poles)
+    s0=next(iter(chunks()))[0]
+    checkInitialPoles(s0,poles)
+    Nitr=0
+    if not(opts.skip_pole):
+        for itr in range(Niter):
+            newpoles=streamPoleIdentification(chunks,poles,opts)
+            Nitr+=1
+            # Poles are compared after the first relocation because sortPoles() gives them a known order
+            moved=np.max(np.abs(newpoles-poles)/np.abs(poles)) if itr>0 else np.inf
+            poles=newpoles
+            if moved<poletol:
+                break
+    if not(opts.skip_res):
+        (SERC,SERD,SERE,rmserr)=streamResidueIdentification(chunks,poles,opts)
+    else:
+        Nc=np.atleast_2d(next(iter(chunks()))[1]).shape[0]
+        SERC=np.zeros((Nc,poles.size),dtype=np.complex128)
+        SERD=np.zeros(Nc,dtype=np.float64)
+        SERE=np.zeros(Nc,dtype=np.float64)
+        rmserr=-1
+    SER=buildSER(np.diag(poles),np.ones((poles.size,1),np.float64),SERC,SERD,SERE,opts.cmplx_ss,opts.symm_mat,opts.RMO_data)
+    return (SER,poles,rmserr,Nitr)
+
+class IncrementalFit:
+    """
+    IncrementalFit: Vector fitting of a data set that grows with new frequency samples, as the sweeps of an EM solver which
+    produces more frequency points after a model already exists. The R factors of the relaxed LS-problems of the poles 
+    identification are kept as in vectfit_stream() for the searching poles of the last poles relocation, so appended 
+    samples are folded into them by QR row updates (TSQR) and the first relocation of the next fitting does not factorize 
+    the previous samples again: appending 10% more samples costs about 10% of a vectfit() iteration. The factors are 
+    rebuilt over all the samples only for the extra relocations requested by the caller, with Niter>1 or with a new 
+    fit() without new samples. The residues identification is solved over all the samples, which is a single LS-problem 
+    shared by the elements for common weights.
+    
+    Usage.
+    
+        inc=IncrementalFit(poles,opts)
+        inc.append(F,s,weights)
+        (SER,poles,rmserr,fit)=inc.fit(Niter=5)
+        inc.append(Fnew,snew,weights_new) # new frequency samples
+        (SER,poles,rmserr,fit)=inc.fit()  # one relocation from the updated R factors
+    
+    Attributes.
+    
+        - opts: VFOptions with the configuration of vectfit. Graphs are not available
+        - poles: Poles of the last fitting, or the initial searching poles [n]
+        - factors: R factors of the relaxed LS-problems of all the samples for the searching poles factors["poles"] of the 
+            last relocation, see poleFactors(). None before the first append
+        - fresh: True when samples were appended after the last relocation, so the factors hold new information
+    """
+    def __init__(self,poles,opts=None):
+        self.opts=checkOptions(opts)
+        self.poles=np.array(poles,dtype=np.complex128).ravel()
+        self.factors=None
+        self.fresh=False
+        self.samples=[]
+
+    def append(self,F,s,weights):
+        """Function to add the frequency samples F(s) with their weights (same arguments as vectfit()) and fold them into 
+           the R factors at their searching poles. The cost grows with the number of new samples only.
+            *Returns True, or False if an entry error is found"""
+        if self.opts is None or dim_errorCheck(F,s,self.poles,weights):
+            print("IncrementalFit.append() not lunched due to and entry error!")
+            return False
+        F=np.atleast_2d(F)
+        if self.factors is None:
+            checkInitialPoles(s,self.poles)
+        self.samples.append((s,F,weights))
+        self.factors=poleFactors(lambda: [(s,F,weights)],self.poles,self.opts,self.factors)
+        self.fresh=True
+        return True
+
+    def data(self):
+        """Function to get all the samples appended so far, in order of addition.
+            *Returns a tuple (F,s,weights) as the arguments of vectfit()"""
+        s=np.concatenate([smp[0] for smp in self.samples])
+        F=np.concatenate([smp[1] for smp in self.samples],axis=1)
+        weights=np.concatenate([smp[2] for smp in self.samples],axis=-1)
+        return (F,s,weights)
+
+    def fit(self,Niter=1,poletol=0.0):
+        """Function to fit all the samples appended so far. The first poles relocation is computed from the accumulated R 
+           factors when new samples were appended since the last relocation. The other relocations, the extra iterations 
+           requested by Niter>1 or by calling fit() again without new samples, rebuild the factors for the current poles 
+           over all the samples, which is the cost of a vectfit() iteration.
+           
+           Arguments.
+           
+            - Niter: Maximum number of poles relocation iterations
+            - poletol: Relative tolerance for poles movement. Iterations stop when max(|new-old|/|old|) < poletol
+            
+           Results. Same as vectfit(): (SER,poles,rmserr,fit)
+        """
+        opts=self.opts
+        if self.factors is None:
+            print("IncrementalFit.fit() not lunched: no samples were appended!")
+            return False
+        (F,s,weights)=self.data()
+        if not(opts.skip_pole):
+            for itr in range(Niter):
+                poles=self.poles
+                if not(self.fresh):
+                    self.factors=poleFactors(lambda: [(s,F,weights)],poles,opts)
+                self.poles=factorPoles(self.factors,opts)
+                self.fresh=False
+                # Poles are compared after the first relocation because sortPoles() gives them a known order
+                moved=np.max(np.abs(self.poles-poles)/np.abs(poles)) if itr>0 else np.inf
+                if moved<poletol:
+                    break
+        poles=self.poles
+        if not(opts.skip_res):
+            (SERC,SERD,SERE,fit,rmserr)=residueIdentification(F,s,poles,weights,opts)
+        else:
+            Nc=F.shape[0]
+            SERC=np.zeros((Nc,poles.size),dtype=np.complex128)
+            SERD=np.zeros(Nc,dtype=np.float64)
+            SERE=np.zeros(Nc,dtype=np.float64)
+            fit=np.zeros((Nc,s.size),dtype=np.complex128)
+            rmserr=-1
+        SER=buildSER(np.diag(poles),np.ones((poles.size,1),np.float64),SERC,SERD,SERE,opts.cmplx_ss,opts.symm_mat,opts.RMO_data)
+        return (SER,poles,rmserr,fit)
@@ -0,0 +1,213 @@
+### Benchmark suite of the Vector Fitting algorithm implemented in vectfit3.py ###
+
+# The five test cases of vectfit_testing.py are run without graphs on the bundled data sets, and wall time, peak of traced
+#memory and fitting error are recorded for each case. Results are compared against a stored baseline to find speed or
+#accuracy regressions after changes to vectfit3.py.
+#
+# Usage:
+#   python vectfit_benchmark.py                 # run all cases and compare against vectfit_benchmark.json
+#   python vectfit_benchmark.py --save          # run all cases and store the results as the new baseline
+#   python vectfit_benchmark.py --cases 4 5     # run some cases only
+#
+# The exit status is 1 when a regression is found, so the suite can be used in scripts. Times depend on the machine, so the
+#baseline should be saved on the machine where the comparison is made.
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+import pandas as pd
+from scipy.constants import pi
+from vectfit3 import vectfit, vectfit_iterate, VFOptions, VFStats
+
+DATA_DIR=os.path.join(os.path.dirname(os.path.abspath(__file__)),"Vector_Fitting_for_python-master") # bundled .csv files
+BASELINE=os.path.join(os.path.dirname(os.path.abspath(__file__)),"vectfit_benchmark.json")
+
+### -------------------------------------------------------------- Test cases ---------------------------------------------------------------- ###
+# Each case builds its samples once and returns a function which applies the fittings of vectfit_testing.py.
+# The function returns the final rmserr
+
+def complexPoles(w0,w1,n,div=100,log=False):
+    """Starting poles as complex conjugated pairs distributed linearly or logarithmically over [w0,w1]. For odd orders the
+       last pole is left at the origin, as in vectfit_testing.py"""
+    m=int(n/2)
+    Bet=np.logspace(np.log10(w0),np.log10(w1),m) if log else np.linspace(w0,w1,m)
+    poles=np.zeros(n,dtype=np.complex128)
+    poles[0:2*m:2]=-Bet/div-1j*Bet
+    poles[1:2*m:2]=-Bet/div+1j*Bet
+    return poles
+
+def case1():
+    """Test 1: Scalar and artificial frequency domain function f(s)"""
+    N=101
+    s=2j*pi*np.logspace(0,4,N,dtype=np.complex128)
+    f=2/(s+5)+(30+40j)/(s-(-100+500j))+(30-40j)/(s-(-100-500j))+0.5
+    weights=np.ones(N,dtype=np.float64)
+    opts=VFOptions(asymp=3,spy2=False)
+    def run():
+        poles=-2*pi*np.logspace(0,4,3,dtype=np.complex128)
+        return vectfit(f,s,poles,weights,opts)[2]
+    return run
+
+def case2():
+    """Test 2: 18th order frequency response F(s) of two dimentions"""
+    w=2*pi*np.linspace(1,1e5,100,dtype=np.complex128)
+    s=1j*w
+    N=s.size
+    weights=np.ones(N,dtype=np.float64)
+    p=np.array([-4500,-41000,-100+5e3j,-100-5e3j,-120+15e3j,-120-15e3j,-3e3+35e3j,-3e3-35e3j,-200+45e3j,-200-45e3j,
+                -1500+45e3j,-1500-45e3j,-5e2+70e3j,-5e2-70e3j,-1e3+73e3j,-1e3-73e3j,-2e3+90e3j,-2e3-90e3j])*2*pi
+    r=np.array([-3000,-83000,-5+7e3j,-5-7e3j,-20+18e3j,-20-18e3j,6e3+45e3j,6e3-45e3j,40+60e3j,40-60e3j,
+                90+10e3j,90-10e3j,5e4+80e3j,5e4-80e3j,1e3+45e3j,1e3-45e3j,-5e3+92e3j,-5e3-92e3j])*2*pi
+    D=0.2; E=2e-5
+    F=np.zeros((2,N),dtype=np.complex128)
+    F[0,:]=np.sum(r[:10]/(s[:,None]-p[:10]),axis=1)+s*E+3*D
+    F[1,:]=np.sum(r[8:]/(s[:,None]-p[8:]),axis=1)+s*3*E
+    opts=VFOptions(asymp=3,cmplx_ss=False,spy2=False)
+    def run():
+        poles=complexPoles(w[0].real,w[N-1].real,18)
+        return vectfit_iterate(F,s,poles,weights,opts,Niter=3)[2]
+    return run
+
+def case3():
+    """Test 3: Escalar measured response of a transformer (TRANSF_DATA.csv)"""
+    Mdata=pd.read_csv(os.path.join(DATA_DIR,"TRANSF_DATA.csv")).to_numpy()
+    f=Mdata[:160,0]*np.exp(1j*Mdata[:160,1]*pi/180)
+    N=f.size
+    w=2*pi*np.linspace(0,10e6,401)[1:161]
+    s=1j*w
+    opts=VFOptions(asymp=3,spy2=False)
+    def run():
+        vectfit_iterate(f,s,complexPoles(w[0],w[N-1],6),np.ones(N,dtype=np.float64),opts,Niter=5)
+        return vectfit_iterate(f,s,complexPoles(w[0],w[N-1],30),1/np.abs(f),opts,Niter=5)[2]
+    return run
+
+def case4():
+    """Test 4: Elementwise approximation of a 6x6 admitance matrix (SYSADMITANCE_DATA.csv)"""
+    Mdata=np.ravel(pd.read_csv(os.path.join(DATA_DIR,"SYSADMITANCE_DATA.csv")).to_numpy())
+    N=int(Mdata[0])
+    blocks=np.reshape(Mdata[1:1+73*N],(N,73)) # frequency followed by the real and imaginary parts of Y(s) in RMO
+    s=1j*blocks[:,0]
+    Ysys=np.reshape(blocks[:,1::2]+1j*blocks[:,2::2],(N,6,6))
+    cols,rows=np.triu_indices(6) # lower triangular submatrix in CMO
+    F=np.ascontiguousarray(Ysys[:,rows,cols].T)
+    weights=1/np.sqrt(np.abs(F))
+    w=s.imag
+    g=np.sum(F[0:6,:]/np.linalg.norm(F[0:6,:],axis=1)[:,None],axis=0)
+    opts=VFOptions(asymp=3,spy2=False,symm_mat=True,cmplx_ss=True)
+    def run():
+        poles=vectfit_iterate(g,s,complexPoles(w[0],w[N-1],50),1/np.abs(g),opts,Niter=5)[1]
+        return vectfit_iterate(F,s,poles,weights,opts,Niter=3)[2]
+    return run
+
+def case5():
+    """Test 5: Elementwise approximation of a 3x3 propagation matrix of an aerial transmission line (MODEH_DATA.csv)"""
+    Hdata=pd.read_csv(os.path.join(DATA_DIR,"MODEH_DATA.csv"))
+    w=np.ravel(Hdata.loc[:,"OMEGA"].to_numpy())
+    s=1j*w
+    N=w.size
+    values=Hdata.iloc[:,2:20].to_numpy()
+    F=np.ascontiguousarray((values[:,0::2]+1j*values[:,1::2]).T) # elements in RMO
+    trH=F[0]+F[4]+F[8]
+    weights=np.ones(N,dtype=np.float64)
+    opts=VFOptions(asymp=1,spy2=False,cmplx_ss=True)
+    def run():
+        poles=vectfit_iterate(trH,s,complexPoles(w[0],w[N-1],35,log=True),weights,opts,Niter=10)[1]
+        return vectfit_iterate(F,s,poles,weights,opts,Niter=10)[2]
+    return run
+
+CASES={"1":case1,"2":case2,"3":case3,"4":case4,"5":case5}
+
+### -------------------------------------------------------------- Measurement --------------------------------------------------------------- ###
+
+def measure(run,repeat):
+    """Function to measure a test case: best wall time of repeat runs, then peak of traced memory and per-stage profile
+       of two separate runs, since tracemalloc slows numpy allocations down and VFStats resets the traced peak at each
+       stage.
+        *Returns a dictionary with the results"""
+    times=[]
+    for k in range(repeat):
+        t0=time.perf_counter()
+        rmserr=run()
+        times.append(time.perf_counter()-t0)
+    tracemalloc.start()
+    run()
+    peak=tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    stats=VFStats(memory=True)
+    with stats:
+        run()
+    return dict(time=min(times),peak_bytes=peak,rmserr=float(rmserr),stages=stats.stages)
+
+def compare(results,baseline,time_tol,mem_tol,rms_tol):
+    """Function to compare the results against the baseline. A case regresses when its time or peak memory grow by more
+       than the relative tolerances time_tol (and 5 ms) and mem_tol, or when its rmserr grows by more than rms_tol (relative) and 1e-12.
+        *Returns a list of messages with the regressions found"""
+    regressions=[]
+    print("\n%-6s %10s %10s %8s %12s %12s %8s %12s %12s"%("case","time [s]","base","ratio","peak [MB]","base","ratio","rmserr","base"))
+    for name,res in results.items():
+        base=baseline.get(name)
+        if base is None:
+            print("%-6s %10.4f %10s %8s %12.2f %12s %8s %12.4e %12s"%(name,res["time"],"-","-",res["peak_bytes"]/2**20,"-","-",res["rmserr"],"-"))
+            continue
+        tratio=res["time"]/base["time"]
+        mratio=res["peak_bytes"]/max(base["peak_bytes"],1)
+        print("%-6s %10.4f %10.4f %8.2f %12.2f %12.2f %8.2f %12.4e %12.4e"%(name,res["time"],base["time"],tratio,
+              res["peak_bytes"]/2**20,base["peak_bytes"]/2**20,mratio,res["rmserr"],base["rmserr"]))
+        # millisecond cases are dominated by timer noise, so differences under 5 ms are not regressions
+        if tratio>1+time_tol and res["time"]-base["time"]>5e-3:
+            regressions.append("case %s: time %.4f s is %.2f times the baseline"%(name,res["time"],tratio))
+        if mratio>1+mem_tol:
+            regressions.append("case %s: peak memory %.2f MB is %.2f times the baseline"%(name,res["peak_bytes"]/2**20,mratio))
+        # errors at rounding level (case 1) are compared with an absolute floor
+        if res["rmserr"]>base["rmserr"]*(1+rms_tol)+1e-12:
+            regressions.append("case %s: rmserr %.4e is above the baseline %.4e"%(name,res["rmserr"],base["rmserr"]))
+    return regressions
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description="Benchmark of vectfit3 on the test cases of vectfit_testing.py")
+    parser.add_argument("--cases",nargs="+",choices=sorted(CASES),default=sorted(CASES),help="test cases to run")
+    parser.add_argument("--repeat",type=int,default=5,help="runs per case, the best time is taken")
+    parser.add_argument("--baseline",default=BASELINE,help="JSON file of the baseline")
+    parser.add_argument("--save",action="store_true",help="store the results as the new baseline")
+    parser.add_argument("--stages",action="store_true",help="print the per-stage profile of each case")
+    parser.add_argument("--time-tol",type=float,default=0.25,help="relative tolerance for time regressions")
+    parser.add_argument("--mem-tol",type=float,default=0.10,help="relative tolerance for memory regressions")
+    parser.add_argument("--rms-tol",type=float,default=1e-3,help="relative tolerance for rmserr regressions")
+    args=parser.parse_args(argv)
+    results={}
+    for name in args.cases:
+        run=CASES[name]()
+        print("Case %s: %s"%(name,CASES[name].__doc__))
+        results[name]=measure(run,args.repeat)
+        if args.stages:
+            stats=VFStats(); stats.stages=results[name]["stages"]
+            print(stats)
+    if args.save:
+        with open(args.baseline,"w") as file:
+            json.dump(dict(machine=platform.platform(),python=platform.python_version(),numpy=np.__version__,cases=results),
+                      file,indent=1)
+        print("\nBaseline saved to",args.baseline)
+        compare(results,{},args.time_tol,args.mem_tol,args.rms_tol)
+        return 0
+    baseline={}
+    if os.path.exists(args.baseline):
+        with open(args.baseline,"r") as file:
+            baseline=json.load(file)["cases"]
+    else:
+        print("\nNo baseline found at",args.baseline)
+    regressions=compare(results,baseline,args.time_tol,args.mem_tol,args.rms_tol)
+    if regressions:
+        print("\n *** Regressions found ***")
+        for message in regressions:
+            print("  ",message)
+        return 1
+    print("\n *** NO regressions found ***")
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main())
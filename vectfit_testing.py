@@ -1,6 +1,8 @@
 ### Sample code to test Vector Fitting algorthm implemented in Python by Sebastian Loaiza ###
 
 from vectfit3 import vectfit        # Vector Fitting algorithm imported from its external module vectfit3.py
+from vectfit3 import vectfit_iterate # Iterative application of vectfit with early stopping
+from vectfit3 import VFOptions       # Configuration of vector fitting passed in each call
 import numpy as np
 import pandas as pd
 from scipy.constants import pi
@@ -37,9 +39,9 @@ if test==1:
     print("\nInitial searching poles:\n",poles)
 
     # vector fitting configuration
-    from vectfit3 import opts
-    opts["asymp"]=3        # Modified to include D and E in fitting
-    opts["phaseplot"]=True # Modified to include the phase angle graph
+    opts=VFOptions(
+        asymp=3,        # Modified to include D and E in fitting
+        phaseplot=True) # Modified to include the phase angle graph
     
     # Remaining options by default
 
@@ -105,23 +107,16 @@ elif test==2:
     print("\nInitial searching poles:\n",poles)
     
     # vector fitting configuration
-    from vectfit3 import opts
-    opts["asymp"]=3        # Modified to include D and E in fitting
-    opts["skip_res"]=True  # Modified to skip residue computation in the first iteration
-    opts["cmplx_ss"]=False # Modified to build a real-only state space model
-    opts["logx"]=False     # Modified to use linear axis for x
-    opts["spy2"]=False     # Modified to omit graphs generation into the iterative application of vectfit
-    opts["phaseplot"]=True # Modified to include the phase angle graph in the results
+    opts=VFOptions(
+        asymp=3,        # Modified to include D and E in fitting
+        cmplx_ss=False, # Modified to build a real-only state space model
+        logx=False,     # Modified to use linear axis for x
+        phaseplot=True) # Modified to include the phase angle graph in the results
     # Remaining options by default
     
-    print("\n * Applying 3 iterations of vector fitting...")
-    Niter=3
-    for itr in range(Niter):
-        if itr==Niter-1:
-            opts["skip_res"]=False #residue computation in final iteration
-            opts["spy2"]=True      #enabling graphs for the results
-        (SER,poles,rmserr,fit)=vectfit(F,s,poles,weights,opts)
-        print("     ...",itr+1," iterations applied")
+    print("\n * Applying up to 3 iterations of vector fitting...")
+    (SER,poles,rmserr,fit,Nitr)=vectfit_iterate(F,s,poles,weights,opts,Niter=3) #residues and graphs only for the final poles
+    print("     ...",Nitr," iterations applied")
     print(" v/ Fitting process completed. Aproximation error achieved = ",rmserr)
     print("\nFinal poles computed:\n",poles)
 
@@ -156,20 +151,15 @@ elif test==3:
     print("\nInitial searching poles:\n",poles)
 
     # vector fitting configuration
-    from vectfit3 import opts
-    opts["asymp"]=3        # Modified to include D and E in fitting
-    opts["logx"]=False     # Modified to use linear axis for x
-    opts["spy2"]=False     # Modified to omit graphs generation into the iterative application of vectfit
-    opts["phaseplot"]=True # Modified to include the phase angle graph in the results
+    opts=VFOptions(
+        asymp=3,        # Modified to include D and E in fitting
+        logx=False,     # Modified to use linear axis for x
+        phaseplot=True) # Modified to include the phase angle graph in the results
     # Remaining options by default
 
-    print("\n * Applying 5 iterations of vector fitting...")
-    Niter=5
-    for itr in range(Niter):
-        if itr==Niter-1:
-            opts["spy2"]=True      #enabling graphs for the results
-        (SER,poles,rmserr,fit)=vectfit(f,s,poles,weights,opts)
-        print("     ...",itr+1," iterations applied")
+    print("\n * Applying up to 5 iterations of vector fitting...")
+    (SER,poles,rmserr,fit,Nitr)=vectfit_iterate(f,s,poles,weights,opts,Niter=5)
+    print("     ...",Nitr," iterations applied")
     print(" v/ Fitting process completed. Aproximation error achieved = ",rmserr)
     print("\nFinal poles computed:\n",poles)
 
@@ -188,16 +178,11 @@ elif test==3:
     
     print("\nInitial searching poles:\n",poles)
 
-    opts["spy2"]=False     # Modified to omit graphs generation into the iterative application of vectfit
-    # Remaining options as configured before
+    # Options as configured before
 
-    print("\n * Applying 5 iterations of vector fitting...")
-    Niter=5
-    for itr in range(Niter):
-        if itr==Niter-1:
-            opts["spy2"]=True      #enabling graphs for the results
-        (SER,poles,rmserr,fit)=vectfit(f,s,poles,weights,opts)
-        print("     ...",itr+1," iterations applied")
+    print("\n * Applying up to 5 iterations of vector fitting...")
+    (SER,poles,rmserr,fit,Nitr)=vectfit_iterate(f,s,poles,weights,opts,Niter=5)
+    print("     ...",Nitr," iterations applied")
     print(" v/ Fitting process completed. Aproximation error achieved = ",rmserr)
     print("\nFinal poles computed:\n",poles)
     
@@ -245,7 +230,7 @@ elif test==4:
         poles[2*k]=alf-1j*Bet[k]
         poles[2*k+1]=alf+1j*Bet[k]
     
-    print("A better set of initial poles are obtained by fitting the weighted column sum of the first column of Y(s)\n * Applying 5 iterations of vector fitting...")
+    print("A better set of initial poles are obtained by fitting the weighted column sum of the first column of Y(s)\n * Applying up to 5 iterations of vector fitting...")
     # These weights are common for all column elements
     g=np.zeros(N, dtype=np.complex128)
     for k in range(6):
@@ -253,36 +238,26 @@ elif test==4:
     weights_g=1/np.abs(g)
   
     # vector fitting configuration
-    from vectfit3 import opts
-    opts["asymp"]=3         # Modified to include D and E in fitting
-    opts["logx"]=False      # Modified to use linear axis for x
-    opts["spy2"]=False      # Modified to omit graphs generation into the iterative application of vectfit
-    opts["phaseplot"]=True  # Modified to include the phase angle graph in the results
-    opts["skip_res"]=True   # Modified to skip residue computation during the iterative execution of vector fitting
-    opts["symm_mat"]=True   # Modified to indicate that F(s) samples belong to the symmetric matrix Y(s)
-    opts["cmplx_ss"]=True   # Modified to create a complex space-state model (Diagonal A)
+    opts=VFOptions(
+        asymp=3,        # Modified to include D and E in fitting
+        logx=False,     # Modified to use linear axis for x
+        spy2=False,     # Modified to omit graphs generation for the fitting of the weighted column sum
+        phaseplot=True, # Modified to include the phase angle graph in the results
+        symm_mat=True,  # Modified to indicate that F(s) samples belong to the symmetric matrix Y(s)
+        cmplx_ss=True)  # Modified to create a complex space-state model (Diagonal A)
     # Remaining options by default
     
-    print("\n * Applying 5 iterations of vector fitting...")
-    Niter=5 #number of iterations
-    for itr in range(Niter):
-        if itr==Niter-1:
-            opts["skip_res"]=False  #enabling residue computation in the final iteration
-        (_,poles,rmserr,_)=vectfit(g,s,poles,weights_g,opts)
-        print("     ...",itr+1," iterations applied")
+    print("\n * Applying up to 5 iterations of vector fitting...")
+    (_,poles,rmserr,_,Nitr)=vectfit_iterate(g,s,poles,weights_g,opts,Niter=5)
+    print("     ...",Nitr," iterations applied")
     print(" v/ Fitting process completed. Aproximation error achieved = ",rmserr)
     print("\nInitial poles computed from weighted column sum of Y(s):\n",poles)
     
     # Final fitting with new initial poles set and all elementos of Y(s) in F(s)
-    opts["skip_res"]=True  # Modified to skip residue computation during the iterative execution of vector fitting
+    opts=opts.replace(spy2=True) # Enabling graphs for the results
 
-    Niter=3 #number of iterations
-    for itr in range(Niter):
-        if itr==Niter-1:
-            opts["spy2"]=True       #enabling graphs for the results
-            opts["skip_res"]=False  #enabling residue computation in the final iteration
-        (SER,poles,rmserr,fit)=vectfit(F,s,poles,weights,opts)
-        print("     ...",itr+1," iterations applied")
+    (SER,poles,rmserr,fit,Nitr)=vectfit_iterate(F,s,poles,weights,opts,Niter=3)
+    print("     ...",Nitr," iterations applied")
     print(" v/ Fitting process completed. Aproximation error achieved = ",rmserr)
     print("\nFinal poles computed:\n",poles)
 
@@ -352,42 +327,31 @@ elif test==5:
         poles[2*k]=alf-1j*Bet[k]
         poles[2*k+1]=alf+1j*Bet[k]
     
-    print("A set of initial poles are obtained by fitting trace of Hi\n * Applying 10 iterations of vector fitting...")
+    print("A set of initial poles are obtained by fitting trace of Hi\n * Applying up to 10 iterations of vector fitting...")
     # Using H trace to identify initial poles:
     trH=np.zeros(N, dtype=np.complex128)
     for k in range(3):
        trH=trH+Hw[k,k,:]
     
     # vector fitting configuration
-    from vectfit3 import opts
-    opts["asymp"]=1         # Modified to omit D and E in fitting
-    opts["logy"]=False      # Modified to set y axis in logarithmic distribution
-    opts["spy2"]=False      # Modified to omit graphs generation into the iterative application of vectfit
-    opts["phaseplot"]=True  # Modified to include the phase angle graph in the results
-    opts["skip_res"]=True   # Modified to skip residue computation during the iterative execution of vector fitting
-    opts["cmplx_ss"]=True  # Modified to create a real space-state model
+    opts=VFOptions(
+        asymp=1,        # Modified to omit D and E in fitting
+        logy=False,     # Modified to set y axis in logarithmic distribution
+        spy2=False,     # Modified to omit graphs generation for the fitting of the trace of H(s)
+        phaseplot=True, # Modified to include the phase angle graph in the results
+        cmplx_ss=True)  # Modified to create a real space-state model
     # Remaining options by default
     
-    Niter=10 #number of iterations
-    for itr in range(Niter):
-        if itr==Niter-1:
-            #opts["spy2"]=True       #enabling graphs for the results
-            opts["skip_res"]=False  #enabling residue computation in the final iteration
-        (_,poles,rmserr,_)=vectfit(trH,s,poles,weights,opts)
-        print("     ...",itr+1," iterations applied")
+    (_,poles,rmserr,_,Nitr)=vectfit_iterate(trH,s,poles,weights,opts,Niter=10)
+    print("     ...",Nitr," iterations applied")
     print(" v/ Fitting process completed. Aproximation error achieved = ",rmserr)
     print("\nInitial poles computed from trace of H(s):\n",poles)
     
     # Final fitting with computed initial poles and all elementos of H(s) in F(s)
-    opts["skip_res"]=True  # Modified to skip residue computation during the iterative execution of vector fitting
+    opts=opts.replace(spy2=True) # Enabling graphs for the results
 
-    Niter=10 #number of iterations
-    for itr in range(Niter):
-        if itr==Niter-1:
-            opts["spy2"]=True       #enabling graphs for the results
-            opts["skip_res"]=False  #enabling residue computation in the final iteration
-        (SER,poles,rmserr,fit)=vectfit(F,s,poles,weights,opts)
-        print("     ...",itr+1," iterations applied")
+    (SER,poles,rmserr,fit,Nitr)=vectfit_iterate(F,s,poles,weights,opts,Niter=10)
+    print("     ...",Nitr," iterations applied")
     print(" v/ Fitting process completed. Aproximation error achieved = ",rmserr)
     print("\nFinal poles computed:\n",poles)
     
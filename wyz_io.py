@@ -1,81 +1,413 @@
 import xml.etree.ElementTree as ET
 import re
 import os
+import io
+import json
+import math
+import copy
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
+from vectfit3 import elementIndex, packMatrix, backendPool, dropPool
 
 
 def read_matrix_from_txt(file_path):
-    matrix_data = []
-    aaa = type(file_path)
-    # 打开文件读取
-    #with open(file_path, 'r') as file:
-    file_content = file_path.read()
-    # 将 bytes 解码为字符串
-    file_content_str = file_content.decode("utf-8")
-    for line in file_content_str.splitlines():
-        # 跳过以#或>开头的行以及空白行
-        if line.startswith('#') or line.startswith('>') or line.startswith('.')or line.strip() == '':
-            continue
-
-        # 处理数字行，转换为数字列表
-        values = line.strip().split()
-        matrix_data.append([float(v) for v in values])
-
-    # 将列表转换为NumPy数组（矩阵）
-    matrix = np.array(matrix_data)
+    # 支持上传的文件对象（read()返回bytes）以及文件路径
+    if hasattr(file_path, 'read'):
+        file_content = file_path.read()
+    else:
+        with open(file_path, 'rb') as file:
+            file_content = file.read()
+    if isinstance(file_content, str):
+        file_content = file_content.encode("utf-8")
+    # 跳过以#、>或.开头的行以及空白行，不解码为字符串也不逐个调用float()
+    numeric_lines = [line for line in file_content.splitlines()
+                     if line.strip() and not line.startswith((b'#', b'>', b'.'))]
+    # 数字块一次性转换，只读取频率列(0)和实部、虚部列(3, 4)
+    matrix = np.loadtxt(io.BytesIO(b"\n".join(numeric_lines)), usecols=(0, 3, 4), ndmin=2)
     ####下面将其转化为方阵
-    [num_row, num_coloum] = matrix.shape
-    #####参数检测
+    num_row = matrix.shape[0]
+    #####参数检测：行数必须是完全平方数
+    size_mat = math.isqrt(num_row)
+    if size_mat * size_mat != num_row or num_row == 0:
+        raise ValueError(f"ZTM数据行数 {num_row} 不是完全平方数，无法转换为方阵")
+    matrix_complex = (matrix[:, 1] + matrix[:, 2] * 1J).reshape((size_mat, size_mat))
+    # 同一文件中所有行的频率相同，取第一行
+    return matrix_complex, float(matrix[0, 0])
 
-    #####
-    size_mat = int(np.sqrt(num_row))
-    data_real = matrix[:, 3]
-    data_imag = matrix[:, 4]
-    mat_real = data_real.reshape((size_mat,size_mat))
-    mat_imag = data_imag.reshape((size_mat, size_mat))
-    matrix_complex = mat_real+mat_imag*1J
 
-    frequecy_array = matrix[:, 0]
-    frequecy_set = set(frequecy_array)
-    return matrix_complex, list(frequecy_set)[0]
+def iter_ztm_config(xml_file_pathname):
+    """逐步解析ZTM配置XML，每读完一个含<Filename>的节点就给出 (frequency, unit, filename)。
+
+    frequency 和 unit 取自同一节点下的 <name>Frequency [单位]</name> 和 <value>，没有时为 None。
+    已处理的节点从树中删除，内存与XML大小无关。
+    """
+    # 正则表达式：匹配 Frequency 后跟任意单位（例如 MHz, GHz 或其他）
+    pattern = re.compile(r"Frequency \[(.*?)\]")
+    parents = []
+    for event, elem in ET.iterparse(xml_file_pathname, events=("start", "end")):
+        if event == "start":
+            parents.append(elem)
+            continue
+        parents.pop()
+        file_node = elem.find("Filename")
+        if file_node is None or not file_node.text:
+            continue
+        frequency = unit = None
+        name_node, value_node = elem.find("name"), elem.find("value")
+        match = pattern.match(name_node.text or "") if name_node is not None else None
+        if match and value_node is not None:
+            unit, frequency = match.group(1), float(value_node.text)
+        yield frequency, unit, file_node.text.strip()
+        # 删除已处理的节点
+        elem.clear()
+        if parents:
+            parents[-1].remove(elem)
 
 
-def read_ztm_data(xml_file_pathname):
+def read_ztm_data(xml_file_pathname, workers=0, backend="process", out_file=None):
+    """读取ZTM配置XML及其列出的所有ZTM文件，返回按频率排序的 (Z_fnn_matrix, frequencies)。
 
+    XML逐步解析，每读到一个<Filename>就提交给并行池读取矩阵文件，不必等XML读完。
+    XML读完后按频率分配张量（out_file 给出时为内存映射文件），已读完的矩阵直接写入对应位置。
+    workers, backend 与 load_ztm_files 相同。
+    """
     # 分离路径和文件名
     file_path = os.path.dirname(xml_file_pathname)
-    file_name = os.path.basename(xml_file_pathname)
-    tree = ET.parse(xml_file_pathname)
-    root = tree.getroot()
-    wyz = root.findall(".//Filename")
+    workers = workers or os.cpu_count() or 1
+    # 并行池与 vectfit3 共用并常驻（vectfit3.backendPool），页面每次重新运行时不再创建新的进程池
+    shared = not (backend == "serial" or workers == 1)
+    pool = backendPool(backend, workers) if shared else ThreadPoolExecutor(max_workers=1)
+    pending = {}
+    try:
+        for frequency, unit, file_name in iter_ztm_config(xml_file_pathname):
+            ztm_file = os.path.join(file_path, file_name)
+            # XML没有频率时只读取文件第一行
+            pending[pool.submit(read_ztm_source, ztm_file)] = (read_ztm_frequency(ztm_file) if frequency is None
+                                                               else frequency)
+        if len(pending) == 0:
+            raise ValueError("XML中没有ZTM文件")
+        # 按频率排序后的位置；结果写入张量后即从 pending 中删除并释放
+        slots = np.argsort(list(pending.values()), kind="stable").argsort()
+        pending = {future: int(slot) for future, slot in zip(pending, slots)}
+        frequencies = np.empty(len(pending))
+        Z_fnn_matrix = None
+        for future in as_completed(list(pending)):
+            matrix, freq = future.result()
+            if Z_fnn_matrix is None:
+                size_mat = matrix.shape[0]
+                shape = (frequencies.size, size_mat, size_mat)
+                if out_file is None:
+                    Z_fnn_matrix = np.empty(shape, dtype=np.complex128)
+                else:
+                    Z_fnn_matrix = np.lib.format.open_memmap(out_file, mode="w+", dtype=np.complex128, shape=shape)
+            elif matrix.shape != (size_mat, size_mat):
+                raise ValueError(f"频率 {freq} 的矩阵为 {matrix.shape[0]} 端口，与其他文件的 {size_mat} 端口不一致")
+            slot = pending.pop(future)
+            Z_fnn_matrix[slot] = matrix
+            frequencies[slot] = freq
+    except BrokenProcessPool:
+        dropPool(backend, workers)
+        raise
+    finally:
+        # 共用的池不关闭，只取消本次还没有开始的读取
+        for future in pending:
+            future.cancel()
+        if not shared:
+            pool.shutdown()
+    return Z_fnn_matrix, frequencies
 
-    # 查找所有 <name> 节点
-    name_nodes = root.findall(".//name")
 
-    # 正则表达式：匹配 Frequency 后跟任意单位（例如 MHz, GHz 或其他）
-    pattern = re.compile(r"Frequency \[(.*?)\]")
+def read_ztm_frequency(source):
+    # 只读取第一行数字的频率，不解析整个文件
+    file = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else io.BytesIO(source)
+    with file:
+        for line in file:
+            if line.strip() and not line.startswith((b'#', b'>', b'.')):
+                return float(line.split()[0])
+    raise ValueError("ZTM文件中没有数据行")
+
+
+def read_ztm_unit(source, default="MHz"):
+    # 频率单位：数据行之前的注释行中的 "Frequency [单位]"，没有时为 default（ZTM文件通常为MHz）
+    file = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else io.BytesIO(source)
+    pattern = re.compile(rb"Frequency\s*\[\s*([kMG]?Hz)\s*\]", re.IGNORECASE)
+    with file:
+        for line in file:
+            if line.strip() and not line.startswith((b'#', b'>', b'.')):
+                break
+            match = pattern.search(line)
+            if match:
+                unit = match.group(1).decode()
+                return next(name for name in FREQUENCY_UNITS if name.lower() == unit.lower())
+    return default
+
+
+def read_ztm_source(source):
+    # 进程池的工作函数：source为文件路径或文件内容(bytes)
+    return read_matrix_from_txt(source if isinstance(source, (str, os.PathLike)) else io.BytesIO(source))
+
+
+def load_ztm_files(sources, workers=0, backend="process", out_file=None):
+    """并行读取多个ZTM文件，得到按频率排序的Z[f, n, n]。
+
+    sources: 文件路径或上传文件（read()返回bytes）的列表
+    workers: 并行数，0表示使用全部CPU核
+    backend: "process"（解析受GIL限制，多进程随核数扩展）、"thread"或"serial"
+             并行池与 vectfit3 共用（vectfit3.backendPool），多次调用之间保持，不重复创建
+    out_file: 给出时张量直接写入该.npy文件的内存映射，数据可以大于内存
+
+    先读取每个文件第一行的频率并排序，再把每个矩阵直接写入预分配张量中对应的位置，
+    内存峰值只有一份数据（加上正在读取的文件）。
+    返回 (Z_fnn_matrix, frequencies)
+    """
+    # 上传文件先取出内容，路径则由工作进程自己读取
+    sources = [source.read() if hasattr(source, 'read') else source for source in sources]
+    if len(sources) == 0:
+        raise ValueError("没有ZTM文件")
+    frequencies = np.array([read_ztm_frequency(source) for source in sources])
+    order = np.argsort(frequencies, kind="stable")
+    frequencies = frequencies[order]
+    sources = [sources[k] for k in order]
+    # 第一个文件确定端口数并分配张量
+    first, _ = read_ztm_source(sources[0])
+    size_mat = first.shape[0]
+    shape = (len(sources), size_mat, size_mat)
+    if out_file is None:
+        Z_fnn_matrix = np.empty(shape, dtype=np.complex128)
+    else:
+        Z_fnn_matrix = np.lib.format.open_memmap(out_file, mode="w+", dtype=np.complex128, shape=shape)
+    Z_fnn_matrix[0] = first
+    workers = workers or os.cpu_count() or 1
+    if backend == "serial" or workers == 1 or len(sources) <= 2:
+        results = map(read_ztm_source, sources[1:])
+    else:
+        results = backendPool(backend, workers).map(read_ztm_source, sources[1:],
+                                                    chunksize=max(1, (len(sources) - 1) // (4 * workers)))
+    try:
+        for slot, (matrix, freq) in enumerate(results, start=1):
+            if matrix.shape != (size_mat, size_mat):
+                raise ValueError(f"频率 {freq} 的矩阵为 {matrix.shape[0]} 端口，与其他文件的 {size_mat} 端口不一致")
+            Z_fnn_matrix[slot] = matrix
+    except BrokenProcessPool:
+        dropPool(backend, workers)
+        raise
+    finally:
+        # 共用的池不关闭；提前退出时关闭结果迭代器，取消本次还没有开始的读取
+        if hasattr(results, "close"):
+            results.close()
+    return Z_fnn_matrix, frequencies
+
+DATASET_CACHE_DIR = ".dataset_cache"
+# 缓存格式版本：解析结果或JSON头的格式改变时加1，旧的缓存不再命中
+DATASET_CACHE_VERSION = 2
+
+
+def content_key(contents, kind, parser=""):
+    # 按输入字节内容计算缓存键：每个文件单独求摘要后排序，与上传顺序无关
+    # 数据类型、解析器和缓存格式版本也计入键，同样的字节用不同方式解析时不会互相命中
+    # sha256在有硬件加速的CPU上比blake2b更快
+    digests = sorted(hashlib.sha256(content).digest() for content in contents)
+    prefix = f"{kind}\0{parser}\0{DATASET_CACHE_VERSION}\0".encode()
+    return hashlib.sha256(prefix + b"".join(digests)).hexdigest()
+
+
+def cache_read(key, kind, cache_dir=DATASET_CACHE_DIR):
+    # 命中时返回 (内存映射的数组, JSON头)，否则返回 None；JSON头的类型不是 kind 时当作未命中
+    header_file = os.path.join(cache_dir, key + ".json")
+    try:
+        with open(header_file, "r") as file:
+            header = json.load(file)
+        if header.get("kind") != kind:
+            return None
+        return np.load(os.path.join(cache_dir, key + ".npy"), mmap_mode="r"), header
+    except (OSError, ValueError):
+        return None
+
+
+def cache_write(key, array, header, cache_dir=DATASET_CACHE_DIR):
+    # 先写数组再写JSON头，都通过临时文件替换，中断的写入不会被当作命中
+    # 每次写入使用唯一的临时文件名，多个会话（线程或进程）同时写同一个键也不会冲突
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as file:
+        np.save(file, array)
+    os.replace(tmp, os.path.join(cache_dir, key + ".npy"))
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as file:
+        json.dump(header, file)
+    os.replace(tmp, os.path.join(cache_dir, key + ".json"))
+
+
+def load_ztm_cached(sources, cache_dir=DATASET_CACHE_DIR, workers=0, backend="process"):
+    """与 load_ztm_files 相同，但解析结果按输入字节的哈希缓存为二进制文件。
+
+    再次打开同一组文件时直接内存映射缓存的Z张量，不再解析文本。
+    返回 (Z_fnn_matrix, frequencies)，命中时 Z_fnn_matrix 为只读的 numpy.memmap
+    """
+    contents = []
+    for source in sources:
+        if hasattr(source, 'read'):
+            contents.append(source.read())
+        else:
+            with open(source, 'rb') as file:
+                contents.append(file.read())
+    key = content_key(contents, "ztm", "read_matrix_from_txt")
+    cached = cache_read(key, "ztm", cache_dir)
+    if cached is not None:
+        Z_fnn_matrix, header = cached
+        return Z_fnn_matrix, np.array(header["frequencies"])
+    Z_fnn_matrix, frequencies = load_ztm_files(contents, workers, backend)
+    cache_write(key, Z_fnn_matrix, dict(kind="ztm", files=len(contents), ports=Z_fnn_matrix.shape[1], parameter="Z",
+                                        unit=read_ztm_unit(contents[0]), frequencies=frequencies.tolist()), cache_dir)
+    return Z_fnn_matrix, frequencies
+
+
+def load_array_cached(content, parse, cache_dir=DATASET_CACHE_DIR, version=0):
+    # 任意文本数据的缓存：content为文件字节，parse(content)返回numpy数组，命中时返回只读的numpy.memmap
+    # 解析器的名称和 version 计入缓存键，修改 parse 的结果时应增加 version
+    parser = f"{getattr(parse, '__module__', '')}.{getattr(parse, '__qualname__', repr(parse))}:{version}"
+    key = content_key([content], "array", parser)
+    cached = cache_read(key, "array", cache_dir)
+    if cached is not None:
+        return cached[0]
+    array = np.asarray(parse(content))
+    cache_write(key, array, dict(kind="array", shape=list(array.shape)), cache_dir)
+    return array
+
+
+FREQUENCY_UNITS = {"Hz": 1.0, "kHz": 1e3, "MHz": 1e6, "GHz": 1e9}
+
+
+class TensorStore:
+    """内存映射的 Z/Y/S 参数张量 [f, n, n]，用于内存放不下的多端口模型。
+
+    数据保存在 <path>.npy，JSON头 <path>.json 保存频率、单位和参数类型，与 load_ztm_cached 的缓存文件格式相同，
+    所以缓存的数据集可以直接打开：TensorStore(os.path.join(DATASET_CACHE_DIR, key))。
+    select() 按频率范围和端口子集得到视图，不复制数据；matrices()、chunks() 和 element_rows() 按块读取，
+    chunks() 可直接作为 vectfit3.vectfit_stream() 的数据源。
+    """
+
+    def __init__(self, path, mode="r"):
+        with open(path + ".json", "r") as file:
+            self.header = json.load(file)
+        self.path = path
+        self.data = np.load(path + ".npy", mmap_mode=mode)
+        self.parameter = self.header.get("parameter", "Z")
+        self.unit = self.header.get("unit", "MHz")
+        self.z0 = self.header.get("z0", 50.0)
+        self.all_frequencies = np.array(self.header["frequencies"])
+        self.frequency_slice = slice(0, self.data.shape[0])
+        self.port_index = None
+
+    @classmethod
+    def create(cls, path, frequencies, ports, parameter="Z", unit="MHz", z0=50.0):
+        # 新建空的张量文件，返回可写的 TensorStore
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        np.lib.format.open_memmap(path + ".npy", mode="w+", dtype=np.complex128,
+                                  shape=(frequencies.size, ports, ports)).flush()
+        cls.write_header(path, frequencies, ports, parameter, unit, z0)
+        return cls(path, mode="r+")
+
+    @classmethod
+    def from_ztm(cls, path, sources, workers=0, backend="process"):
+        # 并行读取ZTM文件（路径），矩阵直接写入内存映射文件
+        Z_fnn_matrix, frequencies = load_ztm_files(sources, workers, backend, out_file=path + ".npy")
+        Z_fnn_matrix.flush()
+        cls.write_header(path, frequencies, Z_fnn_matrix.shape[1], "Z", read_ztm_unit(sources[0]), 50.0)
+        return cls(path)
+
+    @staticmethod
+    def write_header(path, frequencies, ports, parameter, unit, z0):
+        with open(path + ".json", "w") as file:
+            json.dump(dict(kind="store", ports=int(ports), parameter=parameter, unit=unit, z0=z0,
+                           frequencies=np.asarray(frequencies).tolist()), file)
+
+    @property
+    def frequencies(self):
+        return self.all_frequencies[self.frequency_slice]
+
+    @property
+    def ports(self):
+        return self.data.shape[1] if self.port_index is None else self.port_index.size
+
+    @property
+    def shape(self):
+        return (self.frequencies.size, self.ports, self.ports)
+
+    def s(self):
+        # 复频率 s = j*2*pi*f [rad/s]
+        return 2j * np.pi * self.frequencies * FREQUENCY_UNITS[self.unit]
+
+    def select(self, fmin=None, fmax=None, ports=None):
+        # 频率范围 [fmin, fmax]（与文件单位相同）和端口子集（从0开始的序号）的视图
+        view = copy.copy(self)
+        f = self.frequencies
+        k0 = np.searchsorted(f, -np.inf if fmin is None else fmin, side="left")
+        k1 = np.searchsorted(f, np.inf if fmax is None else fmax, side="right")
+        start = self.frequency_slice.start
+        view.frequency_slice = slice(start + k0, start + k1)
+        if ports is not None:
+            ports = np.asarray(ports, dtype=np.intp)
+            view.port_index = ports if self.port_index is None else self.port_index[ports]
+        return view
+
+    def matrices(self, k0=0, k1=None):
+        # 读取所选频率中第 k0 到 k1 个频率点的矩阵 [k1-k0, ports, ports]
+        k1 = self.shape[0] if k1 is None else min(k1, self.shape[0])
+        start = self.frequency_slice.start
+        block = self.data[start + k0:start + k1]
+        if self.port_index is not None:
+            block = block[:, self.port_index[:, None], self.port_index[None, :]]
+        return np.asarray(block)
+
+    def chunks(self, size=64, symm_mat=False, weights=None):
+        # vectfit_stream() 的数据源：按频率分块的 (s, F, weights)，F 按 vectfit3.packMatrix() 展平
+        s = self.s()
+        def generator():
+            for k0 in range(0, s.size, size):
+                k1 = min(k0 + size, s.size)
+                F = packMatrix(self.matrices(k0, k1), symm_mat)
+                weig = np.ones(k1 - k0) if weights is None else weights[..., k0:k1]
+                yield s[k0:k1], F, weig
+        return generator
+
+    def element_rows(self, block=64, symm_mat=False):
+        # 逐块给出元素行 F[k0:k1, :]（所有频率），内存只占 block 个元素
+        ports = self.ports
+        Nc = ports * (ports + 1) // 2 if symm_mat else ports * ports
+        (_, rows, cols) = elementIndex(Nc, symm_mat, True)
+        if self.port_index is not None:
+            rows, cols = self.port_index[rows], self.port_index[cols]
+        data = self.data[self.frequency_slice]
+        for k0 in range(0, Nc, block):
+            k1 = min(k0 + block, Nc)
+            yield k0, k1, np.ascontiguousarray(data[:, rows[k0:k1], cols[k0:k1]].T)
+
+    def convert(self, path, parameter, size=64):
+        # 按频率分块转换为 Z、Y 或 S 参数（参考阻抗 z0），写入新的 TensorStore
+        out = TensorStore.create(path, self.frequencies, self.ports, parameter, self.unit, self.z0)
+        I = np.eye(self.ports)
+        for k0 in range(0, self.shape[0], size):
+            block = self.matrices(k0, k0 + size)
+            # 先转换为 Z，再转换为目标参数
+            if self.parameter == "Y":
+                block = np.linalg.inv(block)
+            elif self.parameter == "S":
+                block = self.z0 * np.linalg.solve(I - block, I + block)
+            if parameter == "Y":
+                block = np.linalg.inv(block)
+            elif parameter == "S":
+                block = np.linalg.solve(block + self.z0 * I, block - self.z0 * I)
+            out.data[k0:k0 + block.shape[0]] = block
+        out.data.flush()
+        return out
 
-    # 匹配节点文本
-    for name_node in name_nodes:
-        match = pattern.match(name_node.text)
-        if match:
-            print(f"Found {name_node.text} with unit: {match.group(1)}")
-
-            # 获取关联的 <value> 节点
-            value_node = name_node.find("./../value")  # 获取父节点的 <value> 节点
-            if value_node is not None:
-                print(f"  Value: {value_node.text}")
-
-    Z_fnn_list = []
-    for file in wyz:
-        ztm_file = os.path.join(file_path, file.text)
-        kk = read_matrix_from_txt(ztm_file)
-        Z_fnn_list.append(kk)
-    Z_fnn_matrix = np.stack(Z_fnn_list, axis=0)
-    return Z_fnn_matrix
 
 if __name__ == '__main__':
     xml_file_pathname = "E:\公司工作（低空防御）\场路仿真\场路转换算法\Composite_ZCM_3\Composite_ZCM_Configuration.xml"
-    result_data = read_ztm_data(xml_file_pathname)
+    result_data, frequencies = read_ztm_data(xml_file_pathname)
     wyz1111 = 1111
 